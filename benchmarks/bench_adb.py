@@ -0,0 +1,211 @@
+"""
+Measure device listing, package listing and action throughput against fake devices.
+
+    python benchmarks/bench_adb.py --command-latency 10 --jitter 0.2 --output results.json
+    python benchmarks/bench_adb.py --baseline results.json
+
+The fake adb server (src/fake_adb_server.py) adds latency to every request and to every
+command a device runs, and can fail package changes at a given rate. Shell sessions and
+CommandManager spawn the fake adb executable (src/fake_adb.py) found first on the PATH.
+Scenarios:
+
+- list_devices: DeviceManager.list_devices over the adb server protocol
+- list_devices_subprocess: the same through CommandManager and the adb executable
+- list_packages: PackageManager.get_installed_packages of a device with --packages packages
+- apply_1_device: --actions actions on one device through FleetManager
+- apply_30_devices: the same actions on --devices devices at once
+
+Every scenario starts from fresh devices. The first run pays for starting the shell
+sessions and is reported apart. Results are printed as JSON, times in milliseconds.
+With --baseline, the change of every median against an earlier result file is added and
+the exit code is 1 when one grew by more than --threshold percent.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.adb_client import Adb, AdbClient  # noqa: E402
+from src.db import db_manager  # noqa: E402
+from src.device_manager import DeviceManager  # noqa: E402
+from src.fake_adb import write_executable  # noqa: E402
+from src.fake_adb_server import FakeAdbServer, FakeDevice, default_packages  # noqa: E402
+from src.fleet import FleetManager  # noqa: E402
+from src.package_cache import package_cache  # noqa: E402
+from src.pkg_manager import PackageManager  # noqa: E402
+from src.shell_session import shell_sessions  # noqa: E402
+
+SCENARIOS = [
+    "list_devices",
+    "list_devices_subprocess",
+    "list_packages",
+    "apply_1_device",
+    "apply_30_devices",
+]
+
+
+def fresh_devices(server: FakeAdbServer, args):
+    """Replace every device of the server with one in its initial state."""
+    server.devices = {
+        f"emulator-{5554 + 2 * i}": FakeDevice(
+            f"emulator-{5554 + 2 * i}",
+            packages=default_packages(args.packages),
+            failure_rate=args.failure_rate,
+            seed=args.seed + i,
+        )
+        for i in range(args.devices)
+    }
+
+
+def action_form(args) -> dict[str, str]:
+    # Every other package is disabled and the rest uninstalled, all of them user apps so
+    # none is skipped by the planner
+    names = [
+        name for name in default_packages(args.packages) if not name.startswith("com.android.")
+    ]
+    return {
+        f"action_{name}": "disable" if i % 2 else "uninstall"
+        for i, name in enumerate(names[: args.actions])
+    }
+
+
+async def scenario(name, server, args):
+    """:return: The coroutine function of one run, and the number of operations it does."""
+    serials = list(server.devices)
+    if name in ("list_devices", "list_devices_subprocess"):
+
+        async def run():
+            Adb.backend = "subprocess" if name == "list_devices_subprocess" else "native"
+            try:
+                assert len(await DeviceManager.list_devices()) == args.devices
+            finally:
+                Adb.backend = "native"
+
+        return run, args.devices
+    if name == "list_packages":
+
+        async def run():
+            package_cache.clear()
+            _, packages = await PackageManager.get_installed_packages(
+                refresh=True, serial_number=serials[0]
+            )
+            assert len(packages) == args.packages
+
+        return run, args.packages
+    form = action_form(args)
+    targets = serials[:1] if name == "apply_1_device" else serials
+
+    async def run():
+        reports = await FleetManager.apply_actions(targets, form)
+        run.failures = sum(len(report["failed"]) for report in reports.values())
+
+    return run, len(form) * len(targets)
+
+
+async def measure(server, args) -> dict:
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        timings, failures = [], 0
+        for _ in range(args.runs + 1):
+            fresh_devices(server, args)
+            run, operations = await scenario(name, server, args)
+            started = time.perf_counter()
+            await run()
+            timings.append(time.perf_counter() - started)
+            failures += getattr(run, "failures", 0)
+        median = statistics.median(timings[1:])
+        results[name] = {
+            "operations": operations,
+            "first_ms": round(timings[0] * 1e3, 1),
+            "median_ms": round(median * 1e3, 1),
+            "min_ms": round(min(timings[1:]) * 1e3, 1),
+            "max_ms": round(max(timings[1:]) * 1e3, 1),
+            "operations_per_s": round(operations / median, 1),
+            "failures": failures,
+        }
+        await shell_sessions.close_all()
+    return results
+
+
+async def bench(args) -> dict:
+    server = FakeAdbServer(
+        latency=args.latency / 1e3,
+        command_latency=args.command_latency / 1e3,
+        jitter=args.jitter,
+        seed=args.seed,
+    )
+    async with server:
+        os.environ["ANDROID_ADB_SERVER_PORT"] = str(server.port)
+        Adb.client = AdbClient(port=server.port)
+        Adb.backend = "native"
+        await db_manager.connect()
+        await db_manager.create_tables()
+        try:
+            return await measure(server, args)
+        finally:
+            await shell_sessions.close_all()
+            await db_manager.close()
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Add the change of every median against the baseline, returns the regressed scenarios."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not before["median_ms"]:
+            continue
+        change = round(100 * (result["median_ms"] / before["median_ms"] - 1), 1)
+        result["change_pct"] = change
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS)
+    parser.add_argument("--devices", type=int, default=30)
+    parser.add_argument("--packages", type=int, default=500)
+    parser.add_argument("--actions", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=1.0, help="ms per request")
+    parser.add_argument("--command-latency", type=float, default=5.0, help="ms per device command")
+    parser.add_argument("--jitter", type=float, default=0.2, help="share of every delay")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="result file to compare with")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression in percent")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["PATH"] = write_executable(directory) + os.pathsep + os.environ["PATH"]
+        results = asyncio.run(bench(args))
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+    config = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("scenario", "output", "baseline", "threshold")
+    }
+    output = json.dumps({"config": config, "results": results}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as result_file:
+            result_file.write(output + "\n")
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measure KnowledgeBase index build time and lookup latency on a synthetic knowledge base.
+
+    python benchmarks/bench_knowledge_base.py --entries 50000 --inventory 500
+
+Results are printed as JSON, latencies are the median of many runs in microseconds.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.knowledge_base import SAFETY_TIERS, KnowledgeBase  # noqa: E402
+
+VENDORS = ["com.android", "com.google.android", "com.samsung.android", "com.miui", "com.oppo"]
+
+
+def write_source(path: str, count: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    names = [f"{rng.choice(VENDORS)}.app{i}.module{i % 37}" for i in range(count)]
+    with open(path, "w", encoding="utf-8") as source:
+        source.write("package\tvendor\ttier\tdescription\trequired_by\n")
+        for name in names:
+            required_by = ",".join(rng.sample(names[:100], min(len(names), rng.randint(0, 2))))
+            tier = rng.choice(SAFETY_TIERS)
+            source.write(f"{name}\tVendor\t{tier}\tSynthetic entry for {name}\t{required_by}\n")
+    return names
+
+
+def measure(function, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--inventory", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "knowledge_base.tsv")
+        names = write_source(source, args.entries)
+        rng = random.Random(2)
+        # Half of a typical inventory is in the knowledge base
+        inventory = rng.sample(names, args.inventory // 2)
+        inventory += [f"org.unknown.app{i}" for i in range(args.inventory - len(inventory))]
+
+        started = time.perf_counter()
+        knowledge = KnowledgeBase(source, os.path.join(directory, "cache"))
+        knowledge.lookup("warm.up")
+        build_ms = round((time.perf_counter() - started) * 1e3, 1)
+        knowledge.close()
+
+        started = time.perf_counter()
+        knowledge = KnowledgeBase(source, os.path.join(directory, "cache"))
+        knowledge.lookup("warm.up")
+        open_ms = round((time.perf_counter() - started) * 1e3, 2)
+
+        def cold():
+            knowledge._entries.clear()
+            knowledge.lookup_many(inventory)
+
+        results = {
+            "index_build_ms": build_ms,
+            "index_open_ms": open_ms,
+            "lookup_many_cold_us": measure(cold, args.runs),
+            "lookup_many_cached_us": measure(lambda: knowledge.lookup_many(inventory), args.runs),
+            "matches": len(knowledge.lookup_many(inventory)),
+        }
+        knowledge.close()
+    print(
+        json.dumps(
+            {"entries": args.entries, "inventory": args.inventory, "results": results}, indent=2
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
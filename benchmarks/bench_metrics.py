@@ -0,0 +1,69 @@
+"""
+Measure what metrics cost: recording an adb command and a request, and rendering /metrics.
+
+    python benchmarks/bench_metrics.py --series 200 --output results.json
+
+Recording happens on every adb command and request whether or not /metrics is scraped,
+rendering only on a scrape. Results are printed as JSON, times in microseconds.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.metrics import (  # noqa: E402
+    CommandTimer,
+    adb_read_bytes,
+    http_request_duration,
+    registry,
+    shell_command_name,
+)
+
+
+def per_call(function, iterations: int) -> float:
+    """:return: The microseconds one call of the function takes."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return round((time.perf_counter() - started) / iterations * 1e6, 3)
+
+
+def record_command():
+    with CommandTimer(shell_command_name("pm disable-user --user 0 com.example"), "session", "s1"):
+        pass
+    adb_read_bytes.inc(("session",), 64)
+
+
+def record_request():
+    http_request_duration.observe(("GET", "/packages", "200"), 0.012)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--series", type=int, default=100, help="label combinations rendered")
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {
+        "record_command_us": per_call(record_command, args.iterations),
+        "record_request_us": per_call(record_request, args.iterations),
+    }
+    for i in range(args.series):
+        http_request_duration.observe(("GET", f"/route/{i}", "200"), i / 1e3)
+    output_bytes = len(registry.render())
+    results["render_us"] = per_call(registry.render, max(args.iterations // 1000, 10))
+    results["render_bytes"] = output_bytes
+    output = json.dumps({"config": vars(args), "results": results}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as result_file:
+            result_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
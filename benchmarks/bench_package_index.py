@@ -0,0 +1,91 @@
+"""
+Measure PackageIndex build time and query latency on a synthetic inventory.
+
+    python benchmarks/bench_package_index.py --packages 10000
+
+Results are printed as JSON, latencies are the median of many runs in microseconds.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.models import PackageInfo  # noqa: E402
+from src.package_index import PackageIndex  # noqa: E402
+
+VENDORS = [
+    "com.android",
+    "com.google.android",
+    "com.samsung.android",
+    "com.facebook",
+    "org.mozilla",
+]
+INSTALLERS = [None, "com.android.vending", "com.sec.android.app.samsungapps"]
+
+QUERIES = {
+    "first page": {},
+    "search": {"query": "goo"},
+    "search and facets": {"query": "goo app", "system": False, "enabled": True},
+    "name prefix": {"query": "com.samsung."},
+    "deep page": {"offset": 9000},
+    "deep page descending": {"offset": 5000, "descending": True},
+    "sorted by version": {"sort": "version_code"},
+    "sorted deep page with facet": {"sort": "version_code", "enabled": True, "offset": 7000},
+}
+
+
+def inventory(count: int, seed: int = 1) -> list[PackageInfo]:
+    rng = random.Random(seed)
+    return [
+        PackageInfo(
+            f"{rng.choice(VENDORS)}.app{i}.module{i % 37}",
+            uid=10000 + i,
+            version_code=rng.randint(1, 999),
+            enabled=rng.random() > 0.2,
+            installer=rng.choice(INSTALLERS),
+            system=rng.random() > 0.6,
+        )
+        for i in range(count)
+    ]
+
+
+def measure(function, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--packages", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=500)
+    args = parser.parse_args()
+
+    packages = inventory(args.packages)
+    started = time.perf_counter()
+    index = PackageIndex(packages)
+    build_ms = round((time.perf_counter() - started) * 1e3, 1)
+    results = {}
+    for name, query in QUERIES.items():
+        # The first run builds the sort order, which is kept for the life of the index
+        index.query(**query)
+        results[name] = {
+            "matches": index.query(**query).total,
+            "median_us": measure(lambda: index.query(**query), args.runs),
+        }
+    print(
+        json.dumps({"packages": args.packages, "build_ms": build_ms, "queries": results}, indent=2)
+    )
+
+
+if __name__ == "__main__":
+    main()
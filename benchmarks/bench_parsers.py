@@ -0,0 +1,97 @@
+"""
+Compare streaming and buffered parsing of a large ``dumpsys package`` capture.
+
+    python benchmarks/bench_parsers.py --size-mb 50
+
+Each mode runs in its own process so the peak RSS of one does not hide the other.
+Results are printed as JSON.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.fake_adb_server import FakeDevice  # noqa: E402
+from src.parsers import DumpsysPackageParser, iter_lines, parse  # noqa: E402
+
+CHUNK_SIZE = 1 << 16
+
+
+def write_capture(path: str, size_mb: int):
+    """Write a synthetic dumpsys capture of about size_mb megabytes."""
+    target = size_mb << 20
+    written, batch = 0, 0
+    with open(path, "w") as capture:
+        capture.write("Packages:\n")
+        while written < target:
+            device = FakeDevice(
+                "bench", packages=[f"com.bench.b{batch}.app{i}" for i in range(1000)]
+            )
+            # Drop the section header, only the first batch keeps it
+            block = device.dumpsys_package().split("\n", 1)[1]
+            capture.write(block)
+            written += len(block)
+            batch += 1
+
+
+def read_chunks(path: str):
+    with open(path) as capture:
+        while chunk := capture.read(CHUNK_SIZE):
+            yield chunk
+
+
+def run_mode(mode: str, path: str) -> dict:
+    started = time.perf_counter()
+    if mode == "streaming":
+        count = sum(1 for _ in parse(DumpsysPackageParser(), iter_lines(read_chunks(path))))
+    else:
+        # What the code did before: the whole output as one string, split into lines
+        output = "".join(read_chunks(path))
+        count = sum(1 for _ in parse(DumpsysPackageParser(), output.split("\n")))
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(path)
+    return {
+        "mode": mode,
+        "packages": count,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(size / (1 << 20) / elapsed, 1),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--mode", choices=["streaming", "buffered"], help=argparse.SUPPRESS)
+    parser.add_argument("--capture", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.capture)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dumpsys.txt")
+        write_capture(path, args.size_mb)
+        results = []
+        for mode in ("buffered", "streaming"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--capture", path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results.append(json.loads(output))
+    print(json.dumps({"capture_mb": args.size_mb, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Measure RuleSet compile time and classification latency on a synthetic rule set.
+
+    python benchmarks/bench_rules.py --rules 500 --inventory 500
+
+The combined matcher is compared with trying every rule in order of precedence.
+Results are printed as JSON, latencies are the median of many runs in microseconds.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.rules import RuleSet, _to_regex  # noqa: E402
+
+VENDORS = ["com.android", "com.google.android", "com.samsung.android", "com.miui", "com.oppo"]
+
+
+def write_rules(path: str, count: int, seed: int = 1):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as source:
+        for i in range(count):
+            vendor = rng.choice(VENDORS)
+            kind = rng.random()
+            if kind < 0.4:
+                pattern = f"{vendor}.app{i}.module{i % 37}"
+            elif kind < 0.9:
+                pattern = f"{vendor}.app{i}.*"
+            else:
+                pattern = rf"re:{re.escape(vendor)}\.app{i}\d*\..*"
+            source.write(f"{pattern}\t{rng.choice(['disable', 'uninstall', 'keep'])}\n")
+
+
+def inventory(count: int, seed: int = 2) -> list[str]:
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(VENDORS)}.app{rng.randint(0, 2 * count)}.module{i % 37}" for i in range(count)
+    ]
+
+
+def measure(function, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rules", type=int, default=500)
+    parser.add_argument("--inventory", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "rules.tsv")
+        write_rules(path, args.rules)
+        rules = RuleSet([path])
+        started = time.perf_counter()
+        rules.rules
+        compile_ms = round((time.perf_counter() - started) * 1e3, 2)
+
+    names = inventory(args.inventory)
+    # One compiled pattern per rule, tried in order of precedence
+    each = [(re.compile(_to_regex(rule)), rule) for rule in rules.rules]
+
+    def one_by_one():
+        return {
+            name: next((rule for pattern, rule in each if pattern.fullmatch(name)), None)
+            for name in names
+        }
+
+    expected = {name: rule for name, rule in one_by_one().items() if rule is not None}
+    assert rules.classify(names) == expected
+    results = {
+        "compile_ms": compile_ms,
+        "matches": len(expected),
+        "combined_us": measure(lambda: rules.classify(names), args.runs),
+        "one_by_one_us": measure(one_by_one, args.runs),
+    }
+    print(
+        json.dumps({"rules": args.rules, "inventory": args.inventory, "results": results}, indent=2)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Measure time to first byte and total time of the packages page, rendered whole or streamed.
+
+    python benchmarks/bench_templates.py --rows 1000,10000 --output results.json
+
+render is Template.render, what TemplateResponse does before sending anything, so its
+first byte comes with the last. stream joins the chunks of Template.generate into
+STREAM_CHUNK_SIZE pieces like stream_template, the first byte being the first piece.
+Times leave the network out. load compares getting packages.html (and base.html) in a
+new process: compiled from source, and loaded from the bytecode cache. Results are
+printed as JSON, times are medians in milliseconds.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from jinja2 import Environment, FileSystemLoader  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+from src.knowledge_base import knowledge_base  # noqa: E402
+from src.models import PackageInfo  # noqa: E402
+from src.package_index import PackageIndex  # noqa: E402
+from src.rules import rule_set  # noqa: E402
+from src.templating import (  # noqa: E402
+    STREAM_CHUNK_SIZE,
+    TemplateBytecodeCache,
+    _batches,
+    script_dir,
+    templates,
+)
+
+VENDORS = ["com.android", "com.google.android", "com.samsung.android", "com.facebook"]
+INSTALLERS = [None, "com.android.vending", "com.sec.android.app.samsungapps"]
+
+
+def page_context(rows: int, seed: int = 1) -> dict:
+    """:return: The context of a packages page of rows packages, built like the route does."""
+    rng = random.Random(seed)
+    packages = [
+        PackageInfo(
+            f"{rng.choice(VENDORS)}.app{i}",
+            uid=10000 + i,
+            version_code=rng.randint(1, 999),
+            enabled=rng.random() > 0.2,
+            installer=rng.choice(INSTALLERS),
+            system=rng.random() > 0.6,
+        )
+        for i in range(rows)
+    ]
+    index = PackageIndex(packages)
+    result = index.query(limit=rows)
+    request = Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/packages",
+            "query_string": f"per_page={rows}".encode(),
+            "headers": [],
+            "scheme": "http",
+            "server": ("localhost", 8000),
+        }
+    )
+    return {
+        "request": request,
+        "packages": result.packages,
+        "knowledge": knowledge_base.lookup_many(package.name for package in result.packages),
+        "rules": rule_set.classify(package.name for package in result.packages),
+        "result": result,
+        "installers": index.installers,
+        "filters": {"q": "", "kind": "", "state": "", "installer": None, "sort": "name"},
+        "devices": [],
+        "message": "",
+        "success": True,
+    }
+
+
+def render(template, context) -> tuple[float, float, int]:
+    started = time.perf_counter()
+    html = template.render(context)
+    total = time.perf_counter() - started
+    return total, total, len(html)
+
+
+def stream(template, context) -> tuple[float, float, int]:
+    started = time.perf_counter()
+    first, size = None, 0
+    for chunk in _batches(template.generate(context), STREAM_CHUNK_SIZE):
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(chunk)
+    return first, time.perf_counter() - started, size
+
+
+def load(cache) -> float:
+    environment = Environment(
+        loader=FileSystemLoader(os.path.join(script_dir, "templates")), bytecode_cache=cache
+    )
+    environment.globals.update(templates.env.globals)
+    started = time.perf_counter()
+    environment.get_template("packages.html")
+    environment.get_template("base.html")
+    return time.perf_counter() - started
+
+
+def milliseconds(values) -> float:
+    return round(statistics.median(values) * 1e3, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rows",
+        type=lambda value: [int(rows) for rows in value.split(",")],
+        default=[1000, 10000],
+        help="comma separated numbers of packages on the page",
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    template = templates.get_template("packages.html")
+    results = {}
+    for rows in args.rows:
+        context = page_context(rows)
+        result = {}
+        for name, run in (("render", render), ("stream", stream)):
+            timings = [run(template, context) for _ in range(args.runs)]
+            result[name] = {
+                "ttfb_ms": milliseconds(first for first, _, _ in timings),
+                "total_ms": milliseconds(total for _, total, _ in timings),
+                "bytes": timings[0][2],
+            }
+        results[f"{rows}_rows"] = result
+    with tempfile.TemporaryDirectory() as directory:
+        cache = TemplateBytecodeCache(directory)
+        load(cache)
+        results["load"] = {
+            "compile_ms": milliseconds(load(None) for _ in range(args.runs)),
+            "cached_ms": milliseconds(load(cache) for _ in range(args.runs)),
+        }
+    output = json.dumps({"config": vars(args), "results": results}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as result_file:
+            result_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,41 @@
 # -*- mode: python ; coding: utf-8 -*-
+# BLOATWARE_BUILD=onefile (default) packs everything into one executable, unpacked to a
+# temporary directory on every start. onedir leaves the unpacked tree in
+# dist/bloatware-remover/ so nothing is unpacked at start, and is not UPX compressed.
+# BLOATWARE_OPTIMIZE sets the bytecode optimization level (0 by default, 1 drops asserts;
+# 2 would drop the docstrings the command line help is built from).
+import os
 
+build = os.environ.get("BLOATWARE_BUILD", "onefile")
+onedir = build == "onedir"
 
 a = Analysis(
     ['src/main.py'],
     pathex=[],
     binaries=[],
-    datas=[('src/templates', 'src/templates')],
-    hiddenimports=[],
+    datas=[('src/templates', 'src/templates'), ('src/data', 'src/data')],
+    # Imported by main.main only once the command is known
+    hiddenimports=['src.app', 'src.loadtest', 'src.fake_adb'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
     excludes=[],
     noarchive=False,
-    optimize=0,
+    optimize=int(os.environ.get("BLOATWARE_OPTIMIZE", 0)),
 )
 pyz = PYZ(a.pure)
 
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
+    *([] if onedir else [a.binaries, a.datas]),
     [],
+    exclude_binaries=onedir,
     name='bloatware-remover',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=not onedir,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=True,
@@ -36,3 +45,13 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+if onedir:
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='bloatware-remover',
+    )
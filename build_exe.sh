@@ -1,9 +1,19 @@
 #!/bin/bash
 # Build script to create a standalone executable for bloatware-remove
 # Requires: pyinstaller
+#
+#   ./build_exe.sh            # one file, dist/bloatware-remover
+#   ./build_exe.sh --onedir   # a directory, dist/bloatware-remover/bloatware-remover,
+#                             # starting faster as nothing is unpacked on start
+#
+# The optimized variant drops asserts from the bundled bytecode: BLOATWARE_OPTIMIZE=1
 
 set -e
 
+if [ "$1" == "--onedir" ]; then
+    export BLOATWARE_BUILD=onedir
+fi
+
 # Ensure PyInstaller is installed
 if ! command -v pyinstaller &> /dev/null
 then
@@ -13,14 +23,10 @@ fi
 
 # Clean previous builds
 echo "Cleaning previous builds..."
-rm -rf build/ dist/ *.spec
+rm -rf build/ dist/
 
-# Build the executable
-echo "Building the executable..."
-pyinstaller \
---onefile src/main.py \
---name bloatware-remover \
---add-data "src/templates:src/templates"
+# Build the executable from bloatware-remover.spec, which bundles the templates and data
+echo "Building the executable (${BLOATWARE_BUILD:-onefile})..."
+pyinstaller --noconfirm bloatware-remover.spec
 
 echo "Build complete. The executable is in the dist/ directory."
-
@@ -0,0 +1,405 @@
+import asyncio
+import codecs
+import logging
+import os
+import struct
+import time
+
+from .cmd_manager import CommandManager, CommandResult
+from .exceptions import StreamInterrupted
+from .metrics import CommandTimer, adb_read_bytes, host_service_name, shell_command_name
+
+# Packet ids of the shell v2 protocol
+SHELL_STDIN = 0
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+SHELL_CLOSE_STDIN = 4
+# Bytes read at a time from legacy shell streams
+CHUNK_SIZE = 1 << 16
+
+
+class AdbProtocolError(Exception):
+    """Raised when the adb server answers a request with FAIL or breaks the protocol."""
+
+
+class AdbClient:
+    """
+    Speaks the adb host protocol to the local adb server directly, so no adb client
+    process has to be started for each operation.
+    Requests are a four digit hex length followed by the service name, answers start
+    with OKAY or FAIL.
+    """
+
+    logger = logging.getLogger(__name__)
+    connect_timeout = 2.0
+
+    def __init__(self, host="127.0.0.1", port=None):
+        self.host = host
+        self.port = port or int(os.environ.get("ANDROID_ADB_SERVER_PORT", 5037))
+        self._features = {}
+
+    async def connect(self):
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.connect_timeout
+        )
+
+    @staticmethod
+    async def send(reader, writer, service: str):
+        """
+        Send a service request and wait for the server to accept it.
+        :raises AdbProtocolError: If the server answers FAIL.
+        """
+        payload = service.encode()
+        writer.write(b"%04x" % len(payload) + payload)
+        await writer.drain()
+        status = await reader.readexactly(4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbProtocolError(await AdbClient.read_message(reader))
+        raise AdbProtocolError(f"Unexpected answer {status!r} to {service}")
+
+    @staticmethod
+    async def read_message(reader) -> str:
+        """Read one hex length prefixed message."""
+        length = int(await reader.readexactly(4), 16)
+        return (await reader.readexactly(length)).decode(errors="replace")
+
+    async def host_request(self, service: str) -> str:
+        """
+        Run a host service that answers with a single message, e.g. host:devices-l.
+        :param service: The host service to run.
+        :return: The message sent back by the server.
+        """
+        with CommandTimer(host_service_name(service), "server"):
+            reader, writer = await self.connect()
+            try:
+                await self.send(reader, writer, service)
+                message = await self.read_message(reader)
+            finally:
+                writer.close()
+        adb_read_bytes.inc(("server",), len(message))
+        return message
+
+    async def version(self) -> int:
+        return int(await self.host_request("host:version"), 16)
+
+    async def devices(self) -> str:
+        """List devices, the answer has the same lines as ``adb devices -l``."""
+        return await self.host_request("host:devices-l")
+
+    async def track_devices(self):
+        """
+        Follow the devices attached to the server. The server sends the whole list, in the
+        format of host:devices-l, right away and then again on every change.
+        :return: An async iterator of device lists, ending when the server goes away.
+        """
+        reader, writer = await self.connect()
+        try:
+            await self.send(reader, writer, "host:track-devices-l")
+            while True:
+                message = await self.read_message(reader)
+                adb_read_bytes.inc(("server",), len(message))
+                yield message
+        finally:
+            writer.close()
+
+    async def pair(self, address: str, code: str) -> str:
+        """Pair with a device over wireless debugging, returns the server message."""
+        return await self.host_request(f"host:pair:{code}:{address}")
+
+    async def features(self, serial: str) -> set[str]:
+        """Features supported by both the server and a device, cached per serial."""
+        features = self._features.get(serial)
+        if features is None:
+            answer = await self.host_request(f"host-serial:{serial}:features")
+            features = self._features[serial] = set(answer.split(","))
+        return features
+
+    async def open_device_stream(self, serial: str, service: str):
+        """
+        Switch a connection to the transport of a device and open a service on it.
+        :return: The reader and writer of the open stream.
+        """
+        reader, writer = await self.connect()
+        try:
+            await self.send(reader, writer, f"host:transport:{serial}")
+            await self.send(reader, writer, service)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def open_shell(self, serial: str, command: str):
+        """
+        Start a shell command on a device, over shell v2 when the device supports it.
+        :return: The reader and writer of the shell stream, and whether it speaks shell v2.
+        """
+        v2 = "shell_v2" in await self.features(serial)
+        service = f"shell,v2,raw:{command}" if v2 else f"shell:{command}"
+        reader, writer = await self.open_device_stream(serial, service)
+        return reader, writer, v2
+
+    async def shell(self, serial: str, command: str) -> CommandResult:
+        """
+        Run a shell command on a device over the shell v2 protocol, which keeps stdout,
+        stderr and the exit code apart. Devices without shell v2 fall back to the legacy
+        shell service, which gives neither stderr nor an exit code.
+        :param serial: Serial number of the device.
+        :param command: The command line, interpreted by the device shell.
+        :return: A CommandResult for the command.
+        """
+        with CommandTimer(shell_command_name(command), "server", serial) as timer:
+            result = await self._shell(serial, command)
+            timer.outcome = "success" if result.returncode == 0 else "failure"
+        return result
+
+    async def _shell(self, serial: str, command: str) -> CommandResult:
+        reader, writer, v2 = await self.open_shell(serial, command)
+        if not v2:
+            try:
+                stdout = await reader.read()
+            finally:
+                writer.close()
+            adb_read_bytes.inc(("server",), len(stdout))
+            return CommandResult(
+                args=[command], returncode=0, stdout=stdout.decode(errors="replace")
+            )
+        stdout, stderr, returncode = [], [], None
+        try:
+            async for packet_id, data in self._shell_packets(reader):
+                if packet_id == SHELL_STDOUT:
+                    stdout.append(data)
+                elif packet_id == SHELL_STDERR:
+                    stderr.append(data)
+                elif packet_id == SHELL_EXIT:
+                    returncode = data[0]
+                    break
+        finally:
+            writer.close()
+        return CommandResult(
+            args=[command],
+            returncode=returncode,
+            stdout=b"".join(stdout).decode(errors="replace"),
+            stderr=b"".join(stderr).decode(errors="replace"),
+        )
+
+    async def iter_shell_stdout(self, reader, writer, v2: bool, timeout: float | None = None):
+        """
+        Yield the stdout of a shell opened with open_shell as decoded text chunks.
+        The stream is closed once the command exits or the consumer stops iterating.
+        :param timeout: Seconds to wait for each chunk.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            if v2:
+                packets = self._shell_packets(reader)
+                while True:
+                    try:
+                        packet_id, data = await asyncio.wait_for(anext(packets), timeout)
+                    except StopAsyncIteration:
+                        break
+                    if packet_id == SHELL_EXIT:
+                        break
+                    adb_read_bytes.inc(("server",), len(data))
+                    if packet_id == SHELL_STDOUT:
+                        text = decoder.decode(data)
+                        if text:
+                            yield text
+            else:
+                while data := await asyncio.wait_for(reader.read(CHUNK_SIZE), timeout):
+                    adb_read_bytes.inc(("server",), len(data))
+                    text = decoder.decode(data)
+                    if text:
+                        yield text
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _shell_packets(reader):
+        """Yield the (packet id, payload) pairs of a shell v2 stream until it ends."""
+        while True:
+            try:
+                header = await reader.readexactly(5)
+            except asyncio.IncompleteReadError:
+                return
+            packet_id, length = struct.unpack("<BI", header)
+            yield packet_id, await reader.readexactly(length)
+
+
+class Adb:
+    """
+    Entry point for adb operations. Talks to the adb server through AdbClient and falls
+    back to running the adb executable when the server cannot be reached.
+    The backend is chosen with the BLOATWARE_ADB_BACKEND environment variable:
+    auto (default), native or subprocess.
+    """
+
+    logger = logging.getLogger(__name__)
+    client = AdbClient()
+    backend = os.environ.get("BLOATWARE_ADB_BACKEND", "auto")
+    # Seconds to stay on the subprocess path after the server could not be reached
+    retry_interval = 5.0
+    _native_unavailable_until = 0.0
+
+    @classmethod
+    def _use_native(cls) -> bool:
+        if cls.backend == "subprocess":
+            return False
+        return cls.backend == "native" or time.monotonic() >= cls._native_unavailable_until
+
+    @classmethod
+    def _native_failed(cls, e: Exception):
+        cls.logger.info(f"adb server not reachable ({e}), falling back to the adb executable")
+        cls._native_unavailable_until = time.monotonic() + cls.retry_interval
+
+    @classmethod
+    async def devices(cls, timeout: float | None = None) -> str:
+        """
+        List devices attached to the adb server.
+        :return: The output of ``adb devices -l``, header line included.
+        """
+        if cls._use_native():
+            try:
+                output = await asyncio.wait_for(
+                    cls.client.devices(), timeout or CommandManager.default_timeout
+                )
+                return "List of devices attached\n" + output
+            except asyncio.TimeoutError:
+                cls.logger.error("[ERROR] adb server did not list devices in time")
+                return ""
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if cls.backend == "native":
+                    raise
+                cls._native_failed(e)
+        result = await CommandManager.run(["adb", "devices", "-l"], timeout=timeout)
+        return result.stdout
+
+    @classmethod
+    async def track_devices(cls, poll_interval: float = 5.0):
+        """
+        Follow the devices attached to the adb server.
+        The server pushes every change over one open connection. Without a reachable
+        server the adb executable is polled instead, until the server is back.
+        :param poll_interval: Seconds between two polls of the adb executable.
+        :return: An async iterator of device lists in the format of ``adb devices -l``.
+        """
+        if cls._use_native():
+            try:
+                async for listing in cls.client.track_devices():
+                    yield listing
+                return
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if cls.backend == "native":
+                    raise
+                cls._native_failed(e)
+        while True:
+            result = await CommandManager.run(["adb", "devices", "-l"])
+            if result.ok:
+                yield result.stdout
+            await asyncio.sleep(poll_interval)
+            if cls._use_native():
+                return
+
+    @classmethod
+    async def shell(cls, serial: str, command: str, timeout: float | None = None) -> CommandResult:
+        """
+        Run a shell command on a device.
+        :param serial: Serial number of the device.
+        :param command: The command line, interpreted by the device shell.
+        :param timeout: Seconds to wait for the command.
+        :return: A CommandResult for the command.
+        """
+        if cls._use_native():
+            native_timeout = CommandManager.default_timeout if timeout is None else timeout
+            try:
+                return await asyncio.wait_for(cls.client.shell(serial, command), native_timeout)
+            except AdbProtocolError as e:
+                cls.logger.error(f"[ERROR] Failed to run {command} on {serial} because {e}")
+                return CommandResult(args=[command], returncode=None, stderr=str(e))
+            except asyncio.TimeoutError:
+                cls.logger.error(f"[ERROR] Command {command} timed out after {native_timeout}s")
+                return CommandResult(args=[command], returncode=None, timed_out=True)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if cls.backend == "native":
+                    raise
+                cls._native_failed(e)
+        # adb hands a single argument to the device shell as is, keeping its quoting intact
+        return await CommandManager.run(["adb", "-s", serial, "shell", command], timeout=timeout)
+
+    @classmethod
+    async def shell_stream(cls, serial: str, command: str, timeout: float | None = None):
+        """
+        Run a shell command on a device and yield its stdout as text chunks while it runs.
+        :param serial: Serial number of the device.
+        :param command: The command line, interpreted by the device shell.
+        :param timeout: Seconds to wait for each chunk.
+        :raises StreamInterrupted: If the command could not start or its output stalled,
+         what was yielded so far is then incomplete.
+        """
+        if cls._use_native():
+            native_timeout = CommandManager.default_timeout if timeout is None else timeout
+            try:
+                reader, writer, v2 = await asyncio.wait_for(
+                    cls.client.open_shell(serial, command), native_timeout
+                )
+            except AdbProtocolError as e:
+                cls.logger.error(f"[ERROR] Failed to run {command} on {serial} because {e}")
+                raise StreamInterrupted(str(e)) from e
+            except asyncio.TimeoutError:
+                cls.logger.error(f"[ERROR] Command {command} did not start in {native_timeout}s")
+                raise StreamInterrupted(f"did not start in {native_timeout}s") from None
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if cls.backend == "native":
+                    raise
+                cls._native_failed(e)
+            else:
+                chunks = cls.client.iter_shell_stdout(reader, writer, v2, native_timeout)
+                timer = CommandTimer(shell_command_name(command), "server", serial)
+                try:
+                    with timer:
+                        async for chunk in chunks:
+                            yield chunk
+                except asyncio.TimeoutError:
+                    cls.logger.error(f"[ERROR] Command {command} stalled for {native_timeout}s")
+                    raise StreamInterrupted(f"stalled for {native_timeout}s") from None
+                finally:
+                    await chunks.aclose()
+                return
+        chunks = CommandManager.stream(["adb", "-s", serial, "shell", command], timeout=timeout)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    @classmethod
+    async def pair(cls, address: str, code: str, timeout: float | None = None) -> CommandResult:
+        """
+        Pair with a device over wireless debugging.
+        :param address: ip:port of the pairing service of the device.
+        :param code: The six digit pairing code.
+        :return: A CommandResult whose stdout holds the pairing message.
+        """
+        if cls._use_native():
+            try:
+                message = await asyncio.wait_for(cls.client.pair(address, code), timeout)
+                succeeded = not message.lower().startswith("failed")
+                return CommandResult(
+                    args=["pair", address], returncode=0 if succeeded else 1, stdout=message
+                )
+            except AdbProtocolError as e:
+                return CommandResult(args=["pair", address], returncode=1, stdout=str(e))
+            except asyncio.TimeoutError:
+                return CommandResult(args=["pair", address], returncode=None, timed_out=True)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if cls.backend == "native":
+                    raise
+                cls._native_failed(e)
+        return await CommandManager.run(
+            ["adb", "pair", address], timeout=timeout, input=code + "\n"
+        )
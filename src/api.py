@@ -0,0 +1,328 @@
+"""
+Versioned JSON API serving the same data as the HTML pages.
+GET responses carry strong ETags. A client sending one back in If-None-Match gets a
+304 without the inventory being queried or serialized again while it is cached.
+"""
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import json
+
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from .db import db_manager
+from .device_manager import DeviceManager
+from .device_tracker import device_tracker
+from .exceptions import ErrorCodes
+from .fleet import FleetManager
+from .jobs import job_queue
+from .knowledge_base import knowledge_base
+from .pkg_manager import ACTION_COMMANDS, PackageManager
+from .routes import MAX_PER_PAGE, SSE_HEARTBEAT, package_query
+from .rules import rule_set
+from .utils import cancel_on_disconnect
+
+router = APIRouter(prefix="/api/v1", tags=["api"])
+# Serialized response bodies kept by ETag
+MAX_CACHED_BODIES = 128
+_bodies = OrderedDict()
+
+
+class ActionRequest(BaseModel):
+    """
+    Actions by package name and the devices to act on (the selected one by default),
+    applied at once by /actions or queued as one job per device by /jobs.
+    """
+
+    actions: dict[str, str]
+    serial_numbers: list[str] | None = None
+
+
+class RestoreRequest(BaseModel):
+    """
+    Journaled actions to undo on some devices (the selected one by default), optionally
+    only those performed since a Unix time or on some packages.
+    """
+
+    serial_numbers: list[str] | None = None
+    since: float | None = None
+    packages: list[str] | None = None
+
+
+def _etag(*parts: str) -> str:
+    return '"' + hashlib.sha1("\0".join(parts).encode()).hexdigest() + '"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def _cached_response(request: Request, etag: str, build) -> Response:
+    """
+    Answer with the body known under etag, or 304 if the client already has it.
+    :param build: Coroutine function serializing the body when it is not cached.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    body = _bodies.get(etag)
+    if body is None:
+        body = _bodies[etag] = await build()
+        while len(_bodies) > MAX_CACHED_BODIES:
+            _bodies.popitem(last=False)
+    else:
+        _bodies.move_to_end(etag)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+@router.get("/devices")
+async def list_devices(request: Request):
+    """
+    List the devices attached to the adb server.
+    :return: JSON with the serial number, state, model and selection of every device.
+    """
+    body = _dumps({"devices": await DeviceManager.list_devices()})
+
+    async def build():
+        return body
+
+    return await _cached_response(request, _etag(body.decode()), build)
+
+
+@router.get("/devices/events")
+async def device_events(request: Request):
+    """
+    Stream device changes as Server-Sent Events while the device tracker follows the
+    adb server.
+    :return: A text/event-stream response with one connected, changed or disconnected
+     event, carrying the device as JSON, per change.
+    """
+    queue = device_tracker.subscribe()
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['device'])}\n\n"
+        finally:
+            device_tracker.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/devices/{serial_number}/packages")
+async def list_packages(
+    request: Request,
+    serial_number: str,
+    q: str = "",
+    kind: str = "",
+    state: str = "",
+    installer: str | None = None,
+    sort: str = "name",
+    order: str = "asc",
+    page: int = 1,
+    per_page: int = 50,
+    refresh: bool = False,
+):
+    """
+    List the packages of a device, filtered and paginated like the packages page.
+    Every package carries its knowledge base entry and the rule matching it, null when
+    there is none. The ETag depends on the inventory, the knowledge base, the rules and the
+    query only, so polling with it is cheap.
+    :param serial_number: Serial number of the device.
+    :param refresh: Query the device instead of using the cached inventory.
+    :return: JSON with one page of packages and the number of matches.
+    """
+    error_code, index = await cancel_on_disconnect(
+        request, PackageManager.get_package_index(refresh=refresh, serial_number=serial_number)
+    )
+    if error_code == ErrorCodes.FAILED_OPERATION:
+        return JSONResponse(
+            {"detail": "Failed to read the packages of the device."}, status_code=502
+        )
+    if error_code != ErrorCodes.SUCCESS:
+        return JSONResponse({"detail": "No packages found on the device."}, status_code=404)
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    arguments = package_query(q, kind, state, installer, sort, order, page, per_page)
+    # Hashes the knowledge base source off the event loop, if the lifespan did not already
+    await knowledge_base.open()
+    etag = _etag(
+        serial_number,
+        index.fingerprint,
+        knowledge_base.version,
+        rule_set.version,
+        repr(sorted(arguments.items())),
+    )
+
+    async def build():
+        result = index.query(**arguments)
+        names = [package.name for package in result.packages]
+        knowledge = await asyncio.to_thread(knowledge_base.lookup_many, names)
+        rules = rule_set.classify(names)
+        return _dumps(
+            {
+                "serial_number": serial_number,
+                "total": result.total,
+                "page": result.page,
+                "pages": result.pages,
+                "per_page": per_page,
+                "packages": [
+                    {
+                        **package.to_dict(),
+                        "knowledge": (
+                            knowledge[package.name].to_dict() if package.name in knowledge else None
+                        ),
+                        "rule": rules[package.name].to_dict() if package.name in rules else None,
+                    }
+                    for package in result.packages
+                ],
+            }
+        )
+
+    return await _cached_response(request, etag, build)
+
+
+@router.get("/devices/{serial_number}/journal")
+async def get_journal(serial_number: str, since: float | None = None):
+    """
+    List the disable and uninstall actions of a device that can be undone.
+    :param serial_number: Serial number of the device.
+    :param since: Only the actions performed at or after this Unix time.
+    :return: JSON with the journal entries, oldest first.
+    """
+    entries = await db_manager.get_journal(serial_number, since=since)
+    return JSONResponse({"serial_number": serial_number, "entries": entries})
+
+
+async def _action_targets(
+    action_request: ActionRequest,
+) -> tuple[JSONResponse | None, list[str], dict]:
+    """
+    Check an action request, applied or queued.
+    :return: An error response or None, the serial numbers to act on and the action form.
+    """
+    unknown = sorted(
+        {action for action in action_request.actions.values() if action not in ACTION_COMMANDS}
+    )
+    if unknown:
+        error = JSONResponse({"detail": f"Unknown actions: {', '.join(unknown)}"}, status_code=422)
+        return error, [], {}
+    serial_numbers = action_request.serial_numbers
+    if not serial_numbers:
+        selected_device = await DeviceManager.get_selected_device()
+        if not selected_device:
+            return JSONResponse({"detail": "No device selected."}, status_code=409), [], {}
+        serial_numbers = [selected_device]
+    action_form = {f"action_{name}": action for name, action in action_request.actions.items()}
+    return None, serial_numbers, action_form
+
+
+@router.post("/actions")
+async def apply_actions(request: Request, action_request: ActionRequest):
+    """
+    Disable or uninstall packages on one or more devices, waiting for the result.
+    :param action_request: The action per package name and the devices to act on.
+    :return: JSON with a report per device, as shown by the fleet status page.
+    """
+    error, serial_numbers, action_form = await _action_targets(action_request)
+    if error is not None:
+        return error
+    reports = await cancel_on_disconnect(
+        request, FleetManager.apply_actions(serial_numbers, action_form)
+    )
+    return JSONResponse({"devices": reports})
+
+
+@router.post("/restore")
+async def restore(request: Request, restore_request: RestoreRequest):
+    """
+    Undo the journaled disable and uninstall actions on one or more devices, waiting for
+    the result.
+    :param restore_request: The devices to restore and which of their actions to undo.
+    :return: JSON with a report per device, as for /actions.
+    """
+    serial_numbers = restore_request.serial_numbers
+    if not serial_numbers:
+        selected_device = await DeviceManager.get_selected_device()
+        if not selected_device:
+            return JSONResponse({"detail": "No device selected."}, status_code=409)
+        serial_numbers = [selected_device]
+    reports = await cancel_on_disconnect(
+        request,
+        FleetManager.restore_actions(
+            serial_numbers, since=restore_request.since, packages=restore_request.packages
+        ),
+    )
+    return JSONResponse({"devices": reports})
+
+
+@router.post("/jobs")
+async def submit_jobs(action_request: ActionRequest):
+    """
+    Queue actions on one or more devices and answer right away.
+    :param action_request: The action per package name and the devices to act on.
+    :return: JSON with the id of the job of every device, 202 Accepted.
+    """
+    error, serial_numbers, action_form = await _action_targets(action_request)
+    if error is not None:
+        return error
+    jobs = {
+        serial_number: await job_queue.submit(serial_number, action_form)
+        for serial_number in serial_numbers
+    }
+    return JSONResponse({"jobs": jobs}, status_code=202)
+
+
+@router.get("/jobs")
+async def list_jobs(status: list[str] | None = Query(None), limit: int = 100):
+    """
+    List the most recent jobs, without their items.
+    :param status: Only jobs in one of these statuses.
+    :return: JSON with the jobs, newest first.
+    """
+    jobs = await db_manager.list_jobs(status, limit=min(max(limit, 1), MAX_PER_PAGE))
+    return JSONResponse({"jobs": jobs})
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: int):
+    """
+    :return: JSON with the state of a job and of each of its packages.
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        return JSONResponse({"detail": "Unknown job."}, status_code=404)
+    return JSONResponse(job)
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int):
+    """
+    Cancel a queued or running job.
+    :return: JSON with the state of the job, 409 if it was already over.
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        return JSONResponse({"detail": "Unknown job."}, status_code=404)
+    if not await job_queue.cancel(job_id):
+        return JSONResponse({"detail": f"Job is already {job['status']}."}, status_code=409)
+    return JSONResponse(await job_queue.get(job_id))
@@ -0,0 +1,73 @@
+from contextlib import asynccontextmanager
+import logging
+import sys
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+from src.api import router as api_router
+from src.db import db_manager
+from src.device_tracker import device_tracker
+from src.exceptions import ClientDisconnected
+from src.jobs import job_queue
+from src.knowledge_base import knowledge_base
+from src.metrics import MetricsMiddleware
+from src.pkg_manager import PackageManager
+from src.profiler import ProfilerMiddleware
+from src.progress import progress_registry
+from src.routes import router
+from src.shell_session import shell_sessions
+from src.startup import startup_timer
+from src.tracing import TracingMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with startup_timer.phase("lifespan: database"):
+        await db_manager.connect()
+        if not await db_manager.is_connected():
+            logger.error("Failed to connect to the db")
+            sys.exit(1)
+        logger.info("Connected to database")
+        await db_manager.create_tables()
+        logger.info("Created db tables")
+    with startup_timer.phase("lifespan: knowledge base"):
+        await knowledge_base.open()
+    with startup_timer.phase("lifespan: restore inventories"):
+        restored = await PackageManager.restore_snapshots()
+    logger.info(f"Restored the package inventories of {restored} devices")
+    with startup_timer.phase("lifespan: tracker and workers"):
+        device_tracker.start()
+        await job_queue.start()
+    logger.info(f"Started {job_queue.workers} job workers")
+    yield
+    await job_queue.stop()
+    await device_tracker.stop()
+    await progress_registry.cancel_all()
+    await shell_sessions.close_all()
+    logger.info("Closed adb shell sessions")
+    await db_manager.close()
+    logger.info("Closed db connection")
+
+
+app = FastAPI(
+    title="Bloatware Remover",
+    description="A modern web-based tool for safely removing bloatware from Android devices using ADB",
+    version="1.0.0",
+    docs_url="/docs",
+    redoc_url="/redoc",
+    lifespan=lifespan,
+)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.include_router(router)
+app.include_router(api_router)
+
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    """Nobody is listening anymore, answer with the nginx style 499 status."""
+    return Response(status_code=499)
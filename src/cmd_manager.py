@@ -1,28 +1,154 @@
+import asyncio
+import codecs
+from dataclasses import dataclass
 import logging
-import subprocess
+import shlex
+
+from .exceptions import StreamInterrupted
+from .metrics import CommandTimer, adb_command_name, adb_read_bytes, outcome
+
+
+@dataclass
+class CommandResult:
+    """Outcome of a single command execution."""
+
+    args: list[str]
+    returncode: int | None
+    stdout: str = ""
+    stderr: str = ""
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
 
 
 class CommandManager:
     logger = logging.getLogger(__name__)
+    default_timeout = 30.0
+    # Bytes read at a time when streaming output
+    chunk_size = 1 << 16
 
     @classmethod
-    async def execute_command(cls, command: str) -> str:
+    async def run(
+        cls,
+        args: list[str],
+        timeout: float | None = None,
+        input: str | None = None,
+    ) -> CommandResult:
         """
-        Execute a command on the device.
-        :param command: The command to execute.
-        :return: The output of the command.
+        Run a command as a child process without blocking the event loop.
+        The process is killed if it exceeds the timeout or if the awaiting task is cancelled.
+        :param args: The command and its arguments, passed to the OS without a shell.
+        :param timeout: Seconds to wait before killing the process, defaults to default_timeout.
+        :param input: Optional text written to the process stdin.
+        :return: A CommandResult with the exit code, stdout and stderr of the process.
         """
+        name, serial = adb_command_name(args)
+        with CommandTimer(name, "subprocess", serial) as timer:
+            result = await cls._run(args, timeout, input)
+            timer.outcome = outcome(result)
+            return result
+
+    @classmethod
+    async def _run(cls, args: list[str], timeout: float | None, input: str | None):
+        timeout = cls.default_timeout if timeout is None else timeout
+        cls.logger.debug(f"Executing command: {shlex.join(args)}")
         try:
-            cls.logger.debug(f"Executing command: {command}")
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                shell=True,
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
             )
-            stdout, _ = process.communicate()
-            return stdout
-        except Exception as e:
-            cls.logger.error(f"[ERROR] Failed to run command {command} because {e}")
-            return ""
+        except OSError as e:
+            cls.logger.error(f"[ERROR] Failed to run command {shlex.join(args)} because {e}")
+            return CommandResult(args=args, returncode=None, stderr=str(e))
+
+        stdin_data = input.encode() if input is not None else None
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(stdin_data), timeout)
+        except asyncio.TimeoutError:
+            cls.logger.error(f"[ERROR] Command {shlex.join(args)} timed out after {timeout}s")
+            await cls._kill(process)
+            return CommandResult(args=args, returncode=None, timed_out=True)
+        except asyncio.CancelledError:
+            cls.logger.info(f"Command {shlex.join(args)} cancelled")
+            await cls._kill(process)
+            raise
+        adb_read_bytes.inc(("subprocess",), len(stdout) + len(stderr))
+        return CommandResult(
+            args=args,
+            returncode=process.returncode,
+            stdout=stdout.decode(errors="replace"),
+            stderr=stderr.decode(errors="replace"),
+        )
+
+    @classmethod
+    async def stream(cls, args: list[str], timeout: float | None = None):
+        """
+        Run a command and yield its stdout as decoded text chunks while it runs, so large
+        outputs never have to be held in memory at once. stderr is discarded.
+        The process is killed once the consumer stops iterating or a read times out.
+        :param args: The command and its arguments, passed to the OS without a shell.
+        :param timeout: Seconds to wait for each chunk, defaults to default_timeout.
+        :raises StreamInterrupted: If the command could not start or its output stalled,
+         what was yielded so far is then incomplete.
+        """
+        timeout = cls.default_timeout if timeout is None else timeout
+        cls.logger.debug(f"Streaming command: {shlex.join(args)}")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except OSError as e:
+            cls.logger.error(f"[ERROR] Failed to run command {shlex.join(args)} because {e}")
+            raise StreamInterrupted(str(e)) from e
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        name, serial = adb_command_name(args)
+        try:
+            with CommandTimer(name, "subprocess", serial) as timer:
+                while True:
+                    try:
+                        data = await asyncio.wait_for(process.stdout.read(cls.chunk_size), timeout)
+                    except asyncio.TimeoutError:
+                        cls.logger.error(
+                            f"[ERROR] Command {shlex.join(args)} stalled for {timeout}s"
+                        )
+                        timer.outcome = "timeout"
+                        raise StreamInterrupted(f"stalled for {timeout}s") from None
+                    if not data:
+                        break
+                    adb_read_bytes.inc(("subprocess",), len(data))
+                    text = decoder.decode(data)
+                    if text:
+                        yield text
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    yield tail
+        finally:
+            await cls._kill(process)
+
+    @classmethod
+    async def execute_command(cls, command: str | list[str], timeout: float | None = None) -> str:
+        """
+        Execute a command on the device.
+        :param command: The command to execute, either as an argv list or a string to split.
+        :param timeout: Seconds to wait before giving up on the command.
+        :return: The output of the command.
+        """
+        args = shlex.split(command) if isinstance(command, str) else command
+        result = await cls.run(args, timeout=timeout)
+        return result.stdout
+
+    @staticmethod
+    async def _kill(process: asyncio.subprocess.Process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
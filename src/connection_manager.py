@@ -1,9 +1,11 @@
 import logging
-import subprocess
+
+from .adb_client import Adb
 
 
 class ConnectionManager:
     logger = logging.getLogger(__name__)
+    pair_timeout = 15.0
 
     @classmethod
     async def connect_to_device(cls, device_ip, device_port, device_code) -> bool:
@@ -20,14 +22,7 @@ class ConnectionManager:
         if not (device_ip and device_port and device_code):
             return False
         cls.logger.debug(f"Connecting to device {device_ip}:{device_port}...")
-        process = subprocess.Popen(
-            ["adb", "pair", f"{device_ip}:{device_port}"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        stdout, _ = process.communicate(input=device_code + "\n")
-        status = 'failed' not in stdout
+        result = await Adb.pair(f"{device_ip}:{device_port}", device_code, timeout=cls.pair_timeout)
+        status = result.ok and 'failed' not in result.stdout
         cls.logger.debug(f"Connection status for device {device_ip}:{device_port}:{status}.")
         return status
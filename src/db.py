@@ -1,18 +1,118 @@
+import asyncio
+from contextlib import asynccontextmanager
 import logging
+import os
+import time
 
 import aiosqlite
 
+from .models import PackageInfo
+from .snapshots import Snapshot
+from .tracing import traced_methods
 
+# Schema migrations, MIGRATIONS[n] brings a database from version n to n + 1.
+# The version is kept in PRAGMA user_version, never edit a migration once released.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS current_device (serial_number TEXT);
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        serial_number TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        error TEXT
+    );
+    CREATE TABLE IF NOT EXISTS job_items (
+        job_id INTEGER NOT NULL REFERENCES jobs (id),
+        position INTEGER NOT NULL,
+        package TEXT NOT NULL,
+        action TEXT NOT NULL,
+        status TEXT NOT NULL,
+        duration REAL,
+        output TEXT,
+        PRIMARY KEY (job_id, position)
+    );
+    """,
+    """
+    CREATE TABLE devices (
+        serial_number TEXT PRIMARY KEY,
+        state TEXT,
+        model TEXT,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL
+    );
+    CREATE TABLE snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        serial_number TEXT NOT NULL,
+        taken_at REAL NOT NULL
+    );
+    CREATE INDEX snapshots_by_device ON snapshots (serial_number, id);
+    CREATE TABLE snapshot_packages (
+        snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        uid INTEGER,
+        version_code INTEGER,
+        enabled INTEGER NOT NULL,
+        path TEXT,
+        installer TEXT,
+        system INTEGER NOT NULL,
+        PRIMARY KEY (snapshot_id, name)
+    ) WITHOUT ROWID;
+    CREATE TABLE action_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        serial_number TEXT NOT NULL,
+        package TEXT NOT NULL,
+        action TEXT NOT NULL,
+        succeeded INTEGER NOT NULL,
+        output TEXT,
+        performed_at REAL NOT NULL
+    );
+    CREATE INDEX action_history_by_device ON action_history (serial_number, id);
+    CREATE INDEX job_items_by_package ON job_items (job_id, package);
+    """,
+    """
+    ALTER TABLE action_history ADD COLUMN previous_state TEXT;
+    ALTER TABLE action_history ADD COLUMN restored_at REAL;
+    """,
+]
+
+
+@traced_methods("db")
 class DbManger:
     logger = logging.getLogger(__name__)
-    connection_path = ":memory:"
+    # ":memory:" keeps nothing across restarts, point it at a file to keep the selected
+    # device, snapshots, jobs and action history
+    connection_path = os.environ.get("BLOATWARE_DB_PATH", ":memory:")
+    # Applied on every connection, journal_mode only matters for a file
+    pragmas = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "foreign_keys": "ON",
+        "busy_timeout": "5000",
+        "temp_store": "MEMORY",
+        "cache_size": "-16000",
+    }
+    # Snapshots kept per device
+    max_snapshots = 10
+    # Columns that update_job and update_job_items may set
+    job_columns = {"status", "started_at", "finished_at", "error"}
+    job_item_columns = {"status", "duration", "output"}
 
     def __init__(self):
         self.connection = None
+        # One writer at a time, so a transaction never takes in another coroutine's writes
+        self._write_lock = asyncio.Lock()
 
     async def connect(self):
         try:
+            if self.connection_path != ":memory:":
+                directory = os.path.dirname(os.path.abspath(self.connection_path))
+                os.makedirs(directory, exist_ok=True)
             self.connection = await aiosqlite.connect(self.connection_path)
+            for pragma, value in self.pragmas.items():
+                await self.connection.execute(f"PRAGMA {pragma} = {value}")
             return True
         except Exception as e:
             self.logger.error(f"Database connection error: {e}")
@@ -28,6 +128,20 @@ class DbManger:
             self.logger.error(f"Database connection error: {e}")
             return False
 
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Run writes in one transaction, committed once at the end or rolled back on error.
+        :return: The connection to write with.
+        """
+        async with self._write_lock:
+            try:
+                yield self.connection
+            except BaseException:
+                await self.connection.rollback()
+                raise
+            await self.connection.commit()
+
     async def get_selected_device(self):
         async with self.connection.cursor() as cursor:
             query = "SELECT serial_number FROM current_device LIMIT 1"
@@ -36,27 +150,305 @@ class DbManger:
         return result[0] if result else None
 
     async def set_selected_device(self, serial_number):
-        await self.connection.execute("DELETE FROM current_device")
-        await self.connection.execute(
-            """
-            INSERT INTO current_device (serial_number) VALUES (?)
-            """,
-            (serial_number,),
-        )
-        await self.connection.commit()
+        async with self.transaction() as connection:
+            await connection.execute("DELETE FROM current_device")
+            await connection.execute(
+                """
+                INSERT INTO current_device (serial_number) VALUES (?)
+                """,
+                (serial_number,),
+            )
 
-    async def create_tables(self):
-        await self.connection.execute(
-            """
-            CREATE TABLE IF NOT EXISTS current_device (serial_number TEXT)
+    async def upsert_devices(self, devices: list[dict]):
+        """Remember the devices seen on the adb server, with their latest state and model."""
+        now = time.time()
+        async with self.transaction() as connection:
+            await connection.executemany(
+                """
+                INSERT INTO devices (serial_number, state, model, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (serial_number) DO UPDATE SET
+                    state = excluded.state,
+                    model = COALESCE(excluded.model, devices.model),
+                    last_seen = excluded.last_seen
+                """,
+                [
+                    (device["serial_number"], device["state"], device.get("model"), now, now)
+                    for device in devices
+                ],
+            )
+
+    async def get_devices(self) -> list[dict]:
+        async with self.connection.execute(
+            "SELECT * FROM devices ORDER BY last_seen DESC"
+        ) as cursor:
+            return [self._as_dict(cursor, row) for row in await cursor.fetchall()]
+
+    async def save_snapshot(self, serial_number, taken_at, packages) -> int:
+        """
+        Store the packages of a device, dropping its snapshots older than the last
+        max_snapshots.
+        :return: The id of the snapshot.
+        """
+        async with self.transaction() as connection:
+            cursor = await connection.execute(
+                "INSERT INTO snapshots (serial_number, taken_at) VALUES (?, ?)",
+                (serial_number, taken_at),
+            )
+            snapshot_id = cursor.lastrowid
+            await connection.executemany(
+                """
+                INSERT INTO snapshot_packages
+                    (snapshot_id, name, uid, version_code, enabled, path, installer, system)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        snapshot_id,
+                        package.name,
+                        package.uid,
+                        package.version_code,
+                        package.enabled,
+                        package.path,
+                        package.installer,
+                        package.system,
+                    )
+                    for package in packages
+                ],
+            )
+            await connection.execute(
+                """
+                DELETE FROM snapshots WHERE serial_number = ? AND id NOT IN (
+                    SELECT id FROM snapshots WHERE serial_number = ? ORDER BY id DESC LIMIT ?
+                )
+                """,
+                (serial_number, serial_number, self.max_snapshots),
+            )
+        return snapshot_id
+
+    async def get_snapshot(self, serial_number, snapshot_id=None) -> Snapshot | None:
+        """
+        :return: A snapshot of a device, the latest one when snapshot_id is None.
+        """
+        query = "SELECT id, serial_number, taken_at FROM snapshots WHERE serial_number = ?"
+        params = [serial_number]
+        if snapshot_id is not None:
+            query += " AND id = ?"
+            params.append(snapshot_id)
+        async with self.connection.execute(query + " ORDER BY id DESC LIMIT 1", params) as cursor:
+            row = await cursor.fetchone()
+        return await self._load_snapshot(*row) if row else None
+
+    async def get_latest_snapshots(self) -> list[Snapshot]:
+        """:return: The latest snapshot of every device."""
+        async with self.connection.execute(
             """
-        )
-        await self.connection.execute(
+            SELECT id, serial_number, taken_at FROM snapshots
+            WHERE id IN (SELECT MAX(id) FROM snapshots GROUP BY serial_number)
             """
-            DELETE FROM current_device
+        ) as cursor:
+            rows = await cursor.fetchall()
+        return [await self._load_snapshot(*row) for row in rows]
+
+    async def _load_snapshot(self, snapshot_id, serial_number, taken_at) -> Snapshot:
+        async with self.connection.execute(
             """
-        )
-        await self.connection.commit()
+            SELECT name, uid, version_code, enabled, path, installer, system
+            FROM snapshot_packages WHERE snapshot_id = ?
+            """,
+            (snapshot_id,),
+        ) as cursor:
+            packages = {
+                name: PackageInfo(
+                    name, uid, version_code, bool(enabled), path, installer, bool(system)
+                )
+                for name, uid, version_code, enabled, path, installer, system in (
+                    await cursor.fetchall()
+                )
+            }
+        return Snapshot(snapshot_id, serial_number, taken_at, packages)
+
+    async def record_actions(self, serial_number, actions):
+        """
+        Append to the action history of a device, which doubles as the journal of the
+        actions to undo.
+        :param actions: (package, action, succeeded, output, previous_state) tuples, the
+         previous state being enabled, disabled, uninstalled or None when it was not read.
+        """
+        now = time.time()
+        async with self.transaction() as connection:
+            await connection.executemany(
+                """
+                INSERT INTO action_history
+                    (serial_number, package, action, succeeded, output, previous_state,
+                     performed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(serial_number, *action, now) for action in actions],
+            )
+
+    async def get_action_history(self, serial_number=None, limit=100) -> list[dict]:
+        query, params = "SELECT * FROM action_history", []
+        if serial_number is not None:
+            query += " WHERE serial_number = ?"
+            params.append(serial_number)
+        query += " ORDER BY id DESC LIMIT ?"
+        async with self.connection.execute(query, (*params, limit)) as cursor:
+            return [self._as_dict(cursor, row) for row in await cursor.fetchall()]
+
+    async def get_journal(self, serial_number, since=None, packages=None) -> list[dict]:
+        """
+        The disable and uninstall actions of a device that succeeded and were not restored.
+        :param since: Only the actions performed at or after this Unix time.
+        :param packages: Only the actions on these packages.
+        :return: The actions, oldest first.
+        """
+        query = """
+            SELECT * FROM action_history
+            WHERE serial_number = ? AND succeeded AND restored_at IS NULL
+                AND action IN ('disable', 'uninstall')
+        """
+        params = [serial_number]
+        if since is not None:
+            query += " AND performed_at >= ?"
+            params.append(since)
+        query += " ORDER BY id"
+        async with self.connection.execute(query, params) as cursor:
+            entries = [self._as_dict(cursor, row) for row in await cursor.fetchall()]
+        if packages is not None:
+            packages = set(packages)
+            entries = [entry for entry in entries if entry["package"] in packages]
+        return entries
+
+    async def mark_restored(self, action_ids):
+        """Take actions out of the journal once they were undone."""
+        now = time.time()
+        async with self.transaction() as connection:
+            await connection.executemany(
+                "UPDATE action_history SET restored_at = ? WHERE id = ?",
+                [(now, action_id) for action_id in action_ids],
+            )
+
+    async def create_job(self, serial_number, operations) -> int:
+        """
+        Record a queued job with one pending item per (package, action) operation.
+        :return: The id of the job.
+        """
+        async with self.transaction() as connection:
+            cursor = await connection.execute(
+                """
+                INSERT INTO jobs (serial_number, status, created_at) VALUES (?, 'queued', ?)
+                """,
+                (serial_number, time.time()),
+            )
+            job_id = cursor.lastrowid
+            await connection.executemany(
+                """
+                INSERT INTO job_items (job_id, position, package, action, status)
+                VALUES (?, ?, ?, ?, 'pending')
+                """,
+                [(job_id, i, package, action) for i, (package, action) in enumerate(operations)],
+            )
+        return job_id
+
+    async def get_job(self, job_id):
+        async with self.connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)) as cursor:
+            row = await cursor.fetchone()
+            return self._as_dict(cursor, row) if row else None
+
+    async def get_job_items(self, job_id) -> list[dict]:
+        async with self.connection.execute(
+            "SELECT * FROM job_items WHERE job_id = ? ORDER BY position", (job_id,)
+        ) as cursor:
+            return [self._as_dict(cursor, row) for row in await cursor.fetchall()]
+
+    async def list_jobs(self, statuses=None, limit=100) -> list[dict]:
+        query, params = "SELECT * FROM jobs", []
+        if statuses:
+            query += f" WHERE status IN ({', '.join('?' * len(statuses))})"
+            params.extend(statuses)
+        query += " ORDER BY id DESC LIMIT ?"
+        async with self.connection.execute(query, (*params, limit)) as cursor:
+            return [self._as_dict(cursor, row) for row in await cursor.fetchall()]
+
+    async def update_job(self, job_id, **fields):
+        await self._update("jobs", self.job_columns, fields, "id = ?", (job_id,))
+
+    async def update_job_if(self, job_id, status, **fields) -> bool:
+        """
+        Update a job only while it is in status, checked and changed in one statement so
+        two tasks cannot both move it on.
+        :return: Whether the job was in status and got updated.
+        """
+        where, params = "id = ? AND status = ?", (job_id, status)
+        return await self._update("jobs", self.job_columns, fields, where, params) > 0
+
+    async def update_job_items(self, job_id, statuses=None, package=None, **fields):
+        """
+        Update the items of a job, all of them or only those in one of statuses or for
+        one package.
+        """
+        where, params = "job_id = ?", [job_id]
+        if statuses:
+            where += f" AND status IN ({', '.join('?' * len(statuses))})"
+            params.extend(statuses)
+        if package is not None:
+            where += " AND package = ?"
+            params.append(package)
+        await self._update("job_items", self.job_item_columns, fields, where, params)
+
+    async def record_job_items(self, job_id, updates):
+        """
+        Set the state of many items of a job at once.
+        :param updates: (package, status, duration, output) tuples.
+        """
+        async with self.transaction() as connection:
+            await connection.executemany(
+                """
+                UPDATE job_items SET status = ?, duration = ?, output = ?
+                WHERE job_id = ? AND package = ?
+                """,
+                [
+                    (status, duration, output, job_id, package)
+                    for package, status, duration, output in updates
+                ],
+            )
+
+    async def _update(self, table, columns, fields, where, params) -> int:
+        """:return: The number of rows updated."""
+        unknown = set(fields) - columns
+        if unknown:
+            raise ValueError(f"Unknown {table} columns: {', '.join(sorted(unknown))}")
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        async with self.transaction() as connection:
+            cursor = await connection.execute(
+                f"UPDATE {table} SET {assignments} WHERE {where}", (*fields.values(), *params)
+            )
+        return cursor.rowcount
+
+    @staticmethod
+    def _as_dict(cursor, row) -> dict:
+        return {column[0]: value for column, value in zip(cursor.description, row)}
+
+    async def schema_version(self) -> int:
+        async with self.connection.execute("PRAGMA user_version") as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def create_tables(self):
+        """Bring the schema up to date, one transaction per migration."""
+        version = await self.schema_version()
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            self.logger.info(f"Migrating the database to version {number}")
+            async with self._write_lock:
+                # executescript commits any pending transaction first, so the script
+                # opens and commits its own
+                try:
+                    await self.connection.executescript(
+                        f"BEGIN;\n{migration}\nPRAGMA user_version = {number};\nCOMMIT;"
+                    )
+                except Exception:
+                    await self.connection.rollback()
+                    raise
 
     async def close(self):
         await self.connection.close()
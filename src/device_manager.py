@@ -1,8 +1,9 @@
 import logging
-import re
 
-from src.cmd_manager import CommandManager
+from src.adb_client import Adb
 from src.db import db_manager
+from src.device_tracker import device_tracker
+from src.parsers import DeviceListParser, iter_lines, parse
 
 
 class DeviceManager:
@@ -22,30 +23,22 @@ class DeviceManager:
     @classmethod
     async def list_devices(cls):
         """
-        List connected devices using ADB.
+        List connected devices using ADB, from the device tracker while it follows the
+        adb server.
         Returns a list of connected devices with their following details.
         Serial Number, State, Description
         Returns a list of online devices only ie. state = device.
         """
-        cmd = "adb devices -l"
-        output = await CommandManager.execute_command(cmd)
-        devices = []
-        if output:
-            regex = r"^(\S+)\s+(\S+)(?:\s+.*model:(\S+))?"
-            # Skip the first line as it is a header
-            lines = output.strip().split("\n")[1:]
-            for line in lines:
-                match = re.match(regex, line)
-                if match:
-                    serial_number, state, model = match.groups()
-                    devices.append(
-                        {
-                            "serial_number": serial_number,
-                            "state": state,
-                            "model": model if model else "Unknown",
-                            "is_selected": False,
-                        }
-                    )
+        if device_tracker.ready:
+            devices = device_tracker.list_devices()
+        else:
+            output = await Adb.devices()
+            devices = list(parse(DeviceListParser(), iter_lines([output])))
+            if devices:
+                try:
+                    await db_manager.upsert_devices(devices)
+                except Exception as e:
+                    cls.logger.error(f"[ERROR] Failed to record devices because {e}")
         current_device = await cls.get_selected_device()
         if current_device:
             for device in devices:
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+
+from .adb_client import Adb
+from .db import db_manager
+from .package_cache import package_cache
+from .parsers import DeviceListParser, iter_lines, parse
+from .shell_session import shell_sessions
+
+
+class DeviceTracker:
+    """
+    Keeps the table of devices attached to the adb server, kept current by a
+    host:track-devices-l stream instead of listing devices on every request.
+    Subscribers get a connected, changed or disconnected event for every change.
+    """
+
+    logger = logging.getLogger(__name__)
+    # Seconds before following the server again after the stream broke
+    retry_interval = 2.0
+    # Events kept for a subscriber that does not keep up, older ones are dropped
+    max_pending_events = 256
+
+    def __init__(self):
+        self.devices: dict[str, dict] = {}
+        # Whether the table follows the server, readers fall back to asking adb when not
+        self.ready = False
+        self._subscribers: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.ready = False
+
+    def get(self, serial_number: str) -> dict | None:
+        return self.devices.get(serial_number)
+
+    def list_devices(self) -> list[dict]:
+        """:return: A copy of every device, safe for the caller to modify."""
+        return [dict(device) for device in self.devices.values()]
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Start receiving device events.
+        :return: A queue getting a {"type": ..., "device": {...}} dict per event.
+        """
+        queue = asyncio.Queue(self.max_pending_events)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def update(self, listing: str) -> list[dict]:
+        """
+        Replace the table with a device list and publish what changed.
+        :param listing: Devices in the format of ``adb devices -l``.
+        :return: The published events.
+        """
+        devices = {
+            device["serial_number"]: device
+            for device in parse(DeviceListParser(), iter_lines([listing]))
+        }
+        events = [
+            {"type": "connected" if serial not in self.devices else "changed", "device": device}
+            for serial, device in devices.items()
+            if self.devices.get(serial) != device
+        ]
+        events += [
+            {"type": "disconnected", "device": device}
+            for serial, device in self.devices.items()
+            if serial not in devices
+        ]
+        self.devices = devices
+        self.ready = True
+        for event in events:
+            self.logger.info(f"Device {event['device']['serial_number']} {event['type']}")
+            self._publish(event)
+            if event["type"] == "disconnected" or event["device"]["state"] != "device":
+                await self._forget(event["device"]["serial_number"])
+        if events and devices:
+            try:
+                await db_manager.upsert_devices(list(devices.values()))
+            except Exception as e:
+                self.logger.error(f"[ERROR] Failed to record devices because {e}")
+        return events
+
+    def _publish(self, event: dict):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    @staticmethod
+    async def _forget(serial_number: str):
+        # Whatever is held for a device that went away is stale when it comes back
+        package_cache.invalidate(serial_number)
+        await shell_sessions.close(serial_number)
+
+    async def _run(self):
+        while True:
+            listings = Adb.track_devices()
+            try:
+                async for listing in listings:
+                    await self.update(listing)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"[ERROR] Stopped tracking devices because {e}")
+            finally:
+                await listings.aclose()
+            self.ready = False
+            await asyncio.sleep(self.retry_interval)
+
+
+device_tracker = DeviceTracker()
@@ -7,3 +7,12 @@ class ErrorCodes(Enum):
     NO_PACKAGES_FOUND = 2
     NO_DEVICE_SELECTED = 3
     FAILED_OPERATION = 4
+    UNKNOWN_SNAPSHOT = 5
+
+
+class ClientDisconnected(Exception):
+    """Raised when the HTTP client goes away before its request has been served."""
+
+
+class StreamInterrupted(Exception):
+    """Raised when the output of a command ends before the command did, it is incomplete."""
@@ -0,0 +1,103 @@
+"""
+A stand-in for the adb executable that forwards to an adb server, meant to be put in
+front of the fake one (src/fake_adb_server.py) so the code paths spawning ``adb``
+(CommandManager, shell sessions) can be tested and benchmarked without hardware.
+It understands ``adb version``, ``adb devices -l`` and ``adb -s <serial> shell [command]``.
+Without a command the shell reads its input line by line and runs every complete
+command, a { } group spanning lines included, as it would on a device.
+
+    ANDROID_ADB_SERVER_PORT=5037 python -m src.fake_adb -s emulator-5554 shell pm list packages
+"""
+
+import asyncio
+import os
+import sys
+
+from .adb_client import AdbClient, AdbProtocolError
+
+
+def write_executable(directory: str) -> str:
+    """
+    Write an ``adb`` script running this module into a directory, to put first on the PATH.
+    :return: The directory.
+    """
+    if getattr(sys, "frozen", False):
+        # The bundled application runs this module itself, see main.main
+        command = f'exec "{sys.executable}" fake-adb "$@"'
+    else:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        command = f'PYTHONPATH="{root}" exec "{sys.executable}" -m src.fake_adb "$@"'
+    path = os.path.join(directory, "adb")
+    with open(path, "w") as script:
+        script.write(f"#!/bin/sh\n{command}\n")
+    os.chmod(path, 0o755)
+    return directory
+
+
+def _depth(line: str) -> int:
+    """:return: How many { groups the line opens minus how many it closes."""
+    words = line.split()
+    return words.count("{") - sum(1 for word in words if word == "}" or word.startswith("};"))
+
+
+async def _shell(client: AdbClient, serial: str, command: str) -> int:
+    try:
+        result = await client.shell(serial, command)
+    except (OSError, AdbProtocolError) as e:
+        sys.stderr.write(f"adb: error: {e}\n")
+        return 1
+    sys.stdout.write(result.stdout)
+    sys.stdout.flush()
+    sys.stderr.write(result.stderr)
+    return result.returncode or 0
+
+
+async def _interactive(client: AdbClient, serial: str) -> int:
+    loop = asyncio.get_running_loop()
+    command, depth, returncode = [], 0, 0
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            return returncode
+        command.append(line)
+        depth += _depth(line)
+        if depth <= 0:
+            returncode = await _shell(client, serial, "".join(command))
+            command, depth = [], 0
+
+
+async def run(args: list[str]) -> int:
+    """
+    Run an adb command line.
+    :param args: The arguments, without the executable.
+    :return: The exit code.
+    """
+    client = AdbClient()
+    serial = None
+    if args[:1] == ["-s"] and len(args) > 1:
+        serial, args = args[1], args[2:]
+    if args[:1] == ["version"]:
+        sys.stdout.write("Android Debug Bridge version 1.0.41\nVersion fake\n")
+        return 0
+    if args[:1] == ["devices"]:
+        try:
+            listing = await client.devices()
+        except OSError as e:
+            sys.stderr.write(f"adb: cannot connect to daemon: {e}\n")
+            return 1
+        sys.stdout.write("List of devices attached\n" + listing + "\n")
+        return 0
+    if args[:1] == ["shell"] and serial is not None:
+        if len(args) > 1:
+            return await _shell(client, serial, " ".join(args[1:]))
+        return await _interactive(client, serial)
+    sys.stderr.write(f"adb: unsupported command {' '.join(args)}\n")
+    return 1
+
+
+def main(argv=None):
+    sys.exit(asyncio.run(run(sys.argv[1:] if argv is None else argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""
+A stand-in for the adb server that serves fake devices over the adb host protocol.
+It is used by the tests and the benchmarks, and can be run on its own to try the
+application without hardware:
+
+    python -m src.fake_adb_server --port 5037 --devices 2 --packages 300 --command-latency 0.05
+
+Latency can be added to every request and to every command a device runs, with jitter,
+and package changes can be made to fail at a given rate, so throughput can be measured
+under conditions close to real devices. ``src/fake_adb.py`` is the matching ``adb``
+executable for the code paths that spawn it.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import re
+import shlex
+import struct
+
+from .adb_client import SHELL_EXIT, SHELL_STDERR, SHELL_STDOUT
+
+logger = logging.getLogger(__name__)
+
+# Largest packet payload adbd sends
+MAX_PAYLOAD = 1 << 18
+DEFAULT_FEATURES = "shell_v2,cmd,stat_v2,ls_v2,fixed_push_mkdir,apex,abb,abb_exec"
+# pm verbs changing a package, the ones failure injection applies to
+CHANGING_VERBS = {"disable-user", "enable", "uninstall", "install-existing"}
+# Redirections the fake shell accepts and ignores, besides 2>&1
+REDIRECTION = re.compile(r"\d?(<|>>?)(&\d|\S+)")
+
+
+class FakeDevice:
+    """A device with a package list that understands the pm commands used by the app."""
+
+    def __init__(
+        self,
+        serial,
+        model="Pixel_7",
+        state="device",
+        packages=None,
+        shell_v2=True,
+        failure_rate=0.0,
+        seed=None,
+    ):
+        self.serial = serial
+        self.model = model
+        self.state = state
+        self.features = DEFAULT_FEATURES if shell_v2 else "cmd"
+        # Share of package changes failing with an internal error
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        # Commands run so far, echo left out
+        self.command_count = 0
+        # package name -> {"enabled": bool, "installed": bool, "uid": int, "version_code": int,
+        #                  "system": bool, "installer": str | None}
+        self.packages = {
+            name: {
+                "enabled": True,
+                "installed": True,
+                "uid": 10000 + i,
+                "version_code": 1,
+                "system": name.startswith("com.android."),
+                "installer": None if name.startswith("com.android.") else "com.android.vending",
+            }
+            for i, name in enumerate(packages if packages is not None else default_packages(20))
+        }
+
+    def path(self, name: str) -> str:
+        if self.packages[name]["system"]:
+            return f"/system/priv-app/{name}/{name}.apk"
+        return f"/data/app/~~{name}==/{name}-1==/base.apk"
+
+    def describe(self) -> str:
+        if self.state != "device":
+            return f"{self.serial}\t{self.state}"
+        return (
+            f"{self.serial}\tdevice product:{self.model.lower()} model:{self.model} "
+            f"device:{self.model.lower()} transport_id:1"
+        )
+
+    def shell(self, command: str) -> tuple[str, str, int]:
+        """
+        Run a shell command on the fake device. Commands are separated by ; or new lines
+        and can be grouped in { }, $? expands to the exit code of the last command and a
+        group's 2>&1 sends its stderr to stdout.
+        :return: The stdout, stderr and exit code of the command.
+        """
+        try:
+            lexer = shlex.shlex(command, posix=True, punctuation_chars=";\n")
+            lexer.whitespace = " \t\r"
+            lexer.whitespace_split = True
+            statements, _ = self._parse(list(lexer), 0)
+        except ValueError as e:
+            return "", f"/system/bin/sh: syntax error: {e}\n", 1
+        stdout, stderr = [], []
+        returncode = self._evaluate(statements, stdout, stderr, 0)
+        return "".join(stdout), "".join(stderr), returncode
+
+    def _parse(self, tokens: list[str], position: int, nested=False) -> tuple[list, int]:
+        """
+        Parse commands up to the end of the tokens or the } closing a group.
+        :return: The statements, each a list of arguments or a (statements, redirections)
+         group, and the position after the last token read.
+        """
+        statements, args = [], []
+        while position < len(tokens):
+            token = tokens[position]
+            position += 1
+            if set(token) <= set(";\n"):
+                if args:
+                    statements.append(args)
+                    args = []
+            elif token == "{" and not args:
+                body, position = self._parse(tokens, position, nested=True)
+                redirections = []
+                while position < len(tokens) and REDIRECTION.fullmatch(tokens[position]):
+                    redirections.append(tokens[position])
+                    position += 1
+                statements.append((body, redirections))
+            elif token == "}" and nested and not args:
+                return statements, position
+            else:
+                args.append(token)
+        if nested:
+            raise ValueError("missing }")
+        if args:
+            statements.append(args)
+        return statements, position
+
+    def _evaluate(self, statements, stdout, stderr, returncode) -> int:
+        for statement in statements:
+            if isinstance(statement, tuple):
+                body, redirections = statement
+                merged = stdout if "2>&1" in redirections else stderr
+                returncode = self._evaluate(body, stdout, merged, returncode)
+                continue
+            args = [
+                arg.replace("$?", str(returncode))
+                for arg in statement
+                if not REDIRECTION.fullmatch(arg)
+            ]
+            out, err, returncode = self.run(args)
+            stdout.append(out)
+            stderr.append(err)
+        return returncode
+
+    def run(self, args: list[str]) -> tuple[str, str, int]:
+        if not args:
+            return "", "", 0
+        if args[0] == "echo":
+            return " ".join(args[1:]) + "\n", "", 0
+        self.command_count += 1
+        if args[0] == "pm" and len(args) > 1:
+            return self.pm(args[1], args[2:])
+        if args[:2] == ["cmd", "package"] and len(args) > 2:
+            return self.pm(args[2], args[3:])
+        if args[:2] == ["dumpsys", "package"]:
+            return self.dumpsys_package(), "", 0
+        return "", f"/system/bin/sh: {args[0]}: inaccessible or not found\n", 127
+
+    def dumpsys_package(self) -> str:
+        """The Packages section of ``dumpsys package`` in the layout used by Android 12."""
+        lines = ["Packages:"]
+        for name, state in self.packages.items():
+            lines += [
+                f"  Package [{name}] ({state['uid']:x}):",
+                f"    userId={state['uid']}",
+                f"    codePath={self.path(name).rsplit('/', 1)[0]}",
+                f"    versionCode={state['version_code']} minSdk=28 targetSdk=33",
+                "    versionName=1.0",
+                f"    flags=[ {'SYSTEM ' if state['system'] else ''}HAS_CODE ALLOW_CLEAR_USER_DATA ]",
+                f"    installerPackageName={state['installer'] or 'null'}",
+                f"    User 0: ceDataInode=0 installed={str(state['installed']).lower()} "
+                f"hidden=false suspended=false stopped=false notLaunched=false "
+                f"enabled={0 if state['enabled'] else 3} instant=false virtual=false",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def pm(self, verb: str, args: list[str]) -> tuple[str, str, int]:
+        options = [arg for arg in args if arg.startswith("-")]
+        names = [arg for arg in args if not arg.startswith("-") and arg != "0"]
+        if verb == "list" and names[:1] == ["packages"]:
+            lines = [
+                "package:"
+                + (f"{self.path(name)}=" if "-f" in options else "")
+                + name
+                + (
+                    f" versionCode:{state['version_code']}"
+                    if "--show-versioncode" in options
+                    else ""
+                )
+                + (f"  installer={state['installer']}" if "-i" in options else "")
+                + (f" uid:{state['uid']}" if "-U" in options else "")
+                + "\n"
+                for name, state in self.packages.items()
+                if (state["installed"] or "-u" in options)
+                and ("-d" not in options or not state["enabled"])
+                and ("-e" not in options or state["enabled"])
+                and ("-s" not in options or state["system"])
+                and ("-3" not in options or not state["system"])
+            ]
+            return "".join(lines), "", 0
+        name = names[-1] if names else ""
+        state = self.packages.get(name)
+        if verb in CHANGING_VERBS and self.random.random() < self.failure_rate:
+            return "", f"Failure [injected error for {name}]\n", 1
+        if verb == "disable-user":
+            if state is None or not state["installed"]:
+                return (
+                    "",
+                    f"Exception occurred while executing 'disable-user':\nUnknown package: {name}\n",
+                    255,
+                )
+            state["enabled"] = False
+            return f"Package {name} new state: disabled-user\n", "", 0
+        if verb == "enable":
+            if state is None or not state["installed"]:
+                return (
+                    "",
+                    f"Exception occurred while executing 'enable':\nUnknown package: {name}\n",
+                    255,
+                )
+            state["enabled"] = True
+            return f"Package {name} new state: enabled\n", "", 0
+        if verb == "uninstall":
+            if state is None or not state["installed"]:
+                return "Failure [not installed for 0]\n", "", 1
+            state["installed"] = False
+            return "Success\n", "", 0
+        if verb == "install-existing":
+            if state is None:
+                return f"Package {name} doesn't exist\n", "", 1
+            state["installed"] = True
+            return f"Package {name} installed for user: 0\n", "", 0
+        return "", f"Unknown command: {verb}\n", 255
+
+
+def default_packages(count: int) -> list[str]:
+    vendors = ["com.android", "com.google.android", "com.samsung.android", "com.facebook"]
+    return [f"{vendors[i % len(vendors)]}.app{i}" for i in range(count)]
+
+
+class FakeAdbServer:
+    """Serves FakeDevices on a local TCP port like the real adb server does."""
+
+    def __init__(
+        self,
+        devices=None,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        command_latency=0.0,
+        jitter=0.0,
+        seed=None,
+    ):
+        self.devices = {device.serial: device for device in devices or []}
+        self.host = host
+        self.port = port
+        # Seconds added to every request, and per command a shell request runs on a device
+        self.latency = latency
+        self.command_latency = command_latency
+        # Every delay is spread uniformly by this share of itself either way
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.server = None
+        self.requests = []
+        # Connections following host:track-devices-l
+        self._trackers = set()
+
+    def add_device(self, device: FakeDevice):
+        self.devices[device.serial] = device
+        self.notify()
+
+    def remove_device(self, serial: str):
+        self.devices.pop(serial, None)
+        self.notify()
+
+    def notify(self):
+        """Send the device list to every tracking connection, call after changing a device."""
+        message = self._message(self._listing())
+        for writer in self._trackers:
+            writer.write(message)
+
+    def _listing(self) -> str:
+        return "".join(device.describe() + "\n" for device in self.devices.values())
+
+    async def start(self) -> int:
+        """Start listening, returns the port (a free one is picked when port is 0)."""
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _pause(self, seconds: float):
+        if seconds > 0:
+            await asyncio.sleep(seconds * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+    @staticmethod
+    def _message(data: str) -> bytes:
+        payload = data.encode()
+        return b"%04x" % len(payload) + payload
+
+    async def _fail(self, writer, message: str):
+        writer.write(b"FAIL" + self._message(message))
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        device = None
+        try:
+            while True:
+                length = int(await reader.readexactly(4), 16)
+                service = (await reader.readexactly(length)).decode()
+                self.requests.append(service)
+                await self._pause(self.latency)
+                if device is None:
+                    done, device = await self._host_service(service, writer)
+                else:
+                    done = await self._device_service(device, service, writer)
+                if done:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._trackers.discard(writer)
+            writer.close()
+
+    async def _host_service(self, service: str, writer):
+        """Answer a host service, returns whether the connection is done and the device switched to."""
+        if service == "host:version":
+            writer.write(b"OKAY" + self._message("0029"))
+        elif service == "host:devices-l":
+            writer.write(b"OKAY" + self._message(self._listing()))
+        elif service == "host:track-devices-l":
+            # The connection stays open, notify writes to it on every change
+            writer.write(b"OKAY" + self._message(self._listing()))
+            self._trackers.add(writer)
+            await writer.drain()
+            return False, None
+        elif service.startswith("host:pair:"):
+            code, address = service[len("host:pair:") :].split(":", 1)
+            message = (
+                f"Successfully paired to {address} [guid=adb-fake]"
+                if code == "123456"
+                else "Failed: Wrong password or connection was dropped."
+            )
+            writer.write(b"OKAY" + self._message(message))
+        elif service.startswith("host-serial:") and service.endswith(":features"):
+            device = self.devices.get(service.split(":")[1])
+            if device is None:
+                await self._fail(writer, "device not found")
+                return True, None
+            writer.write(b"OKAY" + self._message(device.features))
+        elif service.startswith("host:transport:"):
+            device = self.devices.get(service[len("host:transport:") :])
+            if device is None or device.state != "device":
+                await self._fail(writer, f"device '{service[len('host:transport:'):]}' not found")
+                return True, None
+            writer.write(b"OKAY")
+            await writer.drain()
+            return False, device
+        else:
+            await self._fail(writer, f"unknown host service {service}")
+            return True, None
+        await writer.drain()
+        return True, None
+
+    async def _device_service(self, device: FakeDevice, service: str, writer) -> bool:
+        if service.startswith("shell,v2,raw:") and "shell_v2" in device.features:
+            stdout, stderr, returncode = await self._shell(device, service[len("shell,v2,raw:") :])
+            writer.write(b"OKAY")
+            for packet_id, data in ((SHELL_STDOUT, stdout), (SHELL_STDERR, stderr)):
+                data = data.encode()
+                # adbd splits output into packets of at most MAX_PAYLOAD bytes
+                for start in range(0, len(data), MAX_PAYLOAD):
+                    packet = data[start : start + MAX_PAYLOAD]
+                    writer.write(struct.pack("<BI", packet_id, len(packet)) + packet)
+            writer.write(struct.pack("<BI", SHELL_EXIT, 1) + bytes([returncode & 0xFF]))
+        elif service.startswith("shell:"):
+            stdout, stderr, _ = await self._shell(device, service[len("shell:") :])
+            writer.write(b"OKAY" + (stdout + stderr).encode())
+        else:
+            await self._fail(writer, f"unknown device service {service}")
+        await writer.drain()
+        return True
+
+    async def _shell(self, device: FakeDevice, command: str) -> tuple[str, str, int]:
+        """Run a shell command on a device, taking command_latency per command it ran."""
+        count = device.command_count
+        result = device.shell(command)
+        await self._pause(self.command_latency * (device.command_count - count))
+        return result
+
+
+async def serve(port: int, device_count: int, package_count: int, **options):
+    failure_rate = options.pop("failure_rate", 0.0)
+    devices = [
+        FakeDevice(
+            f"emulator-{5554 + 2 * i}",
+            packages=default_packages(package_count),
+            failure_rate=failure_rate,
+            seed=i,
+        )
+        for i in range(device_count)
+    ]
+    async with FakeAdbServer(devices, port=port, **options) as server:
+        logger.info(f"Fake adb server listening on {server.host}:{server.port}")
+        await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake adb server")
+    parser.add_argument("--port", type=int, default=5037)
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--packages", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per request")
+    parser.add_argument(
+        "--command-latency", type=float, default=0.0, help="Seconds per command run on a device"
+    )
+    parser.add_argument("--jitter", type=float, default=0.0, help="Share of every delay, 0 to 1")
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="Share of package changes failing"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(
+            serve(
+                args.port,
+                args.devices,
+                args.packages,
+                latency=args.latency,
+                command_latency=args.command_latency,
+                jitter=args.jitter,
+                failure_rate=args.failure_rate,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
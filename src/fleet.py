@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+
+from .pkg_manager import ActionResults, PackageManager
+
+
+class FleetManager:
+    """Applies one action plan to many devices at once."""
+
+    logger = logging.getLogger(__name__)
+    # Batches in flight across all devices
+    max_concurrency = 32
+    # Batches in flight on a single device, each using its own shell session
+    per_device_concurrency = 2
+
+    @classmethod
+    async def apply_actions(
+        cls, serial_numbers, action_form, max_concurrency=None, per_device_concurrency=None
+    ) -> dict[str, dict]:
+        """
+        Perform the actions of an action form on every given device concurrently.
+        :param serial_numbers: Serial numbers of the devices to apply the actions on.
+        :param action_form: A dictionary containing the action to perform on each package.
+        :param max_concurrency: Cap on the batches in flight over the whole fleet.
+        :param per_device_concurrency: Cap on the batches in flight on one device.
+        :return: A report per serial number with the succeeded, failed and skipped packages,
+         the time spent on the device and an error message if the device could not be handled.
+        """
+        cls.logger.info(f"Applying actions on {len(serial_numbers)} devices")
+        return await cls._run(
+            serial_numbers,
+            lambda serial_number, **options: PackageManager.apply_actions(
+                serial_number, action_form, **options
+            ),
+            max_concurrency,
+            per_device_concurrency,
+        )
+
+    @classmethod
+    async def restore_actions(
+        cls,
+        serial_numbers,
+        since=None,
+        packages=None,
+        max_concurrency=None,
+        per_device_concurrency=None,
+    ) -> dict[str, dict]:
+        """
+        Undo the journaled disable and uninstall actions of every given device concurrently.
+        :param serial_numbers: Serial numbers of the devices to restore.
+        :param since: Only undo the actions performed at or after this Unix time.
+        :param packages: Only undo the actions on these packages.
+        :param max_concurrency: Cap on the batches in flight over the whole fleet.
+        :param per_device_concurrency: Cap on the batches in flight on one device.
+        :return: A report per serial number, like apply_actions.
+        """
+        cls.logger.info(f"Restoring packages on {len(serial_numbers)} devices")
+        return await cls._run(
+            serial_numbers,
+            lambda serial_number, **options: PackageManager.restore_actions(
+                serial_number, since=since, packages=packages, **options
+            ),
+            max_concurrency,
+            per_device_concurrency,
+        )
+
+    @classmethod
+    async def _run(
+        cls, serial_numbers, act, max_concurrency, per_device_concurrency
+    ) -> dict[str, dict]:
+        """
+        Run act(serial_number, concurrency=..., limiter=...) on every device concurrently.
+        :return: A report per serial number with the succeeded, failed and skipped packages,
+         the time spent on the device and an error message if the device could not be handled.
+        """
+        limiter = asyncio.Semaphore(max_concurrency or cls.max_concurrency)
+        concurrency = per_device_concurrency or cls.per_device_concurrency
+        serial_numbers = list(dict.fromkeys(serial_numbers))
+
+        async def run(serial_number):
+            start = time.perf_counter()
+            error = None
+            try:
+                results = await act(serial_number, concurrency=concurrency, limiter=limiter)
+            except Exception as e:
+                cls.logger.error(f"[ERROR] Failed to apply actions on {serial_number} because {e}")
+                results, error = ActionResults(), str(e)
+            return {
+                "serial_number": serial_number,
+                "succeeded": [
+                    pkg
+                    for pkg, succeeded in results.items()
+                    if succeeded and pkg not in results.skipped
+                ],
+                "failed": [pkg for pkg, succeeded in results.items() if not succeeded],
+                "skipped": list(results.skipped),
+                "duration": time.perf_counter() - start,
+                "error": error,
+            }
+
+        reports = await asyncio.gather(*(run(serial) for serial in serial_numbers))
+        return dict(zip(serial_numbers, reports))
@@ -0,0 +1,220 @@
+"""
+Background queue for package actions.
+A job is the action form of one device. Jobs and the state of each of their packages are
+kept in the database, the progress of running jobs is also published on an ActionRun for
+live followers. Jobs left queued or running by a previous process are queued again on
+start, with only the packages not done yet.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from .db import db_manager
+from .pkg_manager import PackageManager
+from .progress import progress_registry
+
+# Job statuses, the last three are final
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = (
+    "queued",
+    "running",
+    "succeeded",
+    "failed",
+    "cancelled",
+)
+ACTIVE = (QUEUED, RUNNING)
+# Item statuses, besides the final job statuses. Skipped items were already in the state
+# their action leads to.
+PENDING, STARTED, SKIPPED = "pending", "started", "skipped"
+
+
+class JobQueue:
+    """Runs queued jobs on a pool of workers, one job per worker at a time."""
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        # Task and end of the job run by each busy worker
+        self._running: dict[int, tuple[asyncio.Task, asyncio.Event]] = {}
+
+    async def start(self):
+        """Queue the jobs a previous process left unfinished and start the workers."""
+        for job in reversed(await db_manager.list_jobs(ACTIVE)):
+            await db_manager.update_job(job["id"], status=QUEUED)
+            await db_manager.update_job_items(job["id"], statuses=[STARTED], status=PENDING)
+            self._follow(job["id"], job["serial_number"], await self._operations(job["id"]))
+            self._queue.put_nowait(job["id"])
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """
+        Stop the workers, interrupting the jobs they run. Those jobs stay running in the
+        database, so the next start queues them again.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, serial_number: str, action_form: dict) -> int:
+        """
+        Queue the actions of an action form on a device.
+        :param serial_number: Serial number of the device.
+        :param action_form: A dictionary containing the action to perform on each package.
+        :return: The id of the job.
+        """
+        operations = PackageManager.form_operations(action_form)
+        job_id = await db_manager.create_job(serial_number, operations)
+        self._follow(job_id, serial_number, operations)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id: int) -> dict | None:
+        """
+        :return: The job with its items, or None for an unknown job.
+        """
+        job = await db_manager.get_job(job_id)
+        if job is not None:
+            job["items"] = await db_manager.get_job_items(job_id)
+        return job
+
+    async def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a queued or running job, the packages already done stay done.
+        :return: False if the job is unknown or already over.
+        """
+        job = await db_manager.get_job(job_id)
+        if job is None or job["status"] not in ACTIVE:
+            return False
+        # Only cancelled here while no worker took it, a worker takes a job the same way
+        if job_id not in self._running and await db_manager.update_job_if(
+            job_id, QUEUED, status=CANCELLED, finished_at=time.time(), error="Cancelled"
+        ):
+            await db_manager.update_job_items(job_id, statuses=[PENDING, STARTED], status=CANCELLED)
+            self._finish_run(job_id)
+            return True
+        if job_id not in self._running:  # over in the meantime
+            return False
+        task, ended = self._running[job_id]
+        task.cancel()
+        await ended.wait()
+        return True
+
+    @staticmethod
+    def _follow(job_id, serial_number, operations):
+        if progress_registry.get(str(job_id)) is None:
+            progress_registry.create(serial_number, operations, run_id=str(job_id))
+
+    @staticmethod
+    async def _operations(job_id) -> list[tuple[str, str]]:
+        return [
+            (item["package"], item["action"])
+            for item in await db_manager.get_job_items(job_id)
+            if item["status"] in (PENDING, STARTED)
+        ]
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"[ERROR] Failed to run job {job_id} because {e}")
+                await self._finish(job_id, FAILED, str(e))
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id):
+        ended = asyncio.Event()
+        # Registered before anything is awaited, so cancel() finds every job a worker took
+        task = asyncio.create_task(self._execute(job_id))
+        self._running[job_id] = task, ended
+        try:
+            # Waiting on the task instead of awaiting it keeps a cancelled job from
+            # cancelling the worker
+            await asyncio.wait([task])
+            if task.cancelled():
+                # The run is not finished when the job was cancelled before it started
+                self._finish_run(job_id)
+                await self._finish(job_id, CANCELLED, "Cancelled")
+            else:
+                task.result()
+        except asyncio.CancelledError:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+        finally:
+            del self._running[job_id]
+            ended.set()
+
+    async def _execute(self, job_id):
+        if not await db_manager.update_job_if(
+            job_id, QUEUED, status=RUNNING, started_at=time.time()
+        ):
+            return  # cancelled while queued
+        job = await db_manager.get_job(job_id)
+        operations = await self._operations(job_id)
+        run = progress_registry.get(str(job_id))
+        if run is None:  # dropped from the registry while queued
+            run = progress_registry.create(job["serial_number"], operations, run_id=str(job_id))
+        action_form = {f"action_{package}": action for package, action in operations}
+        task = run.task = asyncio.create_task(PackageManager.run_actions(run, action_form))
+        recorder = asyncio.create_task(self._record(job_id, run))
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            # Finished already unless run_actions never got to start, the recorder then
+            # writes down what the run got to
+            run.finish(error="Cancelled")
+            await asyncio.gather(recorder, return_exceptions=True)
+            raise
+        await recorder
+        done = run.events[-1]
+        if done.get("error") == "Cancelled":
+            await self._finish(job_id, CANCELLED, "Cancelled")
+        elif done.get("error") or done.get("failed"):
+            await self._finish(job_id, FAILED, done.get("error"))
+        else:
+            await self._finish(job_id, SUCCEEDED)
+
+    @staticmethod
+    def _finish_run(job_id):
+        run = progress_registry.get(str(job_id))
+        if run is not None:
+            run.finish(error="Cancelled")
+
+    @staticmethod
+    async def _record(job_id, run):
+        """
+        Store the state of every package as the run publishes it, the events published
+        while the previous batch was written go in one transaction.
+        """
+        async for batch in run.batches():
+            updates = [
+                (event["package"], event["type"], event.get("duration"), event.get("output"))
+                for event in batch
+                if event["type"] in (STARTED, SUCCEEDED, FAILED, SKIPPED)
+            ]
+            if updates:
+                await db_manager.record_job_items(job_id, updates)
+
+    @staticmethod
+    async def _finish(job_id, status, error=None):
+        # Packages never reached share the fate of the job
+        await db_manager.update_job_items(
+            job_id,
+            statuses=[PENDING, STARTED],
+            status=CANCELLED if status == CANCELLED else FAILED,
+        )
+        await db_manager.update_job(job_id, status=status, finished_at=time.time(), error=error)
+
+
+job_queue = JobQueue(workers=int(os.getenv("BLOATWARE_JOB_WORKERS", "4")))
@@ -0,0 +1,216 @@
+"""
+Bundled knowledge base of package IDs with their vendor, a description, how safe they
+are to remove and which packages depend on them.
+The entries ship as a tab separated file. On the first lookup it is compiled into a
+SQLite index in the cache directory, keyed by the hash of the file, and opened
+read-only and memory-mapped, so neither startup nor memory grows with the number of
+entries and later runs reuse the index as long as the file does not change.
+Hashing the file, building the index and lookups block on disk, the application calls
+them from the thread pool (open, asyncio.to_thread), never on the event loop.
+"""
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+
+from .models import KnowledgeEntry
+
+# From safe to remove to leaving the phone unusable
+SAFETY_TIERS = ("recommended", "advanced", "expert", "unsafe")
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE = os.path.join(script_dir, "data", "knowledge_base.tsv")
+DEFAULT_CACHE_DIR = os.environ.get(
+    "BLOATWARE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "bloatware-remover")
+)
+COLUMNS = ("package", "vendor", "tier", "description", "required_by")
+
+
+class KnowledgeBase:
+    """
+    Lookups of packages in the knowledge base.
+    Entries looked up are kept in memory, misses included, so rendering the same
+    inventory again does not touch the index. Safe to use from several threads.
+    """
+
+    logger = logging.getLogger(__name__)
+    # Packages whose entry (or lack of one) is kept in memory
+    max_cached_entries = 8192
+    # Names bound to one query, well below SQLITE_MAX_VARIABLE_NUMBER
+    chunk_size = 500
+    # Bytes of the index mapped into memory
+    mmap_size = 64 * 1024 * 1024
+
+    def __init__(self, source: str = DEFAULT_SOURCE, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.source = source
+        self.cache_dir = cache_dir
+        self._connection: sqlite3.Connection | None = None
+        self._version: str | None = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def open(self):
+        """Hash the source and open the index in a thread, building it when needed, once."""
+        if self._connection is None:
+            await asyncio.to_thread(self._open)
+
+    def _open(self):
+        with self._lock:
+            self._connect()
+
+    @property
+    def version(self) -> str:
+        """Hash of the source file, changes whenever an entry does."""
+        if self._version is None:
+            digest = hashlib.sha1()
+            with open(self.source, "rb") as source:
+                for block in iter(lambda: source.read(1 << 16), b""):
+                    digest.update(block)
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.cache_dir, f"knowledge-{self.version}.sqlite")
+
+    def lookup(self, package: str) -> KnowledgeEntry | None:
+        return self.lookup_many([package]).get(package)
+
+    def lookup_many(self, packages) -> dict[str, KnowledgeEntry]:
+        """
+        Look up many packages at once.
+        :param packages: Package names, e.g. the names on one page of an inventory.
+        :return: The entries of the known packages by name, unknown ones are left out.
+        """
+        with self._lock:
+            return self._lookup_many(packages)
+
+    def _lookup_many(self, packages) -> dict[str, KnowledgeEntry]:
+        found = {}
+        missing = []
+        for package in packages:
+            if package in self._entries:
+                self._entries.move_to_end(package)
+                entry = self._entries[package]
+                if entry is not None:
+                    found[package] = entry
+            else:
+                missing.append(package)
+        if not missing:
+            return found
+        missing = list(dict.fromkeys(missing))
+        rows = {}
+        try:
+            connection = self._connect()
+            for start in range(0, len(missing), self.chunk_size):
+                chunk = missing[start : start + self.chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                rows.update(
+                    (row[0], row)
+                    for row in connection.execute(
+                        f"SELECT {', '.join(COLUMNS)} FROM entries WHERE package IN ({placeholders})",
+                        chunk,
+                    )
+                )
+        except (OSError, sqlite3.Error) as e:
+            self.logger.error(f"[ERROR] Failed to read the knowledge base because {e}")
+            return found
+        for package in missing:
+            row = rows.get(package)
+            entry = None
+            if row is not None:
+                entry = KnowledgeEntry(*row[:4], tuple(filter(None, row[4].split(","))))
+                found[package] = entry
+            self._remember(package, entry)
+        return found
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self._entries.clear()
+
+    def read_entries(self):
+        """
+        Parse the source file.
+        :return: An iterator of KnowledgeEntry, malformed lines are logged and skipped.
+        """
+        with open(self.source, encoding="utf-8") as source:
+            for number, line in enumerate(source, 1):
+                line = line.rstrip("\n")
+                if not line or line.startswith("#") or line.startswith("package\t"):
+                    continue
+                fields = line.split("\t")
+                if len(fields) != len(COLUMNS) or fields[2] not in SAFETY_TIERS:
+                    self.logger.warning(f"Skipping line {number} of {self.source}")
+                    continue
+                yield KnowledgeEntry(*fields[:4], tuple(filter(None, fields[4].split(","))))
+
+    def _remember(self, package: str, entry: KnowledgeEntry | None):
+        self._entries[package] = entry
+        while len(self._entries) > self.max_cached_entries:
+            self._entries.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is not None:
+            return self._connection
+        try:
+            if not os.path.exists(self.index_path):
+                self._build_file(self.index_path)
+            # Lookups run on whichever thread of the pool is free, one at a time
+            connection = sqlite3.connect(
+                f"file:{self.index_path}?mode=ro", uri=True, check_same_thread=False
+            )
+            connection.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        except (OSError, sqlite3.Error) as e:
+            self.logger.warning(f"Keeping the knowledge base in memory because {e}")
+            connection = sqlite3.connect(":memory:", check_same_thread=False)
+            self._build(connection)
+        self._connection = connection
+        return connection
+
+    def _build_file(self, path: str):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Built next to the index and moved in place, so a concurrent reader never
+        # sees a half-written index
+        descriptor, temporary = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(descriptor)
+        try:
+            connection = sqlite3.connect(temporary)
+            try:
+                self._build(connection)
+            finally:
+                connection.close()
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.logger.info(f"Built the knowledge base index {path}")
+
+    def _build(self, connection: sqlite3.Connection):
+        connection.execute(
+            "CREATE TABLE entries (package TEXT PRIMARY KEY, vendor TEXT, tier TEXT,"
+            " description TEXT, required_by TEXT) WITHOUT ROWID"
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    entry.package,
+                    entry.vendor,
+                    entry.tier,
+                    entry.description,
+                    ",".join(entry.required_by),
+                )
+                for entry in self.read_entries()
+            ),
+        )
+        connection.commit()
+
+
+knowledge_base = KnowledgeBase()
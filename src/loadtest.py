@@ -0,0 +1,306 @@
+"""
+Load generator driving the web application the way browsers do, to find how many
+concurrent users it serves before latency collapses.
+
+    bloatware-remover loadtest --users 1,10,50,100 --duration 10
+    bloatware-remover loadtest --url http://localhost:8000 --users 20
+
+Every virtual user loops over one flow: list devices (/), select one (/select-device),
+view its packages (/packages) and apply actions (/apply-actions), toggling a few packages
+between disabled and enabled. Applying actions queues a job, the step is timed until the
+job is over (polling /api/v1/jobs/<id>) and is an error unless the job succeeded. Each
+level of --users runs for --duration seconds and gets its own report: throughput, latency
+percentiles overall and per step, errors, and the lag of the event loop the generator
+runs on. The jobs still queued or running after a level are waited for before the next.
+
+Without --url the application runs in this process on the fake adb server, with the
+latency options of src/fake_adb_server.py. It then shares its event loop with the
+generator, so the loop lag is the server's. With --url, the server must be running
+already, typically against ``python -m src.fake_adb_server``.
+Requires httpx, which the application itself does not need.
+"""
+
+import argparse
+import asyncio
+from contextlib import AsyncExitStack
+import json
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+
+try:
+    import httpx
+except ImportError:  # Only the load generator needs it
+    httpx = None
+
+from .adb_client import Adb, AdbClient
+from .fake_adb import write_executable
+from .fake_adb_server import FakeAdbServer, FakeDevice, default_packages
+
+logger = logging.getLogger(__name__)
+
+STEPS = ("list_devices", "select_device", "view_packages", "apply_actions")
+# Seconds between two polls of a job, and at most spent waiting for jobs to be over
+JOB_POLL_INTERVAL = 0.05
+JOB_TIMEOUT = 120.0
+# Where /apply-actions sends the browser once the job is queued
+JOB_LOCATION = re.compile(r"/actions/(\d+)$")
+
+
+def percentile(values: list[float], share: float) -> float:
+    """:return: The nearest-rank percentile of the values, 0.0 when there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def _milliseconds(values: list[float]) -> dict[str, float]:
+    return {
+        name: round(percentile(values, share) * 1e3, 2)
+        for name, share in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+    }
+
+
+class LoadStats:
+    """Latencies and errors of every step of the flow during one load level."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {step: [] for step in STEPS}
+        self.errors: dict[str, int] = {step: 0 for step in STEPS}
+        self.lags: list[float] = []
+
+    def record(self, step: str, seconds: float, ok: bool):
+        self.latencies[step].append(seconds)
+        if not ok:
+            self.errors[step] += 1
+
+    def summary(self, users: int, elapsed: float) -> dict:
+        latencies = [latency for step in STEPS for latency in self.latencies[step]]
+        return {
+            "users": users,
+            "requests": len(latencies),
+            "errors": sum(self.errors.values()),
+            "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": _milliseconds(latencies),
+            "steps": {
+                step: {
+                    "requests": len(self.latencies[step]),
+                    "errors": self.errors[step],
+                    **_milliseconds(self.latencies[step]),
+                }
+                for step in STEPS
+            },
+            "event_loop_lag_ms": _milliseconds(self.lags),
+        }
+
+
+async def monitor_loop(stats: LoadStats, interval: float = 0.01):
+    """Record how late the event loop wakes up from a sleep of interval seconds, until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        stats.lags.append(max(loop.time() - started - interval, 0.0))
+
+
+async def wait_for_job(client, response) -> bool:
+    """
+    Follow the job an /apply-actions response was redirected to until it is over.
+    :return: Whether the job succeeded.
+    """
+    match = JOB_LOCATION.search(response.headers.get("location", ""))
+    if response.status_code != 303 or match is None:
+        return False
+    deadline = time.perf_counter() + JOB_TIMEOUT
+    while time.perf_counter() < deadline:
+        response = await client.get(f"/api/v1/jobs/{match.group(1)}")
+        if response.status_code != 200:
+            return False
+        status = response.json()["status"]
+        if status not in ("queued", "running"):
+            return status == "succeeded"
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+    logger.debug(f"Job {match.group(1)} not over after {JOB_TIMEOUT}s")
+    return False
+
+
+async def drain_jobs(client):
+    """Wait until no job is queued or running, so a level does not inherit the last one's."""
+    deadline = time.perf_counter() + JOB_TIMEOUT
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get("/api/v1/jobs", params={"status": ["queued", "running"]})
+            if response.status_code != 200 or not response.json()["jobs"]:
+                return
+        except httpx.HTTPError as e:
+            logger.debug(f"Listing jobs failed: {e}")
+            return
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+    logger.warning(f"Jobs still outstanding after {JOB_TIMEOUT}s")
+
+
+async def user_flow(client, serial: str, packages: list[str], stats: LoadStats, deadline: float):
+    """Run the flow of one user against a device until the deadline."""
+    iteration = 0
+    while time.perf_counter() < deadline:
+        action = "disable" if iteration % 2 == 0 else "enable"
+        requests = (
+            ("list_devices", "GET", "/", None),
+            ("select_device", "POST", "/select-device", {"selected_device": serial}),
+            ("view_packages", "GET", "/packages", None),
+            ("apply_actions", "POST", "/apply-actions", {f"action_{p}": action for p in packages}),
+        )
+        for step, method, path, data in requests:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, data=data)
+                if step == "apply_actions":
+                    ok = await wait_for_job(client, response)
+                else:
+                    ok = response.status_code < 400
+            except httpx.HTTPError as e:
+                logger.debug(f"{step} failed: {e}")
+                ok = False
+            stats.record(step, time.perf_counter() - started, ok)
+        iteration += 1
+
+
+async def run_level(client, devices: dict[str, list[str]], users: int, duration: float) -> dict:
+    """
+    Run users concurrent flows for duration seconds, user n working on the n-th device
+    (round robin), then wait for the jobs left over.
+    :param devices: Package names to act on by serial number.
+    :return: The summary of the level.
+    """
+    stats = LoadStats()
+    serials = list(devices)
+    monitor = asyncio.create_task(monitor_loop(stats))
+    started = time.perf_counter()
+    deadline = started + duration
+    try:
+        await asyncio.gather(
+            *(
+                user_flow(client, serial, devices[serial], stats, deadline)
+                for serial in (serials[user % len(serials)] for user in range(users))
+            )
+        )
+    finally:
+        monitor.cancel()
+        await asyncio.gather(monitor, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    await drain_jobs(client)
+    return stats.summary(users, elapsed)
+
+
+async def discover(client, actions: int) -> dict[str, list[str]]:
+    """
+    Find the devices to drive and the user packages to act on, through the JSON API.
+    :return: Package names by serial number, devices without user packages left out.
+    """
+    response = await client.get("/api/v1/devices")
+    response.raise_for_status()
+    devices = {}
+    for device in response.json()["devices"]:
+        serial = device["serial_number"]
+        response = await client.get(
+            f"/api/v1/devices/{serial}/packages", params={"kind": "user", "per_page": actions}
+        )
+        if response.status_code == 200:
+            names = [package["name"] for package in response.json()["packages"]]
+            if names:
+                devices[serial] = names
+    return devices
+
+
+async def _in_process_client(args, stack: AsyncExitStack):
+    """Start the application in this process on fake devices and a client talking to it."""
+    # Importing the application pulls all of it, which the --url mode does not need
+    from .app import app
+
+    directory = stack.enter_context(tempfile.TemporaryDirectory())
+    os.environ["PATH"] = write_executable(directory) + os.pathsep + os.environ["PATH"]
+    devices = [
+        FakeDevice(
+            f"emulator-{5554 + 2 * i}",
+            packages=default_packages(args.packages),
+            failure_rate=args.failure_rate,
+            seed=i,
+        )
+        for i in range(args.devices)
+    ]
+    server = await stack.enter_async_context(
+        FakeAdbServer(
+            devices,
+            latency=args.latency / 1e3,
+            command_latency=args.command_latency / 1e3,
+            jitter=args.jitter,
+        )
+    )
+    os.environ["ANDROID_ADB_SERVER_PORT"] = str(server.port)
+    Adb.client = AdbClient(port=server.port)
+    Adb.backend = "native"
+    await stack.enter_async_context(app.router.lifespan_context(app))
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=60.0
+    )
+
+
+async def run(args) -> dict:
+    async with AsyncExitStack() as stack:
+        if args.url:
+            client = httpx.AsyncClient(
+                base_url=args.url, timeout=60.0, limits=httpx.Limits(max_connections=None)
+            )
+        else:
+            client = await _in_process_client(args, stack)
+        client = await stack.enter_async_context(client)
+        devices = await discover(client, args.actions)
+        if not devices:
+            raise RuntimeError("No device with user packages to act on")
+        levels = []
+        for users in args.users:
+            logger.info(f"Running {users} users for {args.duration}s")
+            levels.append(await run_level(client, devices, users, args.duration))
+        return {"target": args.url or "in-process", "devices": len(devices), "levels": levels}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="bloatware-remover loadtest", description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument("--url", help="base URL of a running server, in-process by default")
+    parser.add_argument(
+        "--users",
+        type=lambda value: [int(users) for users in value.split(",")],
+        default=[1, 10, 50],
+        help="comma separated numbers of concurrent users, one load level each",
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--actions", type=int, default=5, help="packages toggled per flow")
+    parser.add_argument("--devices", type=int, default=4, help="fake devices (in-process)")
+    parser.add_argument("--packages", type=int, default=200, help="packages per fake device")
+    parser.add_argument("--latency", type=float, default=1.0, help="ms per adb request")
+    parser.add_argument("--command-latency", type=float, default=5.0, help="ms per device command")
+    parser.add_argument("--jitter", type=float, default=0.2, help="share of every delay")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args(argv)
+    if httpx is None:
+        print("The load generator needs httpx: pip install httpx", file=sys.stderr)
+        sys.exit(1)
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as result_file:
+            result_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,74 @@
-from contextlib import asynccontextmanager
+"""
+Command line entry point. The web application (src/app.py) and the server are only
+imported once a command needs them, so ``--help`` and the subcommands start right away,
+and the application is imported while ``check_adb`` runs.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import sys
+import threading
+import time
 
-from fastapi import FastAPI
-import uvicorn
-
-from src.db import db_manager
-from src.routes import router
+from src.startup import startup_timer
 from src.utils import check_adb, show_cli_help
 
 logger = logging.getLogger(__name__)
+PORT = 8000
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    await db_manager.connect()
-    if not await db_manager.is_connected():
-        logger.error("Failed to connect to the db")
-        sys.exit(1)
-    logger.info("Connected to database")
-    await db_manager.create_tables()
-    logger.info("Created db tables")
-    yield
-    await db_manager.close()
-    logger.info("Closed db connection")
-
-
-app = FastAPI(
-    title="Bloatware Remover",
-    description="A modern web-based tool for safely removing bloatware from Android devices using ADB",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc",
-    lifespan=lifespan,
-)
-app.include_router(router)
-
-
-def start_server():
+def __getattr__(name):
+    # src.main:app keeps working for uvicorn and older imports
+    if name == "app":
+        from src.app import app
+
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _check_adb() -> bool:
+    start = time.perf_counter()
+    try:
+        return check_adb()
+    finally:
+        startup_timer.add("check adb (concurrent)", start, time.perf_counter())
+
+
+def report_startup(server, port: int = PORT):
+    """Wait for the server to listen, time a first request and print the startup phases."""
+    import urllib.error
+    import urllib.request
+
+    while not server.started:
+        if server.should_exit:
+            return
+        time.sleep(0.005)
+    startup_timer.mark("listening")
+    with startup_timer.phase("first response (GET /)"):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=60).read()
+        except urllib.error.HTTPError:
+            pass  # A response all the same
+        except OSError as e:
+            logger.error(f"[ERROR] Failed to request the first page because {e}")
+    print("Startup profile\n" + startup_timer.report(), file=sys.stderr)
+
+
+def start_server(app, startup_profile: bool = False):
     """Start the web server"""
+    import uvicorn
+
     logger.info(" Starting Bloatware Remover...")
-    logger.info("📱 Open your browser and go to: http://localhost:8000")
+    logger.info(f"📱 Open your browser and go to: http://localhost:{PORT}")
     logger.info("⏹️  Press Ctrl+C to stop the application")
 
     try:
-        uvicorn.run(
-            app,
-            host="0.0.0.0",
-            port=8000,
-            reload=False,
-            log_level="info",
-        )
+        with startup_timer.phase("server setup"):
+            config = uvicorn.Config(app, host="0.0.0.0", port=PORT, reload=False, log_level="info")
+            server = uvicorn.Server(config)
+        if startup_profile:
+            threading.Thread(target=report_startup, args=(server,), daemon=True).start()
+        server.run()
     except KeyboardInterrupt:
         logger.info("Shutting down Bloatware Remover...")
     except Exception as e:
@@ -63,10 +81,27 @@ def main():
     if len(sys.argv) > 1 and sys.argv[1] == "--help":
         show_cli_help()
         return
-    if not check_adb():
-        sys.exit(1)
+    if sys.argv[1:2] == ["loadtest"]:
+        from src.loadtest import main as loadtest
+
+        loadtest(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["fake-adb"]:
+        # The adb executable written by src.fake_adb.write_executable in a bundled build
+        from src.fake_adb import main as fake_adb
+
+        fake_adb(sys.argv[2:])
+        return
+    startup_profile = "--startup-profile" in sys.argv[1:]
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # adb version spends its time in another process, import the application meanwhile
+        adb_found = executor.submit(_check_adb)
+        with startup_timer.phase("import application"):
+            from src.app import app
+        if not adb_found.result():
+            sys.exit(1)
 
-    start_server()
+    start_server(app, startup_profile)
 
 
 if __name__ == "__main__":
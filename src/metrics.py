@@ -0,0 +1,261 @@
+"""
+Metrics in the Prometheus text exposition format, served at /metrics.
+Recording is a dict update and, for histograms, a bisect over the bucket bounds; the text
+is only built when /metrics is scraped, so an unscraped instance pays next to nothing
+(``benchmarks/bench_metrics.py``).
+
+Recorded:
+
+- http_request_duration_seconds: time to the response headers, by method, route and status
+- adb_command_duration_seconds: adb commands by command, outcome and transport
+  (server: adb server protocol, subprocess: adb executable, session: persistent shell)
+- adb_read_bytes_total: bytes read from adb, by transport
+- adb_commands_in_flight: commands running on each device
+"""
+
+from bisect import bisect_left
+import re
+import time
+
+from .tracing import record
+
+# Seconds, from a fast host request to a batch of slow package changes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# The first of these found in a shell command names it
+SHELL_COMMANDS = re.compile(
+    r"\b(pm list|pm disable-user|pm uninstall|pm enable|install-existing|dumpsys)\b"
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A named metric whose samples are kept by tuple of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _labels(self, labels: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self):
+        """:return: An iterator of exposition lines for the samples."""
+        for labels, value in self.values.items():
+            yield f"{self.name}{self._labels(labels)} {_format(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    """Counts observations per bucket, the cumulative counts are only summed on scrape."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels: tuple, value: float):
+        series = self.values.get(labels)
+        if series is None:
+            # One count per bucket and the +Inf bucket, then the sum
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for labels, series in self.values.items():
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                total += count
+                le = f'le="{_format(bound)}"'
+                yield f"{self.name}_bucket{self._labels(labels, le)} {total}"
+            yield f"{self.name}_sum{self._labels(labels)} {_format(series[-1])}"
+            yield f"{self.name}_count{self._labels(labels)} {total}"
+
+
+class MetricsRegistry:
+    """The metrics exposed at /metrics."""
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """:return: Every metric in the text exposition format."""
+        return "".join(metric.render() for metric in self.metrics)
+
+    def clear(self):
+        """Drop every sample, the metrics stay registered."""
+        for metric in self.metrics:
+            metric.values.clear()
+
+
+registry = MetricsRegistry()
+http_request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time from request to response headers.",
+        ("method", "route", "status"),
+    )
+)
+adb_command_duration = registry.register(
+    Histogram(
+        "adb_command_duration_seconds",
+        "Duration of adb commands.",
+        ("command", "outcome", "transport"),
+    )
+)
+adb_read_bytes = registry.register(
+    Counter("adb_read_bytes_total", "Bytes read from adb.", ("transport",))
+)
+adb_commands_in_flight = registry.register(
+    Gauge("adb_commands_in_flight", "adb commands running on a device.", ("serial",))
+)
+
+
+def shell_command_name(command: str) -> str:
+    """:return: The name of the first known command in a shell command line, else shell."""
+    match = SHELL_COMMANDS.search(command)
+    return match.group(1) if match else "shell"
+
+
+def host_service_name(service: str) -> str:
+    """:return: The command name of an adb server host service, e.g. devices for host:devices-l."""
+    name = service.split(":")[2 if service.startswith("host-serial:") else 1]
+    return name.removesuffix("-l")
+
+
+def adb_command_name(args: list[str]) -> tuple[str, str | None]:
+    """:return: The name of an adb command line and the serial number it targets, if any."""
+    serial = None
+    if args[1:2] == ["-s"] and len(args) > 2:
+        serial, args = args[2], args[:1] + args[3:]
+    if args[1:2] == ["shell"]:
+        return shell_command_name(" ".join(args[2:])), serial
+    return (args[1] if len(args) > 1 else args[0] if args else ""), serial
+
+
+def outcome(result) -> str:
+    """:return: The outcome label of a CommandResult."""
+    if result.timed_out:
+        return "timeout"
+    if result.returncode is None:
+        return "error"
+    return "success" if result.returncode == 0 else "failure"
+
+
+class CommandTimer:
+    """
+    Times one adb command into adb_command_duration_seconds and counts it in flight on its
+    device. Set outcome before leaving the block, an exception records error (or cancelled).
+    """
+
+    __slots__ = ("command", "transport", "serial", "outcome", "started")
+
+    def __init__(self, command: str, transport: str, serial: str | None = None):
+        self.command = command
+        self.transport = transport
+        self.serial = serial
+        self.outcome = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.serial is not None:
+            adb_commands_in_flight.inc((self.serial,))
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.serial is not None:
+            adb_commands_in_flight.dec((self.serial,))
+        if exc_type is not None:
+            # A consumer closing a stream early cancels it too
+            cancelled = exc_type.__name__ in ("CancelledError", "GeneratorExit")
+            self.outcome = "cancelled" if cancelled else "error"
+        adb_command_duration.observe(
+            (self.command, self.outcome or "success", self.transport),
+            time.perf_counter() - self.started,
+        )
+        record(
+            self.command,
+            "adb",
+            self.started,
+            transport=self.transport,
+            serial=self.serial,
+            outcome=self.outcome or "success",
+        )
+        return False
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording http_request_duration_seconds for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        recorded = False
+
+        def record(status):
+            nonlocal recorded
+            recorded = True
+            # Routes are known once the router matched, unmatched paths share one label
+            route = scope.get("route")
+            http_request_duration.observe(
+                (scope["method"], getattr(route, "path", "other"), str(status)),
+                time.perf_counter() - started,
+            )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and not recorded:
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            if not recorded:
+                record(500)
+            raise
@@ -0,0 +1,121 @@
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass(frozen=True)
+class PackageInfo:
+    """State of one package on a device."""
+
+    name: str
+    uid: int | None = None
+    version_code: int | None = None
+    enabled: bool = True
+    path: str | None = None
+    installer: str | None = None
+    system: bool = False
+
+    @classmethod
+    def from_pm_line(cls, line: str, enabled: bool = True, system: bool = False):
+        """
+        Parse one line of ``pm list packages`` output, e.g.
+        ``package:/data/app/com.example-1/base.apk=com.example versionCode:42
+        installer=com.android.vending uid:10123``.
+        :return: A PackageInfo, or None if the line is not a package line.
+        """
+        line = line.strip()
+        if not line.startswith("package:"):
+            return None
+        tokens = line[len("package:") :].split()
+        if not tokens:
+            return None
+        # With -f the APK path comes first, joined to the name by the last "="
+        path, _, name = tokens[0].rpartition("=")
+        fields = {}
+        for token in tokens[1:]:
+            key, sep, value = token.partition(":")
+            if not sep:
+                key, sep, value = token.partition("=")
+            if sep:
+                fields[key] = value
+        installer = fields.get("installer")
+        return cls(
+            name=name,
+            uid=_to_int(fields.get("uid")),
+            version_code=_to_int(fields.get("versionCode")),
+            enabled=enabled,
+            path=path or None,
+            installer=installer if installer and installer != "null" else None,
+            system=system,
+        )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class DumpsysPackage:
+    """Details of one package as reported by ``dumpsys package``."""
+
+    name: str
+    uid: int | None = None
+    code_path: str | None = None
+    version_code: int | None = None
+    version_name: str | None = None
+    installer: str | None = None
+    flags: list[str] = field(default_factory=list)
+    # State for user 0
+    installed: bool | None = None
+    enabled: bool | None = None
+
+    @property
+    def system(self) -> bool:
+        return "SYSTEM" in self.flags
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class KnowledgeEntry:
+    """What is known about a package: who ships it and how safe it is to remove."""
+
+    package: str
+    vendor: str
+    # One of SAFETY_TIERS in knowledge_base
+    tier: str
+    description: str
+    # Packages that stop working without this one
+    required_by: tuple[str, ...] = ()
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Suggested action for the packages whose name matches a pattern."""
+
+    pattern: str
+    # One of RULE_ACTIONS in rules
+    action: str
+    description: str = ""
+
+    @property
+    def is_regex(self) -> bool:
+        return self.pattern.startswith("re:")
+
+    @property
+    def is_exact(self) -> bool:
+        return not self.is_regex and not any(wildcard in self.pattern for wildcard in "*?")
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _to_int(value: str | None) -> int | None:
+    if not value:
+        return None
+    try:
+        # Shared uids are listed as a comma separated list, the first is the app uid
+        return int(value.split(",")[0])
+    except ValueError:
+        return None
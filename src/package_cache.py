@@ -0,0 +1,81 @@
+from collections import OrderedDict
+import logging
+import os
+import time
+
+
+class PackageCache:
+    """
+    Package inventories keyed by device serial.
+    Entries expire after ttl seconds and the least recently used device is evicted
+    once more than max_devices inventories are held.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, ttl: float = 60.0, max_devices: int = 16):
+        self.ttl = ttl
+        self.max_devices = max_devices
+        self._entries = OrderedDict()
+        # Bumped on invalidation so that loads started before it are not stored
+        self._generations = {}
+
+    def generation(self, serial: str) -> int:
+        return self._generations.get(serial, 0)
+
+    def get(self, serial: str):
+        """
+        Get the cached inventory of a device.
+        :return: The cached packages, or None if there is no fresh entry.
+        """
+        entry = self._entries.get(serial)
+        if entry is None:
+            return None
+        expires_at, packages = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[serial]
+            return None
+        self._entries.move_to_end(serial)
+        return packages
+
+    def set(
+        self, serial: str, packages, generation: int | None = None, taken_at: float | None = None
+    ):
+        """
+        Store the inventory of a device.
+        :param generation: The generation the inventory was loaded at, the inventory is
+         dropped if the device was invalidated since.
+        :param taken_at: Unix time the inventory was read from the device, defaults to now.
+         An older inventory expires ttl seconds after it was read, not after it was stored.
+        """
+        if generation is not None and generation != self.generation(serial):
+            self.logger.debug(f"Dropping stale inventory of {serial}")
+            return
+        ttl = self.ttl
+        if taken_at is not None:
+            ttl -= max(time.time() - taken_at, 0.0)
+            if ttl <= 0:
+                self.logger.debug(f"Dropping expired inventory of {serial}")
+                return
+        self._entries[serial] = (time.monotonic() + ttl, packages)
+        self._entries.move_to_end(serial)
+        while len(self._entries) > self.max_devices:
+            evicted, _ = self._entries.popitem(last=False)
+            self.logger.debug(f"Evicted inventory of {evicted}")
+
+    def invalidate(self, serial: str | None = None):
+        """Forget the inventory of a device, or of every device when no serial is given."""
+        serials = [serial] if serial is not None else list(self._entries)
+        for key in serials:
+            self._entries.pop(key, None)
+            self._generations[key] = self.generation(key) + 1
+
+    def clear(self):
+        self._entries.clear()
+        self._generations.clear()
+
+
+package_cache = PackageCache(
+    ttl=float(os.environ.get("BLOATWARE_PACKAGE_CACHE_TTL", 60)),
+    max_devices=int(os.environ.get("BLOATWARE_PACKAGE_CACHE_DEVICES", 16)),
+)
@@ -0,0 +1,221 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import cached_property
+import hashlib
+from itertools import compress, islice
+import logging
+from operator import itemgetter
+
+from .models import PackageInfo
+
+SORT_KEYS = ("name", "uid", "version_code", "installer")
+_BIT_FLAGS = bytes.maketrans(b"01", b"\x00\x01")
+
+
+@dataclass
+class PackagePage:
+    """One page of the packages matching a query."""
+
+    packages: list[PackageInfo]
+    total: int
+    offset: int
+    limit: int
+
+    @property
+    def page(self) -> int:
+        return self.offset // self.limit + 1 if self.limit else 1
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-self.total // self.limit)) if self.limit else 1
+
+
+class PackageIndex:
+    """
+    An inventory indexed for search, filtering and pagination.
+    Packages are kept sorted by name, ignoring case, and every index entry is a bitmask over those
+    positions, so filters combine with integer and/or and a page in name order is cut
+    out of the result without materialising the other matches.
+    Search terms match the start of any segment of the reverse-DNS name ("goo" finds
+    com.google.android.gm), terms with a dot match the start of the full name.
+    """
+
+    logger = logging.getLogger(__name__)
+    # Prefix lookups kept per index, a search box sends the same prefixes over and over
+    max_cached_terms = 256
+
+    def __init__(self, packages: list[PackageInfo]):
+        # Case-insensitive, so the lowercase names prefix searches bisect are in order too
+        self.packages = sorted(packages, key=lambda package: (package.name.lower(), package.name))
+        self.names = [package.name for package in self.packages]
+        self.all = (1 << len(self.packages)) - 1
+        segments = {}
+        self.system = self.enabled = 0
+        installers = {}
+        for position, package in enumerate(self.packages):
+            bit = 1 << position
+            for segment in set(package.name.lower().split(".")):
+                segments[segment] = segments.get(segment, 0) | bit
+            if package.system:
+                self.system |= bit
+            if package.enabled:
+                self.enabled |= bit
+            installer = package.installer or ""
+            installers[installer] = installers.get(installer, 0) | bit
+        self.segments = sorted(segments)
+        self._segment_masks = [segments[segment] for segment in self.segments]
+        self._installers = installers
+        self._lower_names = [name.lower() for name in self.names]
+        self._orders = {}
+        self._term_masks = {}
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """Digest of the inventory, equal for equal inventories across restarts."""
+        return hashlib.sha1(repr(self.packages).encode()).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.packages)
+
+    @property
+    def installers(self) -> list[str]:
+        """Installers present in the inventory, packages without one are left out."""
+        return sorted(installer for installer in self._installers if installer)
+
+    def match(
+        self,
+        query: str | None = None,
+        system: bool | None = None,
+        enabled: bool | None = None,
+        installer: str | None = None,
+    ) -> int:
+        """
+        Find the packages matching every given filter.
+        :param query: Search terms, all of which must match.
+        :param system: Only system (True) or user (False) packages.
+        :param enabled: Only enabled (True) or disabled (False) packages.
+        :param installer: Only packages installed by this package, "" for none.
+        :return: A bitmask of the positions of the matching packages.
+        """
+        mask = self.all
+        for term in (query or "").lower().split():
+            mask &= self._term_mask(term)
+        if system is not None:
+            mask &= self.system if system else ~self.system
+        if enabled is not None:
+            mask &= self.enabled if enabled else ~self.enabled
+        if installer is not None:
+            mask &= self._installers.get(installer, 0)
+        return mask & self.all
+
+    def query(
+        self,
+        query: str | None = None,
+        system: bool | None = None,
+        enabled: bool | None = None,
+        installer: str | None = None,
+        sort: str = "name",
+        descending: bool = False,
+        offset: int = 0,
+        limit: int = 50,
+    ) -> PackagePage:
+        """
+        Filter, sort and paginate the inventory, see match for the filters.
+        :param sort: One of SORT_KEYS.
+        :param offset: Number of matches to skip.
+        :param limit: Largest number of packages to return.
+        :return: A PackagePage with the packages of the page and the number of matches.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Cannot sort packages by {sort}")
+        mask = self.match(query, system, enabled, installer)
+        total = mask.bit_count()
+        offset = max(0, offset)
+        count = max(0, min(limit, total - offset))
+        if sort == "name":
+            positions = self._name_slice(mask, total, offset, count, descending)
+        else:
+            positions = self._ordered_slice(mask, sort, offset, count, descending)
+        return PackagePage([self.packages[p] for p in positions], total, offset, limit)
+
+    def _term_mask(self, term: str) -> int:
+        mask = self._term_masks.get(term)
+        if mask is not None:
+            return mask
+        mask = 0
+        if "." in term:
+            # Names are sorted, so the names starting with term are one contiguous run
+            start = bisect_left(self._lower_names, term)
+            end = bisect_left(self._lower_names, term + "\uffff", start)
+            if end > start:
+                mask = ((1 << (end - start)) - 1) << start
+        else:
+            start = bisect_left(self.segments, term)
+            for position in range(start, len(self.segments)):
+                if not self.segments[position].startswith(term):
+                    break
+                mask |= self._segment_masks[position]
+        if len(self._term_masks) >= self.max_cached_terms:
+            self._term_masks.clear()
+        self._term_masks[term] = mask
+        return mask
+
+    @staticmethod
+    def _nth_set_bit(mask: int, n: int) -> int:
+        """Position of the n-th (from 0) lowest set bit of mask, found by bisecting on rank."""
+        low, high = 0, mask.bit_length()
+        while low < high:
+            middle = (low + high) // 2
+            if (mask & ((1 << (middle + 1)) - 1)).bit_count() > n:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _name_slice(self, mask, total, offset, count, descending) -> list[int]:
+        positions = []
+        if count <= 0:
+            return positions
+        if descending:
+            first = self._nth_set_bit(mask, total - 1 - offset)
+            remaining = mask & ((1 << (first + 1)) - 1)
+            while len(positions) < count:
+                position = remaining.bit_length() - 1
+                positions.append(position)
+                remaining ^= 1 << position
+        else:
+            first = self._nth_set_bit(mask, offset)
+            remaining = mask >> first
+            while len(positions) < count:
+                lowest = remaining & -remaining
+                position = lowest.bit_length() - 1
+                positions.append(first + position)
+                remaining ^= lowest
+        return positions
+
+    def _ordered_slice(self, mask, sort, offset, count, descending) -> list[int]:
+        if count <= 0:
+            return []
+        order = self._orders.get(sort)
+        if order is None:
+            order = sorted(
+                range(len(self.packages)), key=lambda p: _sort_key(self.packages[p], sort)
+            )
+            # itemgetter returns a bare value instead of a tuple for a single item
+            pick = itemgetter(*order) if len(order) > 1 else lambda flags: tuple(flags)
+            order = self._orders[sort] = (order, pick)
+        order, pick = order
+        # One 0/1 byte per position, read in sort order, all without a Python level loop
+        flags = format(mask, f"0{len(self.packages)}b")[::-1].encode().translate(_BIT_FLAGS)
+        selected = pick(flags)
+        if descending:
+            matches = compress(reversed(order), reversed(selected))
+        else:
+            matches = compress(order, selected)
+        return list(islice(matches, offset, offset + count))
+
+
+def _sort_key(package: PackageInfo, sort: str):
+    # Packages without a value sort last, ties keep name order
+    value = getattr(package, sort)
+    return value is None, value if value is not None else 0
@@ -0,0 +1,222 @@
+"""
+Incremental parsers for adb output.
+Output is consumed chunk by chunk and turned into lines by iter_lines/aiter_lines, then
+fed line by line into a parser which hands back every record as soon as it is complete,
+so memory use stays bounded by the longest line instead of the whole output.
+"""
+
+from dataclasses import replace
+import logging
+import re
+
+from .models import DumpsysPackage, PackageInfo, _to_int
+
+logger = logging.getLogger(__name__)
+
+# Lines longer than this are cut, adb output has no meaningful lines of this size
+MAX_LINE_LENGTH = 1 << 20
+
+
+class LineSplitter:
+    """Turns text chunks into complete lines, keeping at most one partial line buffered."""
+
+    def __init__(self, max_line_length: int = MAX_LINE_LENGTH):
+        self.max_line_length = max_line_length
+        self._partial = ""
+
+    def feed(self, chunk: str) -> list[str]:
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        if len(self._partial) > self.max_line_length:
+            logger.warning(f"Cutting adb output line longer than {self.max_line_length} chars")
+            self._partial = self._partial[: self.max_line_length]
+        return lines
+
+    def close(self) -> list[str]:
+        partial, self._partial = self._partial, ""
+        return [partial] if partial else []
+
+
+def iter_lines(chunks, max_line_length: int = MAX_LINE_LENGTH):
+    """Yield the lines of an iterable of text chunks, without line endings."""
+    splitter = LineSplitter(max_line_length)
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.close()
+
+
+async def aiter_lines(chunks, max_line_length: int = MAX_LINE_LENGTH):
+    """Yield the lines of an async iterable of text chunks, without line endings."""
+    splitter = LineSplitter(max_line_length)
+    async for chunk in chunks:
+        for line in splitter.feed(chunk):
+            yield line
+    for line in splitter.close():
+        yield line
+
+
+def parse(parser, lines):
+    """Run a parser over an iterable of lines and yield its records."""
+    for line in lines:
+        yield from parser.feed(line)
+    yield from parser.close()
+
+
+async def aparse(parser, lines):
+    """Run a parser over an async iterable of lines and yield its records."""
+    async for line in lines:
+        for record in parser.feed(line):
+            yield record
+    for record in parser.close():
+        yield record
+
+
+class PackageListParser:
+    """Parses ``pm list packages`` output into PackageInfo records."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def feed(self, line: str) -> list[PackageInfo]:
+        package = PackageInfo.from_pm_line(line, enabled=self.enabled)
+        return [package] if package else []
+
+    def close(self) -> list[PackageInfo]:
+        return []
+
+
+class PackageInventoryParser:
+    """
+    Parses the output of the bulk inventory script of PackageManager: the names of
+    system packages, then the names of disabled packages, then the full listing, each
+    section ended by a marker line. Full records are handed back with their system and
+    enabled state already merged in.
+    """
+
+    def __init__(self, marker: str):
+        self.marker = marker
+        self.system = set()
+        self.disabled = set()
+        self._section = 0
+
+    def feed(self, line: str) -> list[PackageInfo]:
+        if line.strip() == self.marker:
+            self._section += 1
+            return []
+        package = PackageInfo.from_pm_line(line)
+        if package is None:
+            return []
+        if self._section == 0:
+            self.system.add(package.name)
+        elif self._section == 1:
+            self.disabled.add(package.name)
+        else:
+            return [
+                replace(
+                    package,
+                    system=package.name in self.system,
+                    enabled=package.name not in self.disabled,
+                )
+            ]
+        return []
+
+    def close(self) -> list[PackageInfo]:
+        return []
+
+
+class DeviceListParser:
+    """Parses ``adb devices -l`` output into device dicts."""
+
+    regex = re.compile(r"^(\S+)\s+(\S+)(?:\s+.*model:(\S+))?")
+
+    def feed(self, line: str) -> list[dict]:
+        if not line.strip() or line.startswith(("List of devices", "* daemon")):
+            return []
+        match = self.regex.match(line)
+        if not match:
+            return []
+        serial_number, state, model = match.groups()
+        return [
+            {
+                "serial_number": serial_number,
+                "state": state,
+                "model": model if model else "Unknown",
+                "is_selected": False,
+            }
+        ]
+
+    def close(self) -> list[dict]:
+        return []
+
+
+class DumpsysPackageParser:
+    """
+    Parses the ``Packages:`` section of ``dumpsys package`` into DumpsysPackage records.
+    A record is handed back once the next package (or section) starts.
+    """
+
+    package_regex = re.compile(r"^  Package \[([^\]]+)\]")
+    key_value_regex = re.compile(r"(\w+)=(\[[^\]]*\]|\S+)")
+    # Detail lines worth parsing, everything else (permissions, timestamps...) is skipped
+    detail_prefixes = (
+        "userId=",
+        "codePath=",
+        "versionCode=",
+        "versionName=",
+        "flags=",
+        "pkgFlags=",
+        "installerPackageName=",
+        "User 0:",
+    )
+
+    def __init__(self):
+        self._in_packages = False
+        self._current = None
+
+    def feed(self, line: str) -> list[DumpsysPackage]:
+        if not line.startswith(" "):
+            # A top level line starts a new section
+            finished = self.close()
+            self._in_packages = line.rstrip() == "Packages:"
+            return finished
+        if not self._in_packages:
+            return []
+        # Package headers are indented by two spaces, their details by more
+        match = None if line.startswith("   ") else self.package_regex.match(line)
+        if match:
+            finished = self.close()
+            self._current = DumpsysPackage(name=match.group(1))
+            return finished
+        if self._current is not None:
+            line = line.strip()
+            if line.startswith(self.detail_prefixes):
+                self._parse_detail(line)
+        return []
+
+    def close(self) -> list[DumpsysPackage]:
+        finished, self._current = self._current, None
+        return [finished] if finished else []
+
+    def _parse_detail(self, line: str):
+        package = self._current
+        if line.startswith("User 0:"):
+            fields = dict(self.key_value_regex.findall(line))
+            if "installed" in fields:
+                package.installed = fields["installed"] == "true"
+            if "enabled" in fields:
+                # 0 is the default state, 1 enabled, the others are kinds of disabled
+                package.enabled = fields["enabled"] in ("0", "1")
+            return
+        for key, value in self.key_value_regex.findall(line):
+            if key == "userId":
+                package.uid = _to_int(value)
+            elif key == "codePath":
+                package.code_path = value
+            elif key == "versionCode":
+                package.version_code = _to_int(value)
+            elif key == "versionName":
+                package.version_name = value
+            elif key == "installerPackageName":
+                package.installer = value if value != "null" else None
+            elif key == "flags" or key == "pkgFlags":
+                package.flags = value.strip("[]").split()
@@ -1,62 +1,625 @@
+import asyncio
+from collections import OrderedDict
+import contextlib
 import logging
+import shlex
+import time
 
-from .cmd_manager import CommandManager
+from .adb_client import Adb
+from .db import db_manager
 from .device_manager import DeviceManager
-from .exceptions import ErrorCodes
+from .exceptions import ErrorCodes, StreamInterrupted
+from .models import PackageInfo
+from .package_cache import package_cache
+from .package_index import PackageIndex
+from .parsers import DumpsysPackageParser, PackageInventoryParser, aiter_lines, aparse
+from .shell_session import shell_sessions
+from .snapshots import Snapshot, diff_packages, snapshot_store
+
+ACTION_COMMANDS = {
+    "disable": "pm disable-user --user 0 {}",
+    "uninstall": "pm uninstall --user 0 {}",
+    "enable": "pm enable --user 0 {}",
+    "install": "cmd package install-existing --user 0 {}",
+}
+# The action undoing each journaled action
+UNDO_ACTIONS = {"uninstall": "install", "disable": "enable"}
+# Prefix of the line a batch script prints before running each operation
+BATCH_MARKER = "__BWR_PKG__"
+# Ends each section of the inventory script
+INVENTORY_MARKER = "__BWR_SECTION__"
+# Everything known about the packages of a device in one round-trip: the system and
+# disabled names come first so each full record can be completed as soon as it is read.
+# User and enabled packages are the complement of these, so -3 and -e are not needed.
+INVENTORY_COMMAND = (
+    f"pm list packages -s; echo {INVENTORY_MARKER}; "
+    f"pm list packages -d; echo {INVENTORY_MARKER}; "
+    "pm list packages -f -i -U --show-versioncode"
+)
+# State of the packages for user 0 in one round-trip: the installed names, then the
+# disabled ones
+STATE_COMMAND = f"pm list packages --user 0; echo {INVENTORY_MARKER}; pm list packages -d --user 0"
+
+
+def action_succeeded(output: str | None) -> bool:
+    """Tell from the output of a pm command whether it succeeded."""
+    # uninstall prints Success, disable-user and enable the new state, install-existing
+    # the user it installed for
+    return output is not None and any(
+        marker in output for marker in ('Success', 'new state:', 'installed for user')
+    )
+
+
+class ActionResults(dict):
+    """
+    Whether the action on every package succeeded, by package name.
+    Packages already in the state the action leads to are not acted on: they count as
+    succeeded and skipped tells why, by package name.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.skipped: dict[str, str] = {}
+
+
+class BatchProgress:
+    """
+    Turns the output of a batch script into per package progress events while it runs.
+    The marker line of an operation starts it and ends the operation before it.
+    """
+
+    def __init__(self, serial_number, batch, publish):
+        self.serial_number = serial_number
+        self.batch = batch
+        self.publish = publish
+        self.position = None
+        self.started = None
+        self.lines = []
+        self.finished = set()
+
+    def on_line(self, line: str):
+        marker, _, position = line.strip().partition(" ")
+        if marker == BATCH_MARKER and position.isdigit() and int(position) < len(self.batch):
+            if self.position is not None:
+                self.finish(self.position, "".join(self.lines))
+            self.position, self.started, self.lines = int(position), time.monotonic(), []
+            if self.position not in self.finished:
+                self.publish("started", **self._fields(self.position))
+            return
+        self.lines.append(line)
+
+    def finish(self, position: int, output: str | None):
+        if position in self.finished:
+            return
+        self.finished.add(position)
+        duration = time.monotonic() - self.started if position == self.position else 0.0
+        self.publish(
+            "succeeded" if action_succeeded(output) else "failed",
+            duration=round(duration, 3),
+            output=(output or "").strip(),
+            **self._fields(position),
+        )
+
+    def close(self, outputs: list[str | None]):
+        """Report the operations not finished yet once the batch returned."""
+        for position, output in enumerate(outputs):
+            self.finish(position, output)
+
+    def _fields(self, position: int) -> dict:
+        _, (pkg, action) = self.batch[position]
+        return {"serial_number": self.serial_number, "package": pkg, "action": action}
 
 
 class PackageManager:
 
     logger = logging.getLogger(__name__)
+    batch_size = 50
+    # Read the state of the packages before acting and skip the operations changing nothing
+    skip_unchanged = True
+    # Conservative bound for a single adb shell command line on older devices
+    max_command_length = 4000
+    # Seconds allowed per operation, a batch gets this times its size
+    action_timeout = 10.0
+    # Search indexes of recently served inventories, keyed by the identity of the inventory
+    _indexes = OrderedDict()
 
     @classmethod
-    async def get_installed_packages(cls) -> (int, list[str]):
+    async def get_installed_packages(
+        cls, refresh=False, serial_number=None
+    ) -> (int, list[PackageInfo]):
         """
-        Get a list of installed packages on the device.
-        :return: A list of installed packages that match the filter.
+        Get the installed packages of a device with their metadata.
+        Inventories are served from the package cache unless refresh is set.
+        :param refresh: Bypass the cache and query the device.
+        :param serial_number: The device to list, defaults to the selected device.
+        :return: A list of PackageInfo records.
         """
-        selected_device = await DeviceManager.get_selected_device()
+        selected_device = serial_number or await DeviceManager.get_selected_device()
         if not selected_device:
             cls.logger.error("No device selected")
             return ErrorCodes.NO_DEVICE_SELECTED, []
-        cmd = f"adb -s {selected_device} shell pm list packages"
-        stdout = await CommandManager.execute_command(cmd)
-        if not stdout:
+        if not refresh:
+            packages = package_cache.get(selected_device)
+            if packages is not None:
+                return ErrorCodes.SUCCESS, packages
+        generation = package_cache.generation(selected_device)
+        error_code, packages = await cls.list_packages(selected_device)
+        if error_code != ErrorCodes.SUCCESS:
+            return error_code, []
+        if not packages:
             cls.logger.warning("No packages found")
             return ErrorCodes.NO_PACKAGES_FOUND, []
 
-        return ErrorCodes.SUCCESS, [
-            package.strip().replace("package:", "", 1)
-            for package in stdout.split("\n")
-            if package.strip()
-        ]
+        package_cache.set(selected_device, packages, generation=generation)
+        return ErrorCodes.SUCCESS, packages
 
     @classmethod
-    async def perform_action_on_packages(cls, action_form) -> (int, list[str]):
+    async def get_package_index(
+        cls, refresh=False, serial_number=None
+    ) -> (int, PackageIndex | None):
+        """
+        Get the installed packages of a device indexed for search.
+        An index is built once per cached inventory and reused until it is replaced.
+        :param refresh: Bypass the cache and query the device.
+        :param serial_number: The device to list, defaults to the selected device.
+        :return: A PackageIndex over the inventory, None on error.
+        """
+        error_code, packages = await cls.get_installed_packages(
+            refresh=refresh, serial_number=serial_number
+        )
+        if error_code != ErrorCodes.SUCCESS:
+            return error_code, None
+        entry = cls._indexes.get(id(packages))
+        if entry is None:
+            # The entry keeps the list alive, so its id cannot be reused while cached
+            entry = cls._indexes[id(packages)] = (packages, PackageIndex(packages))
+            while len(cls._indexes) > package_cache.max_devices:
+                cls._indexes.popitem(last=False)
+        else:
+            cls._indexes.move_to_end(id(packages))
+        return ErrorCodes.SUCCESS, entry[1]
+
+    @classmethod
+    async def list_packages(cls, serial_number) -> (int, list[PackageInfo]):
+        """
+        Query the packages of a device with their path, installer, uid, version code,
+        system flag and enabled state, all in a single shell command.
+        :param serial_number: Serial number of the device.
+        :return: A list of PackageInfo records, empty if the device listed none. The error
+         code is FAILED_OPERATION, with an empty list, when the listing was cut short, a
+         partial inventory would show the missing packages as removed.
+        """
+        # Parsed as it arrives, the raw listing is never held in memory as a whole
+        chunks = Adb.shell_stream(serial_number, INVENTORY_COMMAND)
+        try:
+            records = aparse(PackageInventoryParser(INVENTORY_MARKER), aiter_lines(chunks))
+            return ErrorCodes.SUCCESS, [package async for package in records]
+        except StreamInterrupted as e:
+            cls.logger.error(f"[ERROR] Failed to list the packages of {serial_number} because {e}")
+            return ErrorCodes.FAILED_OPERATION, []
+        finally:
+            await chunks.aclose()
+
+    @classmethod
+    async def iter_package_details(cls, serial_number, timeout: float | None = None):
+        """
+        Stream the details of every package of a device out of ``dumpsys package``.
+        The dump runs to tens of megabytes on devices with many packages, so records are
+        parsed and handed out one at a time while the dump is still being read.
+        :param serial_number: Serial number of the device.
+        :param timeout: Seconds to wait for each chunk of output.
+        :return: An async iterator of DumpsysPackage records.
+        """
+        chunks = Adb.shell_stream(serial_number, "dumpsys package packages", timeout=timeout)
+        try:
+            async for package in aparse(DumpsysPackageParser(), aiter_lines(chunks)):
+                yield package
+        finally:
+            await chunks.aclose()
+
+    @classmethod
+    async def take_snapshot(cls, serial_number) -> (int, Snapshot | None):
+        """
+        Record the packages of a device with their metadata, see list_packages.
+        :param serial_number: Serial number of the device.
+        :return: The new snapshot, also kept in the snapshot store.
+        """
+        error_code, packages = await cls.list_packages(serial_number)
+        if error_code != ErrorCodes.SUCCESS:
+            return error_code, None
+        packages = {package.name: package for package in packages}
+        if not packages:
+            cls.logger.warning(f"No packages found on {serial_number}")
+            return ErrorCodes.NO_PACKAGES_FOUND, None
+        taken_at = time.time()
+        try:
+            snapshot_id = await db_manager.save_snapshot(serial_number, taken_at, packages.values())
+        except Exception as e:
+            cls.logger.error(f"[ERROR] Failed to store snapshot of {serial_number} because {e}")
+            snapshot_id = None
+        snapshot = snapshot_store.add(serial_number, packages, snapshot_id, taken_at)
+        package_cache.set(serial_number, list(packages.values()), taken_at=taken_at)
+        return ErrorCodes.SUCCESS, snapshot
+
+    @classmethod
+    async def restore_snapshots(cls) -> int:
+        """
+        Load the latest stored snapshot of every device into the snapshot store and the
+        package cache, so the first pages after a quick restart need no device round-trip.
+        A snapshot stays in the package cache for what is left of its ttl since it was
+        taken, an older one is read from the device again on the first page.
+        :return: The number of devices restored.
+        """
+        try:
+            snapshots = await db_manager.get_latest_snapshots()
+        except Exception as e:
+            cls.logger.error(f"[ERROR] Failed to load stored snapshots because {e}")
+            return 0
+        for snapshot in snapshots:
+            snapshot_store.add(
+                snapshot.serial_number, snapshot.packages, snapshot.id, snapshot.taken_at
+            )
+            package_cache.set(
+                snapshot.serial_number,
+                list(snapshot.packages.values()),
+                taken_at=snapshot.taken_at,
+            )
+        return len(snapshots)
+
+    @classmethod
+    async def changes_since(cls, serial_number, snapshot_id) -> (int, Snapshot | None, object):
+        """
+        Take a new snapshot of a device and compare it with an earlier one.
+        :param serial_number: Serial number of the device.
+        :param snapshot_id: Id of the earlier snapshot.
+        :return: The new snapshot and the PackageDelta since the earlier snapshot. The error
+         code is UNKNOWN_SNAPSHOT, with a None delta, when the earlier snapshot is not known
+         (anymore), the caller then has to start over from the new snapshot.
+        """
+        previous = snapshot_store.get(serial_number, snapshot_id)
+        if previous is None:
+            try:
+                previous = await db_manager.get_snapshot(serial_number, snapshot_id)
+            except Exception as e:
+                cls.logger.error(f"[ERROR] Failed to load snapshot {snapshot_id} because {e}")
+        error_code, snapshot = await cls.take_snapshot(serial_number)
+        if error_code != ErrorCodes.SUCCESS:
+            return error_code, None, None
+        if previous is None:
+            return ErrorCodes.UNKNOWN_SNAPSHOT, snapshot, None
+        return ErrorCodes.SUCCESS, snapshot, diff_packages(previous.packages, snapshot.packages)
+
+    @classmethod
+    async def perform_action_on_packages(cls, action_form, batch_size=None) -> (int, list[str]):
         """
         Perform actions on packages based on the provided operation map.
+        Operations are sent to the device in batches, each batch being one shell script
+        that reports the output of every package operation.
         :param action_form: A dictionary containing the action to perform on each package.
+        :param batch_size: Maximum number of operations per batch, defaults to cls.batch_size.
         :return: A list of packages on which operation was not successful.
         """
         selected_device = await DeviceManager.get_selected_device()
         if not selected_device:
             cls.logger.error("No device selected")
             return ErrorCodes.NO_DEVICE_SELECTED, []
-        serial_number = selected_device
-        failed_operations = []
-        for key, value in action_form.items():
-            if key.startswith("action_") and value:  # skip "no action"
-                pkg = key.replace("action_", "")
-                cls.logger.info(f"Performing action {value} on {pkg}")
-                if value == "disable":
-                    cmd = f"adb -s {serial_number} shell pm disable-user --user 0 {pkg}"
-                elif value == "uninstall":
-                    cmd = f"adb -s {serial_number} shell pm uninstall --user 0 {pkg}"
-                else:
-                    cmd = ":"  # No op command just to keep the structure
-                stdout = await CommandManager.execute_command(cmd)
-                cls.logger.debug(f"stdout: {stdout} for {pkg}")
-                if 'Success' not in stdout:
-                    failed_operations.append(pkg)
+        results = await cls.apply_actions(selected_device, action_form, batch_size=batch_size)
+        failed_operations = [pkg for pkg, succeeded in results.items() if not succeeded]
         return_code = ErrorCodes.SUCCESS if not failed_operations else ErrorCodes.FAILED_OPERATION
         return return_code, failed_operations
+
+    @classmethod
+    async def run_actions(cls, run, action_form):
+        """
+        Apply an action form for an ActionRun, publishing the progress on the run.
+        The run is finished whatever happens, so its followers are never left waiting.
+        :param run: The ActionRun of the device to act on.
+        :param action_form: A dictionary containing the action to perform on each package.
+        """
+        try:
+            results = await cls.apply_actions(run.serial_number, action_form, progress=run.publish)
+        except asyncio.CancelledError:
+            run.finish(error="Cancelled")
+            raise
+        except Exception as e:
+            cls.logger.error(f"[ERROR] Failed to apply actions on {run.serial_number} because {e}")
+            run.finish(error=str(e))
+            return
+        failed = [pkg for pkg, succeeded in results.items() if not succeeded]
+        run.finish(
+            succeeded=len(results) - len(failed) - len(results.skipped),
+            failed=failed,
+            skipped=list(results.skipped),
+        )
+
+    @classmethod
+    async def apply_actions(
+        cls,
+        serial_number,
+        action_form,
+        batch_size=None,
+        concurrency=1,
+        limiter=None,
+        progress=None,
+    ) -> dict[str, bool]:
+        """
+        Apply the actions of an action form on one device.
+        :param serial_number: Serial number of the device.
+        :param action_form: A dictionary containing the action to perform on each package.
+        :param batch_size: Maximum number of operations per batch, defaults to cls.batch_size.
+        :param concurrency: Number of batches in flight on the device, each on its own shell.
+        :param limiter: Optional semaphore shared between devices capping the batches in flight.
+        :param progress: Optional callable receiving an event type (started, succeeded,
+         failed or skipped) and the event fields for every package, as the device works
+         through them.
+        :return: ActionResults telling for every package with an action whether the action
+         succeeded, and which packages were skipped.
+        """
+        operations = cls.form_operations(action_form)
+        results = ActionResults((pkg, False) for pkg, _ in operations)
+        valid = []
+        for index, (pkg, action) in enumerate(operations):
+            if action in ACTION_COMMANDS:
+                valid.append((index, (pkg, action)))
+            else:
+                cls.logger.warning(f"Unknown action {action} for {pkg}")
+                if progress is not None:
+                    progress(
+                        "failed",
+                        serial_number=serial_number,
+                        package=pkg,
+                        action=action,
+                        duration=0.0,
+                        output=f"Unknown action {action}",
+                    )
+
+        # State of the packages before acting on them, None when unknown
+        state = None
+        if cls.skip_unchanged and valid:
+            state = await cls.read_package_state(serial_number)
+            results.skipped = cls.plan_actions([operation for _, operation in valid], state)
+            for _, (pkg, action) in valid:
+                if pkg not in results.skipped:
+                    continue
+                results[pkg] = True
+                if progress is not None:
+                    progress(
+                        "skipped",
+                        serial_number=serial_number,
+                        package=pkg,
+                        action=action,
+                        duration=0.0,
+                        output=results.skipped[pkg],
+                    )
+            valid = [entry for entry in valid if entry[1][0] not in results.skipped]
+
+        slots = asyncio.Queue()
+        for slot in range(concurrency):
+            slots.put_nowait(slot)
+
+        async def run_batch(batch):
+            # Every slot is a shell session of its own, so batches on one device never interleave
+            slot = await slots.get()
+            tracker = BatchProgress(serial_number, batch, progress) if progress else None
+            try:
+                async with limiter or contextlib.nullcontext():
+                    cls.logger.info(f"Performing {len(batch)} actions on {serial_number}")
+                    result = await shell_sessions.execute(
+                        serial_number,
+                        cls._batch_script(batch),
+                        timeout=cls.action_timeout * len(batch),
+                        slot=slot,
+                        on_line=tracker.on_line if tracker else None,
+                    )
+            finally:
+                slots.put_nowait(slot)
+            outputs = cls._parse_batch_output(result.stdout, len(batch))
+            for (_, (pkg, action)), stdout in zip(batch, outputs):
+                cls.logger.debug(f"stdout: {stdout} for {action} {pkg}")
+                results[pkg] = action_succeeded(stdout)
+                previous_state = state.get(pkg, "uninstalled") if state is not None else None
+                history.append((pkg, action, results[pkg], stdout, previous_state))
+            if tracker:
+                tracker.close(outputs)
+
+        history = []
+        batches = cls._build_batches(valid, batch_size or cls.batch_size)
+        try:
+            await asyncio.gather(*(run_batch(batch) for batch in batches))
+        finally:
+            if batches:
+                package_cache.invalidate(serial_number)
+            if history:
+                await cls._record_history(serial_number, history)
+        return results
+
+    @classmethod
+    async def read_package_state(cls, serial_number) -> dict[str, str] | None:
+        """
+        Read the state of every package installed for user 0 in one command.
+        :param serial_number: Serial number of the device.
+        :return: "enabled" or "disabled" by package name, None if the state cannot be read.
+        """
+        result = await shell_sessions.execute(
+            serial_number, STATE_COMMAND, timeout=cls.action_timeout
+        )
+        installed, marker, disabled = (result.stdout or "").partition(INVENTORY_MARKER)
+        installed, disabled = _package_names(installed), _package_names(disabled)
+        if result.returncode != 0 or not marker or not installed:
+            cls.logger.warning(f"Failed to read the package state of {serial_number}")
+            return None
+        return {pkg: "disabled" if pkg in disabled else "enabled" for pkg in installed}
+
+    @classmethod
+    def plan_actions(cls, operations, state: dict[str, str] | None) -> dict[str, str]:
+        """
+        Find the operations that would change nothing, re-applying a plan to a device
+        that already went through part of it then only acts on the rest.
+        :param operations: (package, action) pairs.
+        :param state: The state of the packages, as read by read_package_state.
+        :return: Why each operation changing nothing is skipped, by package name. Nothing is
+         skipped when the state is unknown.
+        """
+        if state is None:
+            return {}
+        skipped = {}
+        for pkg, action in operations:
+            current = state.get(pkg)
+            if action == "install":
+                if current is not None:
+                    skipped[pkg] = "Already installed"
+            elif current is None:
+                # Gone for user 0, uninstalled earlier or never there
+                skipped[pkg] = "Not installed for user 0"
+            elif action == "disable" and current == "disabled":
+                skipped[pkg] = "Already disabled"
+            elif action == "enable" and current == "enabled":
+                skipped[pkg] = "Already enabled"
+        if skipped:
+            cls.logger.info(f"Skipping {len(skipped)} unchanged packages")
+        return skipped
+
+    @classmethod
+    async def restore_actions(
+        cls, serial_number, since=None, packages=None, concurrency=1, limiter=None
+    ) -> ActionResults:
+        """
+        Undo the disable and uninstall actions journaled for a device: uninstalled
+        packages are installed again, then every package is put back in the state it was
+        in before its first journaled action, each step in batches. A package that was
+        already disabled is disabled again once reinstalled, and never enabled.
+        Journal entries whose undo succeeded (or had nothing left to do) are marked restored.
+        :param serial_number: Serial number of the device.
+        :param since: Only undo the actions performed at or after this Unix time.
+        :param packages: Only undo the actions on these packages.
+        :param concurrency: Number of batches in flight on the device.
+        :param limiter: Optional semaphore shared between devices capping the batches in flight.
+        :return: ActionResults by package of the undo actions.
+        """
+        entries = await db_manager.get_journal(serial_number, since=since, packages=packages)
+        # The journal is oldest first, the first entry of a package holds its original state
+        original = {}
+        for entry in entries:
+            original.setdefault(entry["package"], entry["previous_state"])
+        uninstalled = {entry["package"] for entry in entries if entry["action"] == "uninstall"}
+        disabled = {entry["package"] for entry in entries if entry["action"] == "disable"}
+        states = {}
+        for pkg in uninstalled | disabled:
+            if original[pkg] == "disabled":
+                if pkg in uninstalled:
+                    states[pkg] = "disable"
+            elif pkg in disabled:
+                states[pkg] = UNDO_ACTIONS["disable"]
+        results = ActionResults()
+        started = time.time()
+        # Reinstalled packages come back in a state of their own, so the states are only
+        # set once the install step is done
+        steps = ({pkg: UNDO_ACTIONS["uninstall"] for pkg in uninstalled}, states)
+        for step_actions in steps:
+            if not step_actions:
+                continue
+            step = await cls.apply_actions(
+                serial_number,
+                {f"action_{pkg}": step_actions[pkg] for pkg in sorted(step_actions)},
+                concurrency=concurrency,
+                limiter=limiter,
+            )
+            for pkg, succeeded in step.items():
+                results[pkg] = results.get(pkg, True) and succeeded
+            results.skipped.update(step.skipped)
+        for pkg in disabled - uninstalled - states.keys():
+            # Disabled before it was disabled again, the action changed nothing to undo
+            results[pkg] = True
+            results.skipped[pkg] = "Already disabled before"
+        redisabled = [pkg for pkg, action in states.items() if action == "disable"]
+        if redisabled:
+            # Disabling them again restores them too, it must not be undone by a later restore
+            entries += await db_manager.get_journal(
+                serial_number, since=started, packages=redisabled
+            )
+        restored = [entry["id"] for entry in entries if results.get(entry["package"])]
+        if restored:
+            try:
+                await db_manager.mark_restored(restored)
+            except Exception as e:
+                cls.logger.error(f"[ERROR] Failed to mark restored actions because {e}")
+        return results
+
+    @classmethod
+    async def _record_history(cls, serial_number, history):
+        # The actions are done whether or not they can be written down
+        try:
+            await db_manager.record_actions(serial_number, history)
+        except Exception as e:
+            cls.logger.error(f"[ERROR] Failed to record actions on {serial_number} because {e}")
+
+    @staticmethod
+    def form_operations(action_form) -> list[tuple[str, str]]:
+        """
+        Extract the operations of an action form.
+        :return: (package, action) pairs for every package that has an action.
+        """
+        return [
+            (key.replace("action_", ""), value)
+            for key, value in action_form.items()
+            if key.startswith("action_") and value  # skip "no action"
+        ]
+
+    @classmethod
+    def _operation_line(cls, position, pkg, action) -> str:
+        command = ACTION_COMMANDS[action].format(shlex.quote(pkg))
+        return f"echo {BATCH_MARKER} {position}; {command}\n"
+
+    @classmethod
+    def _build_batches(cls, operations, batch_size):
+        """
+        Split operations into batches of at most batch_size entries whose script
+        stays below max_command_length characters.
+        """
+        batches, batch, length = [], [], 0
+        for entry in operations:
+            _, (pkg, action) = entry
+            line_length = len(cls._operation_line(len(batch), pkg, action))
+            if batch and (
+                len(batch) >= batch_size or length + line_length > cls.max_command_length
+            ):
+                batches.append(batch)
+                batch, length = [], 0
+                line_length = len(cls._operation_line(0, pkg, action))
+            batch.append(entry)
+            length += line_length
+        if batch:
+            batches.append(batch)
+        return batches
+
+    @classmethod
+    def _batch_script(cls, batch) -> str:
+        return "".join(
+            cls._operation_line(position, pkg, action)
+            for position, (_, (pkg, action)) in enumerate(batch)
+        )
+
+    @classmethod
+    def _parse_batch_output(cls, stdout, count) -> list[str | None]:
+        """
+        Cut the output of a batch script back into the output of every operation.
+        Operations that never reported back (e.g. the shell died midway) get None.
+        """
+        outputs = [None] * count
+        position = None
+        for line in stdout.splitlines(keepends=True):
+            if line.startswith(BATCH_MARKER):
+                position = int(line.split()[1])
+                outputs[position] = ""
+            elif position is not None:
+                outputs[position] += line
+        return outputs
+
+
+def _package_names(listing: str) -> set[str]:
+    """:return: The names in the output of ``pm list packages``."""
+    return {
+        line.strip()[len("package:") :]
+        for line in listing.splitlines()
+        if line.strip().startswith("package:")
+    }
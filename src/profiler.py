@@ -0,0 +1,147 @@
+"""
+An opt-in sampling profiler capturing the next N requests.
+
+Armed with BLOATWARE_PROFILE_REQUESTS=N on start or ``POST /debug/profile?requests=N``,
+it samples the stack of the thread serving the requests every few milliseconds while
+one of them runs, and writes the samples in the collapsed stack format of flame graph
+tools (``frame;frame;frame count`` per line) once the last one finished:
+
+    flamegraph.pl profile-1700000000.folded > profile.svg
+
+Requests share the event loop, so the samples also catch whatever else it ran at the
+time. Waiting on adb shows as the loop's select call. Nothing runs while unarmed.
+"""
+
+from collections import Counter
+import logging
+import os
+import sys
+import threading
+import time
+
+from .knowledge_base import DEFAULT_CACHE_DIR
+
+# Seconds between two samples
+DEFAULT_INTERVAL = 0.005
+
+
+def _stack(frame) -> str:
+    """:return: The frames of a stack, outermost first, as module:function;..."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread from another while profiled requests run."""
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, interval: float = DEFAULT_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.remaining = 0
+        self.active = 0
+        self.path = None
+        self.last_path = None
+        self.samples = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def arm(self, requests: int, path: str | None = None) -> str:
+        """
+        Profile the next requests, added to those still waiting when already armed.
+        :param path: File to write the profile to, profile-<time>.folded in the directory by default.
+        :return: The file the profile will be written to.
+        """
+        with self._lock:
+            self.remaining += requests
+            if self.path is None:
+                self.path = path or os.path.join(
+                    self.directory, f"profile-{int(time.time())}.folded"
+                )
+            return self.path
+
+    def status(self) -> dict:
+        return {
+            "remaining": self.remaining,
+            "active": self.active,
+            "path": self.path,
+            "last_path": self.last_path,
+        }
+
+    def request_started(self) -> bool:
+        """:return: Whether the request starting now on this thread is profiled."""
+        if not self.remaining:
+            return False
+        with self._lock:
+            if not self.remaining:
+                return False
+            self.remaining -= 1
+            self.active += 1
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._sample,
+                    args=(threading.get_ident(),),
+                    name="sampling-profiler",
+                    daemon=True,
+                )
+                self._thread.start()
+        return True
+
+    def request_finished(self):
+        """Called when a profiled request finished, writes the profile after the last one."""
+        with self._lock:
+            self.active -= 1
+            if self.active or self.remaining:
+                return
+            thread, self._thread = self._thread, None
+            self._stop.set()
+        thread.join()
+        self._write()
+
+    def _sample(self, thread_id: int):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self.samples[_stack(frame)] += 1
+
+    def _write(self):
+        path, self.path = self.path, None
+        samples, self.samples = self.samples, Counter()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w") as profile:
+                for stack, count in samples.most_common():
+                    profile.write(f"{stack} {count}\n")
+        except OSError as e:
+            self.logger.error(f"[ERROR] Failed to write the profile to {path} because {e}")
+            return
+        self.last_path = path
+        self.logger.info(f"Wrote a profile of {sum(samples.values())} samples to {path}")
+
+
+class ProfilerMiddleware:
+    """ASGI middleware handing the HTTP requests to the profiler while it is armed."""
+
+    def __init__(self, app, profiler: SamplingProfiler | None = None):
+        self.app = app
+        self.profiler = sampling_profiler if profiler is None else profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.request_started():
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.request_finished()
+
+
+sampling_profiler = SamplingProfiler()
+if os.environ.get("BLOATWARE_PROFILE_REQUESTS"):
+    sampling_profiler.arm(int(os.environ["BLOATWARE_PROFILE_REQUESTS"]))
@@ -0,0 +1,119 @@
+import asyncio
+from collections import OrderedDict
+import itertools
+import logging
+import time
+
+
+class ActionRun:
+    """
+    Progress of one apply-actions run.
+    Events are kept for the life of the run so a client connecting late, or
+    reconnecting, can replay them from any point.
+    """
+
+    def __init__(self, id: str, serial_number: str, operations: list[tuple[str, str]]):
+        self.id = id
+        self.serial_number = serial_number
+        self.operations = operations
+        self.started_at = time.monotonic()
+        self.events: list[dict] = []
+        self.done = False
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+
+    @property
+    def total(self) -> int:
+        return len(self.operations)
+
+    def elapsed(self) -> float:
+        return round(time.monotonic() - self.started_at, 3)
+
+    def publish(self, type: str, **fields):
+        """Record an event and wake up everyone waiting for one."""
+        event = {"id": len(self.events) + 1, "type": type, "elapsed": self.elapsed(), **fields}
+        self.events.append(event)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def finish(self, **fields):
+        if not self.done:
+            self.publish("done", **fields)
+            self.done = True
+
+    async def follow(self, after: int = 0, heartbeat: float | None = None):
+        """
+        Yield the events of the run, starting after the event with id after, and keep
+        waiting for new ones until the run is done.
+        :param heartbeat: Yield None after this many seconds without an event, so the
+         caller can keep an idle connection open.
+        """
+        while True:
+            changed = self._changed
+            while after < len(self.events):
+                after += 1
+                yield self.events[after - 1]
+            if self.done:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+    async def batches(self, after: int = 0):
+        """
+        Like follow, but yield every event published since the previous batch in one
+        list, so a slow consumer such as a database writer handles them together.
+        """
+        while True:
+            changed = self._changed
+            if after < len(self.events):
+                batch = self.events[after:]
+                after += len(batch)
+                yield batch
+                continue
+            if self.done:
+                return
+            await changed.wait()
+
+
+class ProgressRegistry:
+    """Keeps the most recent action runs, finished runs are dropped past max_runs."""
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, max_runs: int = 32):
+        self.max_runs = max_runs
+        self._runs: OrderedDict[str, ActionRun] = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def create(
+        self, serial_number: str, operations: list[tuple[str, str]], run_id: str | None = None
+    ) -> ActionRun:
+        """
+        Start following a new run.
+        :param run_id: Id of the run, such as the id of its job, a new one by default.
+        """
+        run = ActionRun(run_id or str(next(self._ids)), serial_number, operations)
+        self._runs[run.id] = run
+        for run_id in [run_id for run_id, old in self._runs.items() if old.done]:
+            if len(self._runs) <= self.max_runs:
+                break
+            del self._runs[run_id]
+        return run
+
+    def get(self, run_id: str) -> ActionRun | None:
+        return self._runs.get(run_id)
+
+    async def cancel_all(self):
+        """Cancel the runs still in progress, used on shutdown."""
+        tasks = [run.task for run in self._runs.values() if run.task and not run.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def clear(self):
+        self._runs.clear()
+
+
+progress_registry = ProgressRegistry()
@@ -1,17 +1,45 @@
-import os
+import asyncio
+import json
 
 from fastapi import APIRouter, Request
-from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 
 from .connection_manager import ConnectionManager
+from .db import db_manager
 from .device_manager import DeviceManager
 from .exceptions import ErrorCodes
+from .fleet import FleetManager
+from .jobs import ACTIVE, job_queue
+from .knowledge_base import knowledge_base
+from .metrics import registry
+from .package_index import SORT_KEYS
 from .pkg_manager import PackageManager
+from .profiler import sampling_profiler
+from .progress import progress_registry
+from .rules import rule_set
+from .templating import stream_template, templates
+from .tracing import trace_store
+from .utils import cancel_on_disconnect
 
-script_dir = os.path.dirname(os.path.abspath(__file__))
-templates = Jinja2Templates(directory=os.path.join(script_dir, "templates"))
 router = APIRouter()
+# Largest page of packages rendered at once
+MAX_PER_PAGE = 500
+# Seconds between keep-alive comments on an idle event stream
+SSE_HEARTBEAT = 15.0
+
+
+def package_query(q, kind, state, installer, sort, order, page, per_page) -> dict:
+    """Turn the package filter query parameters into PackageIndex.query arguments."""
+    return {
+        "query": q,
+        "system": {"system": True, "user": False}.get(kind),
+        "enabled": {"enabled": True, "disabled": False}.get(state),
+        "installer": installer,
+        "sort": sort if sort in SORT_KEYS else "name",
+        "descending": order == "desc",
+        "offset": (max(page, 1) - 1) * per_page,
+        "limit": per_page,
+    }
 
 
 @router.get("/")
@@ -62,13 +90,37 @@ async def connect_to_device(request: Request):
 
 
 @router.get("/packages")
-async def get_packages(request: Request):
+async def get_packages(
+    request: Request,
+    q: str = "",
+    kind: str = "",
+    state: str = "",
+    installer: str | None = None,
+    sort: str = "name",
+    order: str = "asc",
+    page: int = 1,
+    per_page: int = 50,
+):
     """
     Retrieve the list of installed packages on the device.
+    The inventory is cached per device, pass ?refresh=1 to query the device again.
+    Packages are searched, filtered, sorted and paginated on the server.
+    The action suggested by the package rules is preselected for every package.
     :param request: Asynchronous request object.
+    :param q: Search terms matched against the segments of the package names.
+    :param kind: "system" or "user" to show only that kind of package.
+    :param state: "enabled" or "disabled" to show only packages in that state.
+    :param installer: Only show packages installed by this package, empty for none.
+    :param sort: Field to sort by, one of name, uid, version_code and installer.
+    :param order: "asc" or "desc".
+    :param page: Page to show, starting at 1.
+    :param per_page: Packages per page, at most MAX_PER_PAGE.
     :return: Rendered HTML template with the list of installed packages.
     """
-    error_code, packages = await PackageManager.get_installed_packages()
+    refresh = request.query_params.get("refresh") in ("1", "true")
+    error_code, index = await cancel_on_disconnect(
+        request, PackageManager.get_package_index(refresh=refresh)
+    )
     if error_code == ErrorCodes.NO_DEVICE_SELECTED:
         return RedirectResponse("/devices", status_code=303)
     if error_code == ErrorCodes.NO_PACKAGES_FOUND:
@@ -76,35 +128,241 @@ async def get_packages(request: Request):
             "packages.html",
             {"request": request, "message": "No packages found on the device.", "success": False},
         )
-    return templates.TemplateResponse(
-        "packages.html", {"request": request, "packages": packages, "message": "", "success": True}
+    if error_code == ErrorCodes.FAILED_OPERATION:
+        return templates.TemplateResponse(
+            "packages.html",
+            {
+                "request": request,
+                "message": "Failed to read the packages of the device, try again.",
+                "success": False,
+            },
+        )
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    result = index.query(**package_query(q, kind, state, installer, sort, order, page, per_page))
+    devices = await DeviceManager.list_devices()
+    names = [package.name for package in result.packages]
+    knowledge = await asyncio.to_thread(knowledge_base.lookup_many, names)
+    # A page of hundreds of rows starts showing before it is rendered whole
+    return stream_template(
+        "packages.html",
+        {
+            "request": request,
+            "packages": result.packages,
+            "knowledge": knowledge,
+            "rules": rule_set.classify(names),
+            "result": result,
+            "installers": index.installers,
+            "filters": {
+                "q": q,
+                "kind": kind,
+                "state": state,
+                "installer": installer,
+                "sort": sort,
+                "order": order,
+                "per_page": per_page,
+            },
+            "devices": devices,
+            "message": "",
+            "success": True,
+        },
     )
 
 
+@router.get("/packages/changes")
+async def get_package_changes(request: Request, since: int | None = None):
+    """
+    Snapshot the packages of the selected device and report what changed since an
+    earlier snapshot. Without since, or when that snapshot is no longer known, the full
+    package list is returned together with the id of the new snapshot to poll from.
+    :param request: Asynchronous request object.
+    :param since: Id of the snapshot to compare with.
+    :return: JSON with the new snapshot id and either the changes or the full package list.
+    """
+    selected_device = await DeviceManager.get_selected_device()
+    if not selected_device:
+        return JSONResponse({"detail": "No device selected."}, status_code=409)
+    delta = None
+    if since is None:
+        error_code, snapshot = await PackageManager.take_snapshot(selected_device)
+    else:
+        error_code, snapshot, delta = await PackageManager.changes_since(selected_device, since)
+    if error_code == ErrorCodes.FAILED_OPERATION:
+        return JSONResponse(
+            {"detail": "Failed to read the packages of the device."}, status_code=502
+        )
+    if snapshot is None:
+        return JSONResponse({"detail": "No packages found on the device."}, status_code=502)
+    body = {
+        "serial_number": selected_device,
+        "snapshot_id": snapshot.id,
+        "taken_at": snapshot.taken_at,
+        "since": since if error_code == ErrorCodes.SUCCESS else None,
+    }
+    if delta is None:
+        body["packages"] = [package.to_dict() for package in snapshot.packages.values()]
+    else:
+        body["changes"] = delta.to_dict()
+    return JSONResponse(body)
+
+
 @router.post("/apply-actions")
 async def apply_action(request: Request):
     """
     Apply actions (disable or uninstall) on the selected packages.
-    This method processes the form data submitted from the packages page,
-    performs the specified actions on the packages, and returns the result.
+    The actions are queued as a job, the browser is sent to a page following its
+    progress live.
     :param request: Asynchronous request object containing the form data.
-    :return: Rendered HTML template with the result of the actions performed.
+    :return: RedirectResponse to the page of the job.
     """
     form = await request.form()
     action_form = dict(form)
-    error_code, failed_packages = await PackageManager.perform_action_on_packages(action_form)
-    if error_code == ErrorCodes.NO_DEVICE_SELECTED:
+    selected_device = await DeviceManager.get_selected_device()
+    if not selected_device:
         return RedirectResponse("/", status_code=303)
+    job_id = await job_queue.submit(selected_device, action_form)
+    return RedirectResponse(f"/actions/{job_id}", status_code=303)
+
+
+@router.get("/actions/{job_id}")
+async def get_action_run(request: Request, job_id: int):
+    """
+    Show the state of an action job, updated live from its event stream while it runs.
+    :param request: Asynchronous request object.
+    :param job_id: Id of the job.
+    :return: Rendered HTML template following the job.
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        return templates.TemplateResponse(
+            "status.html",
+            {"request": request, "message": "Unknown action job.", "success": False},
+            status_code=404,
+        )
     return templates.TemplateResponse(
-        "status.html",
+        "progress.html", {"request": request, "job": job, "active": job["status"] in ACTIVE}
+    )
+
+
+@router.post("/actions/{job_id}/cancel")
+async def cancel_action_run(request: Request, job_id: int):
+    """
+    Cancel an action job, the packages it already acted on are left as they are.
+    :param request: Asynchronous request object.
+    :param job_id: Id of the job.
+    :return: RedirectResponse to the page of the job.
+    """
+    await job_queue.cancel(job_id)
+    return RedirectResponse(f"/actions/{job_id}", status_code=303)
+
+
+@router.get("/actions/{job_id}/events")
+async def get_action_events(request: Request, job_id: int):
+    """
+    Stream the progress events of an action job as Server-Sent Events.
+    Every event carries its id, a reconnecting client resumes after Last-Event-ID.
+    :param request: Asynchronous request object.
+    :param job_id: Id of the job.
+    :return: A text/event-stream response ending with a done event.
+    """
+    run = progress_registry.get(str(job_id))
+    if run is None:
+        return JSONResponse({"detail": "Unknown or expired action job."}, status_code=404)
+    last_event_id = request.headers.get("last-event-id", "")
+    after = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def events():
+        async for event in run.follow(after, heartbeat=SSE_HEARTBEAT):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/apply-actions-fleet")
+async def apply_action_fleet(request: Request):
+    """
+    Apply actions (disable or uninstall) on the selected packages of several devices at once.
+    The form carries the same action fields as /apply-actions plus one serial_numbers
+    field per device to apply them on.
+    :param request: Asynchronous request object containing the form data.
+    :return: Rendered HTML template with a per device report of the actions performed.
+    """
+    form = await request.form()
+    serial_numbers = form.getlist("serial_numbers")
+    if not serial_numbers:
+        return RedirectResponse("/", status_code=303)
+    action_form = {key: value for key, value in form.items() if key != "serial_numbers"}
+    reports = await cancel_on_disconnect(
+        request, FleetManager.apply_actions(serial_numbers, action_form)
+    )
+    failed_devices = [report for report in reports.values() if report["error"] or report["failed"]]
+    return templates.TemplateResponse(
+        "fleet_status.html",
         {
             "request": request,
+            "reports": reports,
             "message": (
-                "Failed to perform actions on: " + "\n".join(failed_packages)
-                if failed_packages
-                else "Successfully applied actions."
+                f"Actions failed on {len(failed_devices)} of {len(reports)} devices."
+                if failed_devices
+                else f"Successfully applied actions on {len(reports)} devices."
             ),
-            "success": not failed_packages,
+            "success": not failed_devices,
+        },
+    )
+
+
+@router.get("/journal")
+async def get_journal(request: Request):
+    """
+    List the disable and uninstall actions on the selected device that can be undone.
+    :param request: Asynchronous request object.
+    :return: Rendered HTML template with the journal and a restore form.
+    """
+    selected_device = await DeviceManager.get_selected_device()
+    if not selected_device:
+        return RedirectResponse("/", status_code=303)
+    entries = await db_manager.get_journal(selected_device)
+    return templates.TemplateResponse(
+        "journal.html",
+        {"request": request, "serial_number": selected_device, "entries": entries},
+    )
+
+
+@router.post("/restore")
+async def restore(request: Request):
+    """
+    Undo the journaled actions on the packages of the form, on the selected device.
+    The form carries one packages field per package to restore.
+    :param request: Asynchronous request object containing the form data.
+    :return: Rendered HTML template with the report of the restore.
+    """
+    form = await request.form()
+    packages = form.getlist("packages")
+    selected_device = await DeviceManager.get_selected_device()
+    if not selected_device or not packages:
+        return RedirectResponse("/journal", status_code=303)
+    reports = await cancel_on_disconnect(
+        request, FleetManager.restore_actions([selected_device], packages=packages)
+    )
+    report = reports[selected_device]
+    success = not report["error"] and not report["failed"]
+    return templates.TemplateResponse(
+        "fleet_status.html",
+        {
+            "request": request,
+            "reports": reports,
+            "message": (
+                f"Restored {len(report['succeeded']) + len(report['skipped'])} packages."
+                if success
+                else "Failed to restore some packages."
+            ),
+            "success": success,
         },
     )
 
@@ -133,3 +391,56 @@ async def select_device(request: Request):
             "success": False,
         },
     )
+
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Expose request and adb command metrics to Prometheus.
+    :return: The metrics in the Prometheus text exposition format.
+    """
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/debug/traces")
+async def list_traces():
+    """
+    List the last traced requests, see src/tracing.py.
+    :return: JSON with the traces without their spans, latest first.
+    """
+    return JSONResponse({"traces": trace_store.list()})
+
+
+@router.get("/debug/traces/{trace_id}")
+async def get_trace(trace_id: int):
+    """
+    Show the span tree of a traced request.
+    :param trace_id: Id of the trace, from the X-Trace-Id header of the response.
+    :return: JSON with the trace and its spans.
+    """
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        return JSONResponse({"detail": "Unknown or expired trace."}, status_code=404)
+    return JSONResponse(trace)
+
+
+@router.get("/debug/profile")
+async def get_profile():
+    """
+    Show the state of the sampling profiler.
+    :return: JSON with the requests left to profile and the profile files.
+    """
+    return JSONResponse(sampling_profiler.status())
+
+
+@router.post("/debug/profile")
+async def start_profile(requests: int = 10):
+    """
+    Profile the next requests with the sampling profiler, see src/profiler.py.
+    :param requests: Number of requests to profile.
+    :return: JSON with the file the profile will be written to.
+    """
+    if requests < 1:
+        return JSONResponse({"detail": "requests must be at least 1."}, status_code=422)
+    path = sampling_profiler.arm(requests)
+    return JSONResponse({"requests": requests, "path": path}, status_code=202)
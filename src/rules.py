@@ -0,0 +1,266 @@
+"""
+Rules suggesting an action for packages by name, prefilled on the packages page.
+A rule matches a package name exactly, with a glob (``com.samsung.android.game.*``)
+or with a regular expression (``re:com\\.(att|sprint)\\..*``, without named groups,
+backreferences or global inline flags, ``(?i:...)`` scopes a flag).
+Exact names are looked up in a dict. Patterns are filed in a trie over name segments,
+a dict keyed by the dot-terminated prefix their literal start covers
+(``com.samsung.android.game.``). The patterns of one key are compiled into a single
+regular expression, alternatives in order of precedence, so classifying a package is a
+dict lookup per segment of its name and one match per key found, whatever the number of
+rules. Patterns without a literal prefix (``*.facebook.*``) are tried for every package.
+
+Precedence: the most specific rule wins. Exact names come first, then globs with the
+most literal characters, then regular expressions. Ties go to the rule loaded last, so
+user rules (BLOATWARE_RULES) override the bundled ones. A keep rule wins like any other
+and suggests no action.
+"""
+
+import hashlib
+import logging
+import os
+import re
+
+from .models import Rule
+
+RULE_ACTIONS = ("disable", "uninstall", "keep")
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCES = [os.path.join(script_dir, "data", "rules.tsv")]
+if os.environ.get("BLOATWARE_RULES"):
+    DEFAULT_SOURCES.append(os.environ["BLOATWARE_RULES"])
+
+
+class RuleSet:
+    """Rules loaded from tab separated files, compiled on first use."""
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, sources: list[str]):
+        self.sources = sources
+        self._rules: list[Rule] | None = None
+        self._exact: dict[str, Rule] = {}
+        # Patterns in order of precedence, and their positions in it by segment prefix
+        self._patterns: list[Rule] = []
+        self._trie: dict[str, list[int]] = {}
+        self._matchers: dict[str, list[re.Pattern]] = {}
+        self._version = ""
+
+    @property
+    def rules(self) -> list[Rule]:
+        """Every rule, in order of precedence."""
+        self._load()
+        return self._rules
+
+    @property
+    def version(self) -> str:
+        """Hash of the rules, changes whenever a rule does."""
+        self._load()
+        return self._version
+
+    def match(self, package: str) -> Rule | None:
+        """:return: The rule of highest precedence matching the package, or None."""
+        self._load()
+        rule = self._exact.get(package)
+        if rule is not None or not self._trie:
+            return rule
+        best = None
+        end = 0
+        while end >= 0:
+            key = package[:end]
+            if key in self._trie:
+                for matcher in self._matcher(key):
+                    match = matcher.fullmatch(package)
+                    if match is not None:
+                        position = int(match.lastgroup[1:])
+                        if best is None or position < best:
+                            best = position
+                        break
+            end = package.find(".", end) + 1 or -1
+        return self._patterns[best] if best is not None else None
+
+    def classify(self, packages) -> dict[str, Rule]:
+        """
+        Match a whole inventory.
+        :param packages: Package names.
+        :return: The winning rule by package name, packages no rule matches are left out.
+        """
+        matches = {}
+        for package in packages:
+            rule = self.match(package)
+            if rule is not None:
+                matches[package] = rule
+        return matches
+
+    def suggestions(self, packages) -> dict[str, str]:
+        """:return: The suggested action by package name, without the kept packages."""
+        return {
+            package: rule.action
+            for package, rule in self.classify(packages).items()
+            if rule.action != "keep"
+        }
+
+    def read_rules(self):
+        """
+        Parse the source files, in order.
+        :return: An iterator of Rule, malformed lines are logged and skipped.
+        """
+        for path in self.sources:
+            try:
+                source = open(path, encoding="utf-8")
+            except OSError as e:
+                self.logger.error(f"[ERROR] Failed to read rules from {path} because {e}")
+                continue
+            with source:
+                for number, line in enumerate(source, 1):
+                    line = line.rstrip("\n")
+                    if not line or line.startswith("#") or line.startswith("pattern\t"):
+                        continue
+                    fields = line.split("\t")
+                    rule = Rule(*fields[:3]) if 2 <= len(fields) <= 3 else None
+                    if rule is None or rule.action not in RULE_ACTIONS or not _valid(rule):
+                        self.logger.warning(f"Skipping line {number} of {path}")
+                        continue
+                    yield rule
+
+    def _matcher(self, key: str) -> list[re.Pattern]:
+        """
+        :return: The regular expressions of the patterns of a key, in order of precedence,
+            the first one matching holds the winner. One for all of them unless they do not
+            compile together, then one per pattern.
+        """
+        # Compiled on first use, most keys are never hit by a given inventory
+        matchers = self._matchers.get(key)
+        if matchers is None:
+            alternatives = [
+                f"(?P<r{position}>{_to_regex(self._patterns[position])})"
+                for position in self._trie[key]
+            ]
+            try:
+                matchers = [re.compile("|".join(alternatives))]
+            except re.error as e:
+                self.logger.warning(f"Matching the rules of {key or '*'} one by one because {e}")
+                matchers = []
+                for alternative in alternatives:
+                    try:
+                        matchers.append(re.compile(alternative))
+                    except re.error as e:
+                        self.logger.error(f"[ERROR] Skipping rule {alternative} because {e}")
+            self._matchers[key] = matchers
+        return matchers
+
+    def _load(self):
+        if self._rules is None:
+            self._compile(list(self.read_rules()))
+
+    def _compile(self, rules: list[Rule]):
+        positions = {rule: position for position, rule in enumerate(rules)}
+        # Later duplicates replace earlier ones
+        self._exact = {rule.pattern: rule for rule in rules if rule.is_exact}
+        self._patterns = sorted(
+            (rule for rule in rules if not rule.is_exact),
+            key=lambda rule: (not rule.is_regex, _literal_length(rule), positions[rule]),
+            reverse=True,
+        )
+        self._trie = {}
+        self._matchers = {}
+        for position, rule in enumerate(self._patterns):
+            self._trie.setdefault(_segment_prefix(rule), []).append(position)
+        exact = sorted(self._exact.values(), key=positions.get, reverse=True)
+        self._rules = exact + self._patterns
+        digest = hashlib.sha1()
+        for rule in self._rules:
+            digest.update(f"{rule.pattern}\t{rule.action}\n".encode())
+        self._version = digest.hexdigest()[:16]
+        self.logger.info(f"Compiled {len(self._rules)} package rules")
+
+
+def _to_regex(rule: Rule) -> str:
+    if rule.is_regex:
+        return f"(?:{rule.pattern[3:]})"
+    return re.escape(rule.pattern).replace(r"\*", ".*").replace(r"\?", ".")
+
+
+def _segment_prefix(rule: Rule) -> str:
+    """:return: The longest dot-terminated prefix every name the rule matches starts with."""
+    prefix = (
+        _regex_prefix(rule.pattern[3:]) if rule.is_regex else re.split(r"[*?]", rule.pattern)[0]
+    )
+    return prefix[: prefix.rfind(".") + 1]
+
+
+def _regex_prefix(regex: str) -> str:
+    """:return: The literal characters a regular expression starts with."""
+    # Alternatives outside any group share no prefix
+    depth = 0
+    escaped = in_class = False
+    for char in regex:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char in "()":
+            depth += 1 if char == "(" else -1
+        elif char == "|" and depth == 0:
+            return ""
+    prefix = []
+    position = 0
+    while position < len(regex):
+        char = regex[position]
+        if char == "\\" and position + 1 < len(regex) and not regex[position + 1].isalnum():
+            literal = regex[position + 1]
+            position += 2
+        elif char in ".^$*+?{}[]|()\\":
+            break
+        else:
+            literal = char
+            position += 1
+        if position < len(regex) and regex[position] in "*?{":
+            # The literal is optional
+            break
+        prefix.append(literal)
+    return "".join(prefix)
+
+
+def _literal_length(rule: Rule) -> int:
+    if rule.is_regex:
+        return 0
+    return len(rule.pattern) - rule.pattern.count("*") - rule.pattern.count("?")
+
+
+def _valid(rule: Rule) -> bool:
+    if not rule.is_regex:
+        return bool(rule.pattern)
+    if _has_backreference(rule.pattern[3:]):
+        # Group numbers shift once the rule joins the others
+        return False
+    try:
+        # Compiled as it is combined with the others, global flags cannot be. Groups of
+        # their own would be mistaken for the rule that matched
+        return len(re.compile(f"(?P<r0>{_to_regex(rule)})").groupindex) == 1
+    except re.error:
+        return False
+
+
+def _has_backreference(regex: str) -> bool:
+    """:return: Whether the regular expression refers back to a group by number."""
+    escaped = in_class = False
+    for char in regex:
+        if escaped:
+            escaped = False
+            # In a class, digits after a backslash are an octal escape
+            if char in "123456789" and not in_class:
+                return True
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+    return False
+
+
+rule_set = RuleSet(DEFAULT_SOURCES)
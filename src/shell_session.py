@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import uuid
+
+from .cmd_manager import CommandResult
+from .metrics import CommandTimer, adb_read_bytes, outcome, shell_command_name
+
+
+class SessionDied(Exception):
+    """Raised when the shell process of a session exits while a command is running."""
+
+
+class ShellSession:
+    """
+    A long lived ``adb shell`` process for one device.
+    Commands are written to the shell stdin one after another, each followed by a
+    sentinel line carrying its exit code, so the output of every command can be cut
+    back out of the shared stdout stream.
+    """
+
+    logger = logging.getLogger(__name__)
+    default_timeout = 30.0
+    stream_limit = 2**20
+
+    def __init__(self, serial: str, args: list[str] | None = None):
+        self.serial = serial
+        self.args = args or ["adb", "-s", serial, "shell"]
+        self.process = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        """Start the shell process for the device."""
+        self.logger.debug(f"Starting shell session for {self.serial}")
+        self.process = await asyncio.create_subprocess_exec(
+            *self.args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            limit=self.stream_limit,
+        )
+
+    async def close(self, graceful: bool = True):
+        """
+        Stop the shell process if it is still running.
+        :param graceful: Let the shell exit on end of input first instead of killing it.
+        """
+        process, self.process = self.process, None
+        if process is None or process.returncode is not None:
+            return
+        self.logger.debug(f"Closing shell session for {self.serial}")
+        if graceful:
+            process.stdin.close()
+            try:
+                await asyncio.wait_for(process.wait(), 1.0)
+                return
+            except asyncio.TimeoutError:
+                pass
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+    async def execute(
+        self, command: str, timeout: float | None = None, on_line=None
+    ) -> CommandResult:
+        """
+        Run a shell command on the device through the session.
+        The session is (re)started when needed; a command that finds the shell dead is retried
+        once on a fresh session.
+        :param command: The command line, interpreted by the device shell.
+        :param timeout: Seconds to wait for the command before the session is torn down.
+        :param on_line: Optional callable receiving every output line as soon as it is read.
+        :return: A CommandResult with the exit code and the combined stdout/stderr.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        async with self._lock:
+            with CommandTimer(shell_command_name(command), "session", self.serial) as timer:
+                result = await self._attempt(command, timeout, on_line)
+                timer.outcome = outcome(result)
+                return result
+
+    async def _attempt(self, command: str, timeout: float, on_line) -> CommandResult:
+        for attempt in range(2):
+            if not self.is_alive:
+                try:
+                    await self.start()
+                except OSError as e:
+                    self.logger.error(f"[ERROR] Failed to start shell for {self.serial}: {e}")
+                    return CommandResult(args=[command], returncode=None, stderr=str(e))
+            try:
+                return await asyncio.wait_for(self._execute(command, on_line), timeout)
+            except SessionDied as e:
+                await self.close()
+                if attempt:
+                    self.logger.error(f"[ERROR] Shell session for {self.serial} died")
+                    return CommandResult(args=[command], returncode=None, stdout=str(e))
+                self.logger.warning(f"Shell session for {self.serial} died, restarting")
+            except asyncio.TimeoutError:
+                self.logger.error(f"[ERROR] Command {command} timed out after {timeout}s")
+                await self.close(graceful=False)
+                return CommandResult(args=[command], returncode=None, timed_out=True)
+            except (ValueError, asyncio.LimitOverrunError) as e:
+                # A line longer than stream_limit, the rest of it is left in the stream
+                self.logger.error(f"[ERROR] Command {command} printed a line too long because {e}")
+                await self.close(graceful=False)
+                return CommandResult(args=[command], returncode=None, stderr=str(e))
+            except asyncio.CancelledError:
+                # The rest of the output is still on its way, the stream cannot be reused
+                await self.close(graceful=False)
+                raise
+
+    async def _execute(self, command: str, on_line=None) -> CommandResult:
+        token = f"__BWR_{uuid.uuid4().hex}__"
+        script = f"{{ {command}\n}} </dev/null 2>&1; echo \"{token} $?\"\n"
+        try:
+            self.process.stdin.write(script.encode())
+            await self.process.stdin.drain()
+        except ConnectionError as e:
+            raise SessionDied(str(e))
+
+        output = []
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                raise SessionDied("".join(output))
+            adb_read_bytes.inc(("session",), len(line))
+            line = line.decode(errors="replace")
+            index = line.find(token)
+            if index == -1:
+                output.append(line)
+                if on_line is not None:
+                    on_line(line)
+                continue
+            output.append(line[:index])
+            returncode = int(line[index + len(token) :].strip() or -1)
+            return CommandResult(args=[command], returncode=returncode, stdout="".join(output))
+
+
+class ShellSessionManager:
+    """Keeps the ShellSessions of every device, one per (serial, slot) pair."""
+
+    def __init__(self):
+        self.sessions: dict[tuple[str, int], ShellSession] = {}
+
+    def get(self, serial: str, slot: int = 0) -> ShellSession:
+        session = self.sessions.get((serial, slot))
+        if session is None:
+            session = self.sessions[(serial, slot)] = ShellSession(serial)
+        return session
+
+    async def execute(
+        self,
+        serial: str,
+        command: str,
+        timeout: float | None = None,
+        slot: int = 0,
+        on_line=None,
+    ):
+        """
+        Run a shell command on a device through its persistent session.
+        :param serial: Serial number of the device.
+        :param command: The command line, interpreted by the device shell.
+        :param timeout: Seconds to wait for the command.
+        :param slot: Which of the sessions of the device to use, for parallel work on one device.
+        :param on_line: Optional callable receiving every output line as soon as it is read.
+        :return: A CommandResult for the command.
+        """
+        return await self.get(serial, slot).execute(command, timeout=timeout, on_line=on_line)
+
+    async def close(self, serial: str):
+        for key in [key for key in self.sessions if key[0] == serial]:
+            await self.sessions.pop(key).close()
+
+    async def close_all(self):
+        for serial in {serial for serial, _ in self.sessions}:
+            await self.close(serial)
+
+
+shell_sessions = ShellSessionManager()
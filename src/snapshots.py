@@ -0,0 +1,108 @@
+from dataclasses import dataclass, field
+import itertools
+import logging
+import time
+
+from .models import PackageInfo
+
+
+@dataclass
+class Snapshot:
+    """The packages of a device at one point in time."""
+
+    id: int
+    serial_number: str
+    taken_at: float
+    packages: dict[str, PackageInfo]
+
+
+@dataclass
+class PackageDelta:
+    """What changed on a device between two snapshots."""
+
+    added: list[PackageInfo] = field(default_factory=list)
+    removed: list[PackageInfo] = field(default_factory=list)
+    updated: list[PackageInfo] = field(default_factory=list)
+    enabled: list[PackageInfo] = field(default_factory=list)
+    disabled: list[PackageInfo] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return any((self.added, self.removed, self.updated, self.enabled, self.disabled))
+
+    def to_dict(self) -> dict:
+        return {
+            key: [package.to_dict() for package in getattr(self, key)]
+            for key in ("added", "removed", "updated", "enabled", "disabled")
+        }
+
+
+def diff_packages(old: dict[str, PackageInfo], new: dict[str, PackageInfo]) -> PackageDelta:
+    """
+    Compute the delta between two package maps.
+    A package whose version code or uid changed is reported as updated, a package
+    whose enabled state flipped is reported as enabled or disabled.
+    :return: A PackageDelta holding the new state of every changed package
+     (the old state for removed packages).
+    """
+    delta = PackageDelta()
+    for name, package in new.items():
+        previous = old.get(name)
+        if previous is None:
+            delta.added.append(package)
+            continue
+        if (previous.version_code, previous.uid) != (package.version_code, package.uid):
+            delta.updated.append(package)
+        if previous.enabled != package.enabled:
+            (delta.enabled if package.enabled else delta.disabled).append(package)
+    delta.removed = [package for name, package in old.items() if name not in new]
+    return delta
+
+
+class SnapshotStore:
+    """Keeps the last max_history snapshots of every device."""
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, max_history: int = 10):
+        self.max_history = max_history
+        self._snapshots: dict[str, list[Snapshot]] = {}
+        self._ids = itertools.count(1)
+
+    def add(
+        self,
+        serial_number: str,
+        packages: dict[str, PackageInfo],
+        snapshot_id: int | None = None,
+        taken_at: float | None = None,
+    ) -> Snapshot:
+        """
+        Keep a snapshot of a device.
+        :param snapshot_id: Id given by the database, a new one when it could not be stored.
+        :param taken_at: When the packages were listed, now by default.
+        """
+        snapshot = Snapshot(
+            snapshot_id if snapshot_id is not None else next(self._ids),
+            serial_number,
+            taken_at if taken_at is not None else time.time(),
+            packages,
+        )
+        history = self._snapshots.setdefault(serial_number, [])
+        history.append(snapshot)
+        del history[: -self.max_history]
+        return snapshot
+
+    def get(self, serial_number: str, snapshot_id: int) -> Snapshot | None:
+        for snapshot in self._snapshots.get(serial_number, []):
+            if snapshot.id == snapshot_id:
+                return snapshot
+        return None
+
+    def latest(self, serial_number: str) -> Snapshot | None:
+        history = self._snapshots.get(serial_number)
+        return history[-1] if history else None
+
+    def clear(self):
+        self._snapshots.clear()
+
+
+snapshot_store = SnapshotStore()
@@ -0,0 +1,44 @@
+"""
+Timing of the phases of a start, reported by ``bloatware-remover --startup-profile``.
+Kept free of heavy imports: it is imported first, and its import marks time zero.
+"""
+
+from contextlib import contextmanager
+import time
+
+
+class StartupTimer:
+    """Phases of a start as (name, start, end) in seconds since the timer was created."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.phases: list[tuple[str, float, float]] = []
+
+    def add(self, name: str, start: float, end: float):
+        """Record a phase from perf_counter times."""
+        self.phases.append((name, start - self.origin, end - self.origin))
+
+    def mark(self, name: str):
+        """Record a point in time, e.g. the server starting to listen."""
+        now = time.perf_counter()
+        self.add(name, now, now)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def report(self) -> str:
+        """:return: A table of the phases, in milliseconds, ordered by start."""
+        lines = [f"{'phase':<32}{'start':>9}{'end':>9}{'took':>9}  (ms)"]
+        for name, start, end in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(
+                f"{name:<32}{start * 1e3:>9.1f}{end * 1e3:>9.1f}{(end - start) * 1e3:>9.1f}"
+            )
+        return "\n".join(lines)
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,101 @@
+"""
+The Jinja environment of the HTML pages: templates compiled once and kept on disk across
+processes, renders timed in request traces, and large pages streamed while they render.
+"""
+
+import logging
+import os
+import time
+
+from fastapi.responses import StreamingResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, Template
+
+from .knowledge_base import DEFAULT_CACHE_DIR
+from .tracing import record, span
+
+# Rendered HTML sent at once by a streamed page, small enough for the first rows to go
+# out early and large enough not to pay the thread pool hop for every few bytes
+STREAM_CHUNK_SIZE = 16 * 1024
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class TracedTemplate(Template):
+    """A template rendering in a span of the request trace, see src/tracing.py."""
+
+    def render(self, *args, **kwargs) -> str:
+        with span(self.name or "template", "template"):
+            return super().render(*args, **kwargs)
+
+    def generate(self, *args, **kwargs):
+        # A generator cannot hold a span open across its yields, it is recorded at the end
+        start = time.perf_counter()
+        try:
+            yield from super().generate(*args, **kwargs)
+        finally:
+            record(self.name or "template", "template", start, streamed=True)
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """
+    Compiled templates kept in a directory, created on the first write, an unusable
+    directory only costs compiling the templates in every process. Keyed by template
+    name only, so a bundled build unpacking its templates to a new directory on every
+    start still finds them. Jinja checks the source checksum kept with the bytecode, a
+    changed template is compiled again.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def get_cache_key(self, name: str, filename: str | None = None) -> str:
+        return super().get_cache_key(name)
+
+    def load_bytecode(self, bucket):
+        try:
+            super().load_bytecode(bucket)
+        except OSError as e:
+            self.logger.error(
+                f"[ERROR] Failed to load the cached template {bucket.key} because {e}"
+            )
+
+    def dump_bytecode(self, bucket):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            super().dump_bytecode(bucket)
+        except OSError as e:
+            self.logger.error(f"[ERROR] Failed to cache the template {bucket.key} because {e}")
+
+
+def _batches(chunks, size: int):
+    """:return: An iterator joining the chunks into strings of at least size characters."""
+    batch, length = [], 0
+    for chunk in chunks:
+        batch.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(batch)
+            batch, length = [], 0
+    if batch:
+        yield "".join(batch)
+
+
+def stream_template(name: str, context: dict, status_code: int = 200) -> StreamingResponse:
+    """
+    Send a page while it renders instead of rendering it whole first, so the browser gets
+    the top of a long page early. The template runs in the thread pool, one chunk of
+    STREAM_CHUNK_SIZE at a time, off the event loop. An error in the template can only cut
+    the page short, the status is already sent.
+    :param context: The template context, with the request.
+    :return: A StreamingResponse with the page.
+    """
+    template = templates.get_template(name)
+    return StreamingResponse(
+        _batches(template.generate(context), STREAM_CHUNK_SIZE),
+        status_code=status_code,
+        media_type="text/html; charset=utf-8",
+    )
+
+
+templates = Jinja2Templates(directory=os.path.join(script_dir, "templates"))
+templates.env.template_class = TracedTemplate
+templates.env.bytecode_cache = TemplateBytecodeCache(os.path.join(DEFAULT_CACHE_DIR, "templates"))
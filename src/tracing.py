@@ -0,0 +1,212 @@
+"""
+Per-request traces: a tree of timed spans for the adb commands, database calls and
+template renders a request went through, to see where a slow request spent its time.
+
+A request is traced when it carries an ``X-Trace: 1`` header, or every request when
+BLOATWARE_TRACE is set. Its response then carries a ``Server-Timing`` header (shown by
+browser developer tools) with the total and the time per kind of span, and an
+``X-Trace-Id`` header. The full tree is kept for the last traced requests and served
+at ``/debug/traces/<id>``. Untraced requests only pay for a context variable lookup
+per span.
+
+Spans follow the request into the tasks it starts, concurrent spans overlap, so the
+times per kind can add up to more than the total. Work left to background jobs is not
+part of the request and is not traced.
+"""
+
+from collections import OrderedDict
+from contextlib import nullcontext
+from contextvars import ContextVar
+import functools
+import inspect
+import itertools
+import os
+import time
+
+# Traced requests kept for /debug/traces
+MAX_TRACES = 100
+TRACE_HEADER = b"x-trace"
+_current: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_NOOP = nullcontext()
+
+
+class Span:
+    """A timed operation and the spans started while it ran."""
+
+    __slots__ = ("name", "kind", "attributes", "start", "end", "children", "_token")
+
+    def __init__(self, name: str, kind: str, attributes: dict | None = None, start=None, end=None):
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start = start
+        self.end = end
+        self.children: list[Span] = []
+
+    @property
+    def duration(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) if self.start else 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _current.reset(self._token)
+        return False
+
+    def to_dict(self, origin: float | None = None) -> dict:
+        """:return: The span tree, offsets and durations in milliseconds from the root."""
+        origin = self.start if origin is None else origin
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "offset_ms": round((self.start - origin) * 1e3, 3),
+            "duration_ms": round(self.duration * 1e3, 3),
+            **({"attributes": self.attributes} if self.attributes else {}),
+            "children": [child.to_dict(origin) for child in self.children],
+        }
+
+    def durations(self) -> dict[str, float]:
+        """:return: Seconds per kind of span below this one, spans nested in their kind not counted."""
+        totals = {}
+
+        def visit(span: Span, kinds: frozenset):
+            for child in span.children:
+                if child.kind not in kinds:
+                    totals[child.kind] = totals.get(child.kind, 0.0) + child.duration
+                visit(child, kinds | {child.kind})
+
+        visit(self, frozenset())
+        return totals
+
+
+def span(name: str, kind: str, **attributes):
+    """
+    A context manager timing a span of the current trace, nothing when there is none.
+    :param kind: Kind of the span, e.g. adb, db or template.
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    child = Span(name, kind, attributes)
+    parent.children.append(child)
+    return child
+
+
+def record(name: str, kind: str, start: float, **attributes):
+    """
+    Add a span that ended now to the current trace. Unlike span, it never becomes the
+    current span, so it can time code spanning the yields of a generator.
+    """
+    parent = _current.get()
+    if parent is not None:
+        parent.children.append(Span(name, kind, attributes, start, time.perf_counter()))
+
+
+def traced_methods(kind: str):
+    """A class decorator putting every public coroutine method in a span named after it."""
+
+    def wrap(method):
+        @functools.wraps(method)
+        async def traced(self, *args, **kwargs):
+            with span(method.__name__, kind):
+                return await method(self, *args, **kwargs)
+
+        return traced
+
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(method):
+                setattr(cls, name, wrap(method))
+        return cls
+
+    return decorate
+
+
+class TraceStore:
+    """The span trees of the last traced requests."""
+
+    def __init__(self, size: int = MAX_TRACES):
+        self.size = size
+        self.ids = itertools.count(1)
+        self.traces: OrderedDict[int, dict] = OrderedDict()
+
+    def add(self, trace: dict) -> int:
+        """:return: The id given to the trace, which is kept as is to be completed later."""
+        trace_id = trace["id"] = next(self.ids)
+        self.traces[trace_id] = trace
+        while len(self.traces) > self.size:
+            self.traces.popitem(last=False)
+        return trace_id
+
+    def get(self, trace_id: int) -> dict | None:
+        return self.traces.get(trace_id)
+
+    def list(self) -> list[dict]:
+        """:return: The traces without their spans, latest first."""
+        return [
+            {key: value for key, value in trace.items() if key != "spans"}
+            for trace in reversed(self.traces.values())
+        ]
+
+    def clear(self):
+        self.traces.clear()
+
+
+def server_timing(root: Span) -> str:
+    """:return: A Server-Timing header value with the total and the time per kind of span."""
+    entries = [f"total;dur={root.duration * 1e3:.1f}"]
+    entries.extend(
+        f"{kind};dur={seconds * 1e3:.1f}" for kind, seconds in sorted(root.durations().items())
+    )
+    return ", ".join(entries)
+
+
+class TracingMiddleware:
+    """ASGI middleware tracing the requests asking for it, or all of them with trace_all."""
+
+    def __init__(self, app, store: "TraceStore | None" = None, trace_all: bool | None = None):
+        self.app = app
+        self.store = trace_store if store is None else store
+        self.trace_all = bool(os.environ.get("BLOATWARE_TRACE")) if trace_all is None else trace_all
+
+    def wants_trace(self, scope) -> bool:
+        if self.trace_all:
+            return True
+        return any(name == TRACE_HEADER and value != b"0" for name, value in scope["headers"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.wants_trace(scope):
+            return await self.app(scope, receive, send)
+        root = Span(f"{scope['method']} {scope['path']}", "request")
+        trace = {"id": None, "method": scope["method"], "path": scope["path"], "status": None}
+        trace_id = self.store.add(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(root).encode()))
+                headers.append((b"x-trace-id", str(trace_id).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            with root:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            trace.update(
+                route=getattr(route, "path", None),
+                started_at=time.time() - root.duration,
+                duration_ms=round(root.duration * 1e3, 3),
+                spans=root.to_dict(),
+            )
+
+
+trace_store = TraceStore()
@@ -1,7 +1,11 @@
+import asyncio
 import logging
 import subprocess
 
+from .exceptions import ClientDisconnected
+
 logger = logging.getLogger(__name__)
+DISCONNECT_POLL_INTERVAL = 0.5
 
 
 def check_adb():
@@ -26,5 +30,35 @@ def show_cli_help():
     logger.info("\nUsage:")
     logger.info("  bloatware-remover          # Start the web server")
     logger.info("  bloatware-remover --help   # Show this help")
+    logger.info("  bloatware-remover --startup-profile  # Start and time the startup phases")
+    logger.info("  bloatware-remover loadtest # Load test the web app on fake devices")
+    logger.info("                             # (loadtest --help for the options)")
     logger.info("\nAfter starting, open http://localhost:8000 in your browser")
     return
+
+
+async def cancel_on_disconnect(request, awaitable, poll_interval=DISCONNECT_POLL_INTERVAL):
+    """
+    Await a coroutine while watching the HTTP client of a request.
+    If the client disconnects first the coroutine is cancelled, which in turn kills
+    any adb process it is waiting on.
+    :param request: The request whose client connection is watched.
+    :param awaitable: The coroutine doing the work for the request.
+    :param poll_interval: Seconds between two disconnect checks.
+    :return: The result of the awaitable.
+    :raises ClientDisconnected: If the client went away before the work finished.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected from {request.url.path}, cancelling work")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise ClientDisconnected(request.url.path)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
@@ -1,11 +1,23 @@
 import asyncio
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from fastapi.testclient import TestClient
 import pytest
-
-from src.db import db_manager
-from src.main import app
+import pytest_asyncio
+
+from src import api, jobs
+from src.adb_client import Adb
+from src.app import app
+from src.cmd_manager import CommandResult
+from src.db import DbManger, db_manager
+from src.jobs import job_queue
+from src.knowledge_base import knowledge_base
+from src.metrics import registry
+from src.package_cache import package_cache
+from src.pkg_manager import PackageManager
+from src.progress import progress_registry
+from src.snapshots import snapshot_store
+from src.templating import templates
 
 
 @pytest.fixture(scope="function", autouse=True)
@@ -31,7 +43,73 @@ def mock_db_connection():
                     with patch.object(db_manager, 'set_selected_device'):
                         with patch.object(db_manager, 'create_tables'):
                             with patch.object(db_manager, 'close'):
-                                yield
+                                with patch.multiple(
+                                    db_manager,
+                                    upsert_devices=AsyncMock(),
+                                    save_snapshot=AsyncMock(return_value=None),
+                                    get_snapshot=AsyncMock(return_value=None),
+                                    get_latest_snapshots=AsyncMock(return_value=[]),
+                                    record_actions=AsyncMock(),
+                                    get_journal=AsyncMock(return_value=[]),
+                                    mark_restored=AsyncMock(),
+                                ):
+                                    yield
+
+
+@pytest.fixture(autouse=True)
+def subprocess_adb_backend():
+    """Keep tests away from any adb server running on the machine"""
+    with patch.object(Adb, 'backend', "subprocess"):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def apply_without_planning():
+    """Send every operation to the device, tests of the planner turn it back on"""
+    with patch.object(PackageManager, 'skip_unchanged', False):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def empty_package_cache():
+    """Every test starts without cached inventories, snapshots, action runs or metrics"""
+    package_cache.clear()
+    snapshot_store.clear()
+    progress_registry.clear()
+    registry.clear()
+    yield
+    package_cache.clear()
+    snapshot_store.clear()
+    progress_registry.clear()
+    registry.clear()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def knowledge_base_cache(tmp_path_factory):
+    """Build the knowledge base index away from the user's cache directory"""
+    with patch.object(knowledge_base, 'cache_dir', str(tmp_path_factory.mktemp("cache"))):
+        yield
+    knowledge_base.close()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def template_cache(tmp_path_factory):
+    """Keep compiled templates away from the user's cache directory"""
+    cache = templates.env.bytecode_cache
+    with patch.object(cache, 'directory', str(tmp_path_factory.mktemp("templates"))):
+        yield
+
+
+@pytest_asyncio.fixture
+async def job_db():
+    """A real in-memory database behind the job queue, with the queue emptied"""
+    database = DbManger()
+    await database.connect()
+    await database.create_tables()
+    with patch.object(jobs, 'db_manager', database), patch.object(api, 'db_manager', database):
+        with patch.object(job_queue, '_queue', asyncio.Queue()):
+            yield database
+    await database.close()
 
 
 @pytest.fixture
@@ -43,11 +121,12 @@ def client():
 @pytest.fixture
 def mock_adb_connection():
     """Mock ADB connection for testing"""
-    with patch('subprocess.Popen') as mock_popen:
+    with patch('asyncio.create_subprocess_exec', new_callable=AsyncMock) as mock_exec:
         mock_process = MagicMock()
-        mock_process.communicate.return_value = ("Success", "")
-        mock_popen.return_value = mock_process
-        yield mock_popen
+        mock_process.communicate = AsyncMock(return_value=(b"Success", b""))
+        mock_process.returncode = 0
+        mock_exec.return_value = mock_process
+        yield mock_exec
 
 
 @pytest.fixture
@@ -65,17 +144,17 @@ def mock_package_list():
 @pytest.fixture
 def mock_successful_action():
     """Mock successful package action"""
-    with patch('src.cmd_manager.CommandManager.execute_command') as mock_execute:
-        mock_execute.return_value = "Success"
-        yield mock_execute
+    with patch('src.cmd_manager.CommandManager.run', new_callable=AsyncMock) as mock_run:
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout="Success")
+        yield mock_run
 
 
 @pytest.fixture
 def mock_failed_action():
     """Mock failed package action"""
-    with patch('src.cmd_manager.CommandManager.execute_command') as mock_execute:
-        mock_execute.return_value = "Failure: Package not found"
-        yield mock_execute
+    with patch('src.cmd_manager.CommandManager.run', new_callable=AsyncMock) as mock_run:
+        mock_run.return_value = CommandResult(args=[], returncode=1, stdout="Failure")
+        yield mock_run
 
 
 @pytest.fixture
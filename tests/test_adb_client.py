@@ -0,0 +1,216 @@
+import socket
+import sys
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+import pytest_asyncio
+
+from src.adb_client import Adb, AdbClient, AdbProtocolError
+from src.cmd_manager import CommandManager, CommandResult
+from src.device_manager import DeviceManager
+from src.exceptions import StreamInterrupted
+from src.fake_adb_server import FakeAdbServer, FakeDevice
+from src.pkg_manager import PackageManager
+from src.shell_session import ShellSession
+
+
+@pytest_asyncio.fixture
+async def fake_server():
+    devices = [
+        FakeDevice("emulator-5554", model="Pixel_7", packages=["com.example.app1"]),
+        FakeDevice("legacy01", model="Nexus_5", packages=["com.example.app2"], shell_v2=False),
+        FakeDevice("serial789", state="unauthorized"),
+    ]
+    async with FakeAdbServer(devices) as server:
+        yield server
+
+
+@pytest.fixture
+def client(fake_server):
+    return AdbClient(port=fake_server.port)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestAdbClient:
+    """Test cases for AdbClient against the fake adb server"""
+
+    @pytest.mark.asyncio
+    async def test_version(self, client):
+        assert await client.version() == 41
+
+    @pytest.mark.asyncio
+    async def test_devices(self, client):
+        output = await client.devices()
+
+        lines = output.splitlines()
+        assert lines[0].startswith("emulator-5554\tdevice ")
+        assert "model:Pixel_7" in lines[0]
+        assert lines[2] == "serial789\tunauthorized"
+
+    @pytest.mark.asyncio
+    async def test_shell_v2_separates_streams(self, client):
+        result = await client.shell("emulator-5554", "pm list packages")
+        failed = await client.shell("emulator-5554", "pm disable-user --user 0 com.missing")
+
+        assert result == CommandResult(
+            args=["pm list packages"], returncode=0, stdout="package:com.example.app1\n"
+        )
+        assert failed.returncode == 255
+        assert failed.stdout == ""
+        assert "Unknown package: com.missing" in failed.stderr
+
+    @pytest.mark.asyncio
+    async def test_shell_legacy_device(self, client, fake_server):
+        result = await client.shell("legacy01", "pm list packages")
+
+        assert result.stdout == "package:com.example.app2\n"
+        assert "shell:pm list packages" in fake_server.requests
+
+    @pytest.mark.asyncio
+    async def test_shell_stream(self, client, fake_server):
+        """Test that both shell protocols stream stdout and leave stderr out"""
+        fake_server.add_device(FakeDevice("big01", packages=[f"com.app{i}" for i in range(5000)]))
+        reader, writer, v2 = await client.open_shell("big01", "dumpsys package")
+        chunks = [chunk async for chunk in client.iter_shell_stdout(reader, writer, v2)]
+        reader, writer, v2 = await client.open_shell("legacy01", "pm list packages")
+        legacy = [chunk async for chunk in client.iter_shell_stdout(reader, writer, v2)]
+
+        assert len(chunks) > 1
+        assert "".join(chunks).count("  Package [") == 5000
+        assert legacy == ["package:com.example.app2\n"]
+
+    @pytest.mark.asyncio
+    async def test_shell_unknown_device(self, client):
+        with pytest.raises(AdbProtocolError):
+            await client.shell("missing", "pm list packages")
+
+    @pytest.mark.asyncio
+    async def test_pair(self, client):
+        assert (await client.pair("192.168.1.100:5555", "123456")).startswith("Successfully")
+        assert (await client.pair("192.168.1.100:5555", "000000")).startswith("Failed")
+
+
+class TestAdb:
+    """Test cases for the Adb backend selection"""
+
+    @pytest.mark.asyncio
+    async def test_native_backend(self, client):
+        with patch.object(Adb, 'backend', "native"), patch.object(Adb, 'client', client):
+            with patch.object(CommandManager, 'run', new_callable=AsyncMock) as mock_run:
+                result = await Adb.shell("emulator-5554", "pm list packages")
+                devices = await DeviceManager.list_devices()
+
+        mock_run.assert_not_called()
+        assert result.stdout == "package:com.example.app1\n"
+        assert [device["model"] for device in devices] == ["Pixel_7", "Nexus_5", "Unknown"]
+
+    @pytest.mark.asyncio
+    async def test_native_package_details(self, client, fake_server):
+        fake_server.devices["emulator-5554"].packages["com.example.app1"]["enabled"] = False
+        with patch.object(Adb, 'backend', "native"), patch.object(Adb, 'client', client):
+            details = [
+                package async for package in PackageManager.iter_package_details("emulator-5554")
+            ]
+
+        assert [package.name for package in details] == ["com.example.app1"]
+        assert details[0].uid == 10000
+        assert details[0].installer == "com.android.vending"
+        assert details[0].enabled is False
+
+    @pytest.mark.asyncio
+    async def test_native_stream_unknown_device(self, client):
+        """Test that a stream the device refuses raises instead of ending empty"""
+        with patch.object(Adb, 'backend', "native"), patch.object(Adb, 'client', client):
+            with pytest.raises(StreamInterrupted):
+                async for _ in Adb.shell_stream("missing", "pm list packages"):
+                    pass
+
+    @pytest.mark.asyncio
+    async def test_native_pair(self, client):
+        with patch.object(Adb, 'backend', "native"), patch.object(Adb, 'client', client):
+            succeeded = await Adb.pair("192.168.1.100:5555", "123456")
+            failed = await Adb.pair("192.168.1.100:5555", "000000")
+
+        assert succeeded.ok
+        assert not failed.ok
+
+    @pytest.mark.asyncio
+    async def test_auto_backend_falls_back_to_subprocess(self):
+        unreachable = AdbClient(port=free_port())
+        with patch.object(Adb, 'backend', "auto"), patch.object(Adb, 'client', unreachable):
+            with patch.object(Adb, '_native_unavailable_until', 0.0):
+                with patch.object(CommandManager, 'run', new_callable=AsyncMock) as mock_run:
+                    mock_run.return_value = CommandResult(args=[], returncode=0, stdout="Success")
+                    with patch.object(unreachable, 'connect', wraps=unreachable.connect) as connect:
+                        first = await Adb.shell("serial1", "pm uninstall --user 0 'a;b'")
+                        second = await Adb.shell("serial1", "pm list packages")
+
+        assert first.stdout == second.stdout == "Success"
+        # The server is not tried again right after it failed
+        connect.assert_called_once()
+        mock_run.assert_any_call(
+            ["adb", "-s", "serial1", "shell", "pm uninstall --user 0 'a;b'"], timeout=None
+        )
+
+
+class TestFakeAdb:
+    """Test cases for the fake device shell, latency injection and fake adb executable"""
+
+    def test_grouped_script(self):
+        device = FakeDevice("s1", packages=["com.a"])
+        script = (
+            "{ echo start\npm disable-user --user 0 com.missing\n} </dev/null 2>&1; echo \"end $?\""
+        )
+
+        stdout, stderr, returncode = device.shell(script)
+
+        assert stdout.startswith("start\nException occurred")
+        assert stdout.endswith("end 255\n")
+        assert (stderr, returncode) == ("", 0)
+        assert device.command_count == 1
+
+    def test_restore_commands_and_failures(self):
+        device = FakeDevice("s1", packages=["com.a", "com.b"], failure_rate=1.0)
+        device.packages["com.a"]["installed"] = False
+        healthy = FakeDevice("s2", packages=["com.a"])
+        healthy.packages["com.a"]["installed"] = False
+
+        assert device.shell("cmd package install-existing --user 0 com.a")[2] == 1
+        assert device.shell("pm list packages")[0] == "package:com.b\n"
+        assert healthy.shell("cmd package install-existing --user 0 com.a") == (
+            "Package com.a installed for user: 0\n",
+            "",
+            0,
+        )
+
+    @pytest.mark.asyncio
+    async def test_command_latency(self):
+        device = FakeDevice("s1", packages=["com.a", "com.b"])
+        async with FakeAdbServer([device], command_latency=0.05) as server:
+            client = AdbClient(port=server.port)
+            started = time.perf_counter()
+            await client.shell("s1", "pm enable com.a; pm enable com.b; echo done")
+
+        assert time.perf_counter() - started >= 0.1
+
+    @pytest.mark.asyncio
+    async def test_shell_session_through_fake_executable(self, fake_server, monkeypatch):
+        monkeypatch.setenv("ANDROID_ADB_SERVER_PORT", str(fake_server.port))
+        session = ShellSession(
+            "emulator-5554", [sys.executable, "-m", "src.fake_adb", "-s", "emulator-5554", "shell"]
+        )
+        try:
+            listing = await session.execute("pm list packages")
+            disabled = await session.execute("pm disable-user --user 0 com.example.app1")
+        finally:
+            await session.close()
+
+        assert (listing.returncode, listing.stdout) == (0, "package:com.example.app1\n")
+        assert "new state: disabled-user" in disabled.stdout
+        assert not fake_server.devices["emulator-5554"].packages["com.example.app1"]["enabled"]
@@ -0,0 +1,122 @@
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+from src.db import db_manager
+from src.device_manager import DeviceManager
+from src.exceptions import ErrorCodes
+from src.fleet import FleetManager
+from src.models import PackageInfo
+from src.package_index import PackageIndex
+from src.pkg_manager import PackageManager
+
+DEVICES = [{"serial_number": "serial1", "state": "device", "model": "Pixel_7", "is_selected": True}]
+PACKAGES = [PackageInfo(f"com.example.app{i:02}", 10000 + i) for i in range(30)]
+
+
+class TestDevicesApi:
+    """Test cases for /api/v1/devices"""
+
+    @patch.object(DeviceManager, 'list_devices', new_callable=AsyncMock, return_value=DEVICES)
+    def test_devices_conditional_get(self, mock_list, client: TestClient):
+        response = client.get("/api/v1/devices")
+        etag = response.headers["etag"]
+        cached = client.get("/api/v1/devices", headers={"If-None-Match": etag})
+
+        assert response.json() == {"devices": DEVICES}
+        assert etag.startswith('"') and not etag.startswith('W/')
+        assert cached.status_code == 304
+        assert cached.headers["etag"] == etag
+        assert cached.content == b""
+
+
+class TestPackagesApi:
+    """Test cases for /api/v1/devices/{serial}/packages"""
+
+    @patch.object(
+        PackageManager,
+        'get_installed_packages',
+        new_callable=AsyncMock,
+        return_value=(ErrorCodes.SUCCESS, PACKAGES),
+    )
+    def test_packages_page(self, mock_packages, client: TestClient):
+        response = client.get("/api/v1/devices/serial1/packages?per_page=10&page=3&order=desc")
+
+        body = response.json()
+        assert (body["total"], body["page"], body["pages"]) == (30, 3, 3)
+        assert body["packages"][0]["name"] == "com.example.app09"
+        mock_packages.assert_called_once_with(refresh=False, serial_number="serial1")
+
+    @patch.object(
+        PackageManager,
+        'get_installed_packages',
+        new_callable=AsyncMock,
+        return_value=(ErrorCodes.SUCCESS, PACKAGES),
+    )
+    def test_packages_not_modified_skips_query(self, mock_packages, client: TestClient):
+        etag = client.get("/api/v1/devices/serial1/packages?q=app").headers["etag"]
+        other = client.get("/api/v1/devices/serial1/packages?q=app&page=2").headers["etag"]
+
+        with patch.object(PackageIndex, 'query') as mock_query:
+            response = client.get(
+                "/api/v1/devices/serial1/packages?q=app", headers={"If-None-Match": etag}
+            )
+
+        assert response.status_code == 304
+        assert other != etag
+        mock_query.assert_not_called()
+
+    @patch.object(
+        PackageManager,
+        'get_installed_packages',
+        new_callable=AsyncMock,
+        return_value=(ErrorCodes.NO_PACKAGES_FOUND, []),
+    )
+    def test_packages_of_unknown_device(self, mock_packages, client: TestClient):
+        assert client.get("/api/v1/devices/missing/packages").status_code == 404
+
+
+class TestActionsApi:
+    """Test cases for /api/v1/actions"""
+
+    @patch.object(FleetManager, 'apply_actions', new_callable=AsyncMock)
+    def test_actions_default_to_selected_device(self, mock_apply, client: TestClient):
+        mock_apply.return_value = {"test_device": {"serial_number": "test_device", "failed": []}}
+
+        response = client.post("/api/v1/actions", json={"actions": {"com.a": "disable"}})
+
+        assert response.status_code == 200
+        assert response.json()["devices"]["test_device"]["failed"] == []
+        mock_apply.assert_called_once_with(["test_device"], {"action_com.a": "disable"})
+
+    @patch.object(FleetManager, 'apply_actions', new_callable=AsyncMock)
+    def test_actions_reject_unknown_action(self, mock_apply, client: TestClient):
+        response = client.post(
+            "/api/v1/actions",
+            json={"actions": {"com.a": "format"}, "serial_numbers": ["serial1"]},
+        )
+
+        assert response.status_code == 422
+        mock_apply.assert_not_called()
+
+
+class TestRestoreApi:
+    """Test cases for the action journal and /api/v1/restore"""
+
+    def test_journal_lists_entries(self, client: TestClient):
+        entry = {"id": 1, "package": "com.a", "action": "disable", "previous_state": "enabled"}
+        with patch.object(db_manager, 'get_journal', new_callable=AsyncMock) as mock_journal:
+            mock_journal.return_value = [entry]
+            response = client.get("/api/v1/devices/serial1/journal?since=5")
+
+        assert response.json()["entries"] == [entry]
+        mock_journal.assert_called_once_with("serial1", since=5.0)
+
+    @patch.object(FleetManager, 'restore_actions', new_callable=AsyncMock)
+    def test_restore_defaults_to_selected_device(self, mock_restore, client: TestClient):
+        mock_restore.return_value = {"test_device": {"serial_number": "test_device", "failed": []}}
+
+        response = client.post("/api/v1/restore", json={"packages": ["com.a"]})
+
+        assert response.status_code == 200
+        mock_restore.assert_called_once_with(["test_device"], since=None, packages=["com.a"])
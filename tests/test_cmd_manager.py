@@ -1,51 +1,145 @@
-import subprocess
-from unittest.mock import MagicMock, patch
+import asyncio
+import sys
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
-from src.cmd_manager import CommandManager
+from src.cmd_manager import CommandManager, CommandResult
+from src.exceptions import StreamInterrupted
 
 
 class TestCommandManager:
     """Test cases for CommandManager class"""
 
     @pytest.mark.asyncio
-    @patch('subprocess.Popen')
-    async def test_execute_command_success(self, mock_popen):
+    @patch('asyncio.create_subprocess_exec', new_callable=AsyncMock)
+    async def test_run_success(self, mock_exec):
         """Test successful command execution"""
         mock_process = MagicMock()
-        mock_process.communicate.return_value = ("Command output", "")
-        mock_popen.return_value = mock_process
+        mock_process.communicate = AsyncMock(return_value=(b"Command output", b""))
+        mock_process.returncode = 0
+        mock_exec.return_value = mock_process
 
-        result = await CommandManager.execute_command("adb devices")
+        result = await CommandManager.run(["adb", "devices"])
 
-        assert result == "Command output"
-        mock_popen.assert_called_once_with(
-            "adb devices",
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            shell=True,
+        assert result == CommandResult(
+            args=["adb", "devices"], returncode=0, stdout="Command output"
+        )
+        assert result.ok
+        mock_exec.assert_called_once_with(
+            "adb",
+            "devices",
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
         )
 
     @pytest.mark.asyncio
-    @patch('subprocess.Popen')
-    async def test_execute_command_exception(self, mock_popen):
-        """Test command execution with exception"""
-        mock_popen.side_effect = Exception("Command failed")
+    @patch('asyncio.create_subprocess_exec', new_callable=AsyncMock)
+    async def test_run_missing_executable(self, mock_exec):
+        """Test command execution when the executable does not exist"""
+        mock_exec.side_effect = FileNotFoundError("adb")
 
-        result = await CommandManager.execute_command("invalid_command")
+        result = await CommandManager.run(["adb", "devices"])
 
-        assert result == ""
+        assert result.returncode is None
+        assert result.stdout == ""
+        assert not result.ok
 
     @pytest.mark.asyncio
-    @patch('subprocess.Popen')
-    async def test_execute_command_with_stderr(self, mock_popen):
+    @patch('asyncio.create_subprocess_exec', new_callable=AsyncMock)
+    async def test_run_with_stderr(self, mock_exec):
         """Test command execution with stderr output"""
         mock_process = MagicMock()
-        mock_process.communicate.return_value = ("Command output", "Error message")
-        mock_popen.return_value = mock_process
+        mock_process.communicate = AsyncMock(return_value=(b"", b"error: no devices/emulators"))
+        mock_process.returncode = 1
+        mock_exec.return_value = mock_process
+
+        result = await CommandManager.run(["adb", "shell", "pm", "list", "packages"])
+
+        assert result.returncode == 1
+        assert result.stderr == "error: no devices/emulators"
+        assert not result.ok
+
+    @pytest.mark.asyncio
+    async def test_run_real_process(self):
+        """Test that a real child process is awaited and its exit code captured"""
+        code = "import sys; print('hello'); sys.exit(3)"
+        result = await CommandManager.run([sys.executable, "-c", code])
+
+        assert result.stdout.strip() == "hello"
+        assert result.returncode == 3
+
+    @pytest.mark.asyncio
+    async def test_run_with_input(self):
+        """Test that input is written to the process stdin"""
+        code = "import sys; print(sys.stdin.read().strip()[::-1])"
+        result = await CommandManager.run([sys.executable, "-c", code], input="123456\n")
+
+        assert result.stdout.strip() == "654321"
+
+    @pytest.mark.asyncio
+    async def test_run_timeout_kills_process(self):
+        """Test that a process exceeding its timeout is killed"""
+        code = "import time; time.sleep(30)"
+        result = await CommandManager.run([sys.executable, "-c", code], timeout=0.2)
+
+        assert result.timed_out
+        assert not result.ok
+
+    @pytest.mark.asyncio
+    async def test_stream_yields_output_while_running(self):
+        """Test that output is streamed in chunks and multi-byte characters are kept whole"""
+        code = "import sys; sys.stdout.buffer.write('é'.encode() * 100000)"
+        with patch.object(CommandManager, 'chunk_size', 1001):
+            chunks = [chunk async for chunk in CommandManager.stream([sys.executable, "-c", code])]
+
+        assert len(chunks) > 1
+        assert "".join(chunks) == "é" * 100000
+
+    @pytest.mark.asyncio
+    async def test_stream_stops_early_kills_process(self):
+        """Test that a consumer leaving the stream early kills the process"""
+        code = "import time; print('first', flush=True); time.sleep(30)"
+        stream = CommandManager.stream([sys.executable, "-c", code])
+        with patch.object(CommandManager, '_kill', wraps=CommandManager._kill) as mock_kill:
+            assert (await anext(stream)).strip() == "first"
+            await stream.aclose()
+
+        mock_kill.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_stream_stalled_raises(self):
+        """Test that a stalled stream raises after what was read, so it is not taken as complete"""
+        code = "import time; print('first', flush=True); time.sleep(30)"
+        chunks = []
+        with pytest.raises(StreamInterrupted):
+            async for chunk in CommandManager.stream([sys.executable, "-c", code], timeout=0.5):
+                chunks.append(chunk)
+
+        assert "".join(chunks).strip() == "first"
+
+    @pytest.mark.asyncio
+    async def test_run_cancel_kills_process(self):
+        """Test that cancelling the awaiting task kills the process"""
+        code = "import time; time.sleep(30)"
+        with patch.object(CommandManager, '_kill', wraps=CommandManager._kill) as mock_kill:
+            task = asyncio.ensure_future(CommandManager.run([sys.executable, "-c", code]))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        mock_kill.assert_called_once()
+        assert mock_kill.call_args.args[0].returncode is not None
+
+    @pytest.mark.asyncio
+    @patch.object(CommandManager, 'run', new_callable=AsyncMock)
+    async def test_execute_command_splits_string(self, mock_run):
+        """Test the string based helper"""
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout="Command output")
 
-        result = await CommandManager.execute_command("adb devices")
+        result = await CommandManager.execute_command("adb devices -l")
 
         assert result == "Command output"
+        mock_run.assert_called_once_with(["adb", "devices", "-l"], timeout=None)
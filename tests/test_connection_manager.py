@@ -1,8 +1,8 @@
-import subprocess
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
+from src.cmd_manager import CommandManager, CommandResult
 from src.connection_manager import ConnectionManager
 
 
@@ -10,46 +10,49 @@ class TestConnectionManager:
     """Test cases for ConnectionManager class"""
 
     @pytest.mark.asyncio
-    @patch('subprocess.Popen')
-    async def test_connect_to_device_success(self, mock_popen):
+    @patch.object(CommandManager, 'run', new_callable=AsyncMock)
+    async def test_connect_to_device_success(self, mock_run):
         """Test successful device connection"""
         # Mock successful connection
-        mock_process = MagicMock()
-        mock_process.communicate.return_value = ("Success", "")
-        mock_popen.return_value = mock_process
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout="Success")
 
         result = await ConnectionManager.connect_to_device("192.168.1.100", "5555", "123456")
 
         assert result is True
-        mock_popen.assert_called_once_with(
+        mock_run.assert_called_once_with(
             ["adb", "pair", "192.168.1.100:5555"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
+            timeout=ConnectionManager.pair_timeout,
+            input="123456\n",
         )
 
     @pytest.mark.asyncio
-    @patch('subprocess.Popen')
-    async def test_connect_to_device_failure(self, mock_popen):
+    @patch.object(CommandManager, 'run', new_callable=AsyncMock)
+    async def test_connect_to_device_failure(self, mock_run):
         """Test failed device connection"""
         # Mock failed connection
-        mock_process = MagicMock()
-        mock_process.communicate.return_value = ("failed to connect", "")
-        mock_popen.return_value = mock_process
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout="failed to connect")
 
         result = await ConnectionManager.connect_to_device("192.168.1.100", "5555", "123456")
 
         assert result is False
 
     @pytest.mark.asyncio
-    @patch('subprocess.Popen')
-    async def test_connect_to_device_with_empty_code(self, mock_popen):
+    @patch.object(CommandManager, 'run', new_callable=AsyncMock)
+    async def test_connect_to_device_nonzero_exit(self, mock_run):
+        """Test failed device connection reported through the exit code"""
+        mock_run.return_value = CommandResult(args=[], returncode=1, stdout="Failed: Wrong code")
+
+        result = await ConnectionManager.connect_to_device("192.168.1.100", "5555", "123456")
+
+        assert result is False
+
+    @pytest.mark.asyncio
+    @patch.object(CommandManager, 'run', new_callable=AsyncMock)
+    async def test_connect_to_device_with_empty_code(self, mock_run):
         """Test connection with empty pairing code"""
-        mock_process = MagicMock()
-        mock_process.communicate.return_value = ("Success", "")
-        mock_popen.return_value = mock_process
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout="Success")
 
         result = await ConnectionManager.connect_to_device("192.168.1.100", "5555", "")
 
         assert result is False
+        mock_run.assert_not_called()
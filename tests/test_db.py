@@ -0,0 +1,99 @@
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+
+from src.db import MIGRATIONS, DbManger
+from src.models import PackageInfo
+
+
+@pytest_asyncio.fixture
+async def disk_db(tmp_path):
+    """A database in a file, migrated to the latest schema"""
+    database = DbManger()
+    database.connection_path = str(tmp_path / "state" / "bloatware.db")
+    assert await database.connect()
+    await database.create_tables()
+    yield database
+    if database.connection is not None:
+        await database.close()
+
+
+async def reopen(database):
+    await database.close()
+    assert await database.connect()
+    await database.create_tables()
+
+
+class TestDbManger:
+    """Test cases for the on-disk SQLite store"""
+
+    @pytest.mark.asyncio
+    async def test_file_database_is_migrated_in_wal_mode(self, disk_db):
+        async with disk_db.connection.execute("PRAGMA journal_mode") as cursor:
+            assert (await cursor.fetchone())[0] == "wal"
+        assert await disk_db.schema_version() == len(MIGRATIONS)
+
+        await disk_db.create_tables()
+        assert await disk_db.schema_version() == len(MIGRATIONS)
+
+    @pytest.mark.asyncio
+    async def test_state_survives_a_restart(self, disk_db):
+        await disk_db.set_selected_device("serial1")
+        await disk_db.record_actions("serial1", [("com.a", "disable", True, "", "enabled")])
+        await reopen(disk_db)
+
+        assert await disk_db.get_selected_device() == "serial1"
+        history = await disk_db.get_action_history("serial1")
+        assert [(row["package"], row["succeeded"]) for row in history] == [("com.a", 1)]
+
+    @pytest.mark.asyncio
+    async def test_snapshots_round_trip_and_are_pruned(self, disk_db):
+        disk_db.max_snapshots = 2
+        packages = [
+            PackageInfo("com.a", 10001, 3, True, "/data/app/a.apk", "com.android.vending"),
+            PackageInfo("com.android.b", 1000, 1, False, "/system/b.apk", None, True),
+        ]
+        ids = [await disk_db.save_snapshot("serial1", float(i), packages) for i in range(3)]
+        await disk_db.save_snapshot("serial2", 5.0, packages[:1])
+
+        assert await disk_db.get_snapshot("serial1", ids[0]) is None
+        latest = await disk_db.get_snapshot("serial1")
+        assert latest.id == ids[2] and latest.taken_at == 2.0
+        assert latest.packages == {package.name: package for package in packages}
+        by_device = {s.serial_number: s for s in await disk_db.get_latest_snapshots()}
+        assert by_device["serial1"].id == ids[2]
+        assert list(by_device["serial2"].packages) == ["com.a"]
+        async with disk_db.connection.execute("SELECT COUNT(*) FROM snapshot_packages") as cursor:
+            assert (await cursor.fetchone())[0] == 5
+
+    @pytest.mark.asyncio
+    async def test_devices_are_upserted(self, disk_db):
+        await disk_db.upsert_devices([{"serial_number": "s1", "state": "device", "model": "P7"}])
+        await disk_db.upsert_devices([{"serial_number": "s1", "state": "offline", "model": None}])
+
+        devices = await disk_db.get_devices()
+        assert len(devices) == 1
+        assert (devices[0]["state"], devices[0]["model"]) == ("offline", "P7")
+        assert devices[0]["first_seen"] <= devices[0]["last_seen"]
+
+    @pytest.mark.asyncio
+    async def test_transaction_rolls_back_on_error(self, disk_db):
+        with pytest.raises(RuntimeError):
+            async with disk_db.transaction() as connection:
+                await connection.execute("INSERT INTO current_device VALUES ('serial1')")
+                raise RuntimeError("boom")
+
+        assert await disk_db.get_selected_device() is None
+
+    @pytest.mark.asyncio
+    async def test_failed_migration_leaves_the_version(self, disk_db):
+        await disk_db.close()
+        database = DbManger()
+        database.connection_path = disk_db.connection_path.replace("bloatware", "other")
+        await database.connect()
+        with patch("src.db.MIGRATIONS", [MIGRATIONS[0], "CREATE TABLE broken (;"]):
+            with pytest.raises(Exception):
+                await database.create_tables()
+        assert await database.schema_version() == 1
+        await database.close()
@@ -17,9 +17,9 @@ class TestDeviceManagerAsync:
         assert result is True
 
     @patch("src.device_manager.DeviceManager.get_selected_device", new_callable=AsyncMock)
-    @patch("src.device_manager.CommandManager.execute_command", new_callable=AsyncMock)
+    @patch("src.device_manager.Adb.devices", new_callable=AsyncMock)
     async def test_list_devices_parses_output_and_marks_selected(
-        self, mock_execute_command, mock_get_selected_device
+        self, mock_devices, mock_get_selected_device
     ):
         adb_output = (
             "List of devices attached\n"
@@ -27,7 +27,7 @@ class TestDeviceManagerAsync:
             "serial456 device product:sdk_gphone_x86 model:Nexus_5 device:generic_x86\n"
             "serial789 unauthorized\n"
         )
-        mock_execute_command.return_value = adb_output
+        mock_devices.return_value = adb_output
         mock_get_selected_device.return_value = "serial456"
 
         devices = await DeviceManager.list_devices()
@@ -52,17 +52,17 @@ class TestDeviceManagerAsync:
         assert devices[2]["model"] == "Unknown"  # No model in line
 
     @patch("src.device_manager.DeviceManager.get_selected_device", new_callable=AsyncMock)
-    @patch("src.device_manager.CommandManager.execute_command", new_callable=AsyncMock)
-    async def test_list_devices_empty_output(self, mock_execute_command, mock_get_selected_device):
-        mock_execute_command.return_value = ""
+    @patch("src.device_manager.Adb.devices", new_callable=AsyncMock)
+    async def test_list_devices_empty_output(self, mock_devices, mock_get_selected_device):
+        mock_devices.return_value = ""
         mock_get_selected_device.return_value = None
         devices = await DeviceManager.list_devices()
         assert devices == []
 
     @patch("src.device_manager.DeviceManager.get_selected_device", new_callable=AsyncMock)
-    @patch("src.device_manager.CommandManager.execute_command", new_callable=AsyncMock)
-    async def test_list_devices_no_devices(self, mock_execute_command, mock_get_selected_device):
-        mock_execute_command.return_value = "List of devices attached\n"
+    @patch("src.device_manager.Adb.devices", new_callable=AsyncMock)
+    async def test_list_devices_no_devices(self, mock_devices, mock_get_selected_device):
+        mock_devices.return_value = "List of devices attached\n"
         mock_get_selected_device.return_value = None
         devices = await DeviceManager.list_devices()
         assert devices == []
@@ -0,0 +1,124 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src import api
+from src.adb_client import Adb, AdbClient
+from src.cmd_manager import CommandManager, CommandResult
+from src.device_manager import DeviceManager
+from src.device_tracker import DeviceTracker, device_tracker
+from src.fake_adb_server import FakeAdbServer, FakeDevice
+from src.package_cache import package_cache
+from src.shell_session import shell_sessions
+
+LISTING = "emulator-5554\tdevice product:pixel_7 model:Pixel_7 device:pixel_7 transport_id:1\n"
+
+
+async def next_event(queue: asyncio.Queue) -> tuple[str, str]:
+    event = await asyncio.wait_for(queue.get(), 5)
+    return event["type"], event["device"]["serial_number"]
+
+
+class TestDeviceTracker:
+    """Test cases for the device table and its events"""
+
+    @pytest.mark.asyncio
+    async def test_update_publishes_changes(self):
+        tracker = DeviceTracker()
+        queue = tracker.subscribe()
+        package_cache.set("emulator-5554", ["com.a"])
+
+        with patch.object(shell_sessions, 'close', new_callable=AsyncMock) as mock_close:
+            await tracker.update(LISTING)
+            assert await tracker.update(LISTING) == []
+            await tracker.update(LISTING.replace("\tdevice product", "\toffline product"))
+            await tracker.update("")
+
+        assert [queue.get_nowait()["type"] for _ in range(queue.qsize())] == [
+            "connected",
+            "changed",
+            "disconnected",
+        ]
+        assert tracker.ready and tracker.devices == {}
+        assert package_cache.get("emulator-5554") is None
+        mock_close.assert_called_with("emulator-5554")
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_keeps_latest_events(self):
+        tracker = DeviceTracker()
+        tracker.max_pending_events = 2
+        queue = tracker.subscribe()
+        for serial in ("a", "b", "c"):
+            await tracker.update(f"{serial}\tdevice\n")
+        tracker.unsubscribe(queue)
+        await tracker.update("")
+
+        assert [await next_event(queue) for _ in range(2)] == [
+            ("connected", "c"),
+            ("disconnected", "b"),
+        ]
+        assert queue.empty()
+
+    @pytest.mark.asyncio
+    async def test_follows_the_adb_server(self):
+        async with FakeAdbServer([FakeDevice("emulator-5554")]) as server:
+            with patch.object(Adb, 'backend', "native"):
+                with patch.object(Adb, 'client', AdbClient(port=server.port)):
+                    tracker = DeviceTracker()
+                    queue = tracker.subscribe()
+                    tracker.start()
+                    try:
+                        assert await next_event(queue) == ("connected", "emulator-5554")
+                        server.add_device(FakeDevice("emulator-5556", model="Pixel_8"))
+                        assert await next_event(queue) == ("connected", "emulator-5556")
+                        server.remove_device("emulator-5554")
+                        assert await next_event(queue) == ("disconnected", "emulator-5554")
+                        assert tracker.get("emulator-5556")["model"] == "Pixel_8"
+                    finally:
+                        await tracker.stop()
+            assert server.requests.count("host:track-devices-l") == 1
+        assert not tracker.ready
+
+    @pytest.mark.asyncio
+    async def test_polls_the_adb_executable_without_a_server(self):
+        result = CommandResult(args=[], returncode=0, stdout="List of devices attached\n" + LISTING)
+        with patch.object(CommandManager, 'run', new_callable=AsyncMock, return_value=result):
+            listings = Adb.track_devices(poll_interval=0)
+            try:
+                assert await anext(listings) == result.stdout
+                assert await anext(listings) == result.stdout
+            finally:
+                await listings.aclose()
+
+
+class TestTrackedDevices:
+    """Test cases for readers of the device table"""
+
+    @pytest.mark.asyncio
+    async def test_list_devices_reads_the_table(self):
+        with patch.object(device_tracker, 'devices', {}), patch.object(device_tracker, 'ready'):
+            await device_tracker.update(LISTING)
+            with patch.object(Adb, 'devices', new_callable=AsyncMock) as mock_devices:
+                devices = await DeviceManager.list_devices()
+                devices[0]["is_selected"] = True
+                stored = device_tracker.get("emulator-5554")
+
+        mock_devices.assert_not_called()
+        assert [device["model"] for device in devices] == ["Pixel_7"]
+        assert stored["is_selected"] is False
+
+    @pytest.mark.asyncio
+    async def test_device_events_stream(self):
+        with patch.object(device_tracker, 'devices', {}), patch.object(device_tracker, 'ready'):
+            response = await api.device_events(None)
+            body = response.body_iterator
+            first = asyncio.ensure_future(anext(body))
+            await asyncio.sleep(0)
+            await device_tracker.update(LISTING)
+            message = await asyncio.wait_for(first, 5)
+            await body.aclose()
+
+        assert message.startswith("event: connected\ndata: ")
+        assert '"serial_number": "emulator-5554"' in message
+        assert not device_tracker._subscribers
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.cmd_manager import CommandResult
+from src.fleet import FleetManager
+from src.pkg_manager import BATCH_MARKER, ActionResults, PackageManager
+from src.shell_session import shell_sessions
+
+
+def fake_execute(delay, in_flight, peaks):
+    """Build a shell_sessions.execute stand-in that answers every batch with Success"""
+
+    async def execute(serial, command, timeout=None, slot=0, on_line=None):
+        in_flight[serial] = in_flight.get(serial, 0) + 1
+        in_flight["total"] = in_flight.get("total", 0) + 1
+        peaks[serial] = max(peaks.get(serial, 0), in_flight[serial])
+        peaks["total"] = max(peaks.get("total", 0), in_flight["total"])
+        await asyncio.sleep(delay)
+        in_flight[serial] -= 1
+        in_flight["total"] -= 1
+        count = command.count(BATCH_MARKER)
+        return CommandResult(
+            args=[],
+            returncode=0,
+            stdout="".join(f"{BATCH_MARKER} {i}\nSuccess\n" for i in range(count)),
+        )
+
+    return execute
+
+
+class TestFleetManager:
+    """Test cases for FleetManager class"""
+
+    @pytest.mark.asyncio
+    async def test_apply_actions_runs_devices_concurrently(self):
+        """Test that the wall time is close to the slowest device"""
+        in_flight, peaks = {}, {}
+        action_form = {"action_com.example.app": "disable"}
+        serials = [f"serial{i}" for i in range(10)]
+        with patch.object(shell_sessions, 'execute', fake_execute(0.1, in_flight, peaks)):
+            start = time.perf_counter()
+            reports = await FleetManager.apply_actions(serials, action_form)
+            elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.5
+        assert list(reports) == serials
+        assert all(report["succeeded"] == ["com.example.app"] for report in reports.values())
+        assert all(report["failed"] == [] for report in reports.values())
+
+    @pytest.mark.asyncio
+    async def test_apply_actions_respects_concurrency_caps(self):
+        """Test the global and per device caps on batches in flight"""
+        in_flight, peaks = {}, {}
+        action_form = {f"action_com.example.app{i}": "disable" for i in range(8)}
+        serials = [f"serial{i}" for i in range(4)]
+        with patch.object(PackageManager, 'batch_size', 1):
+            with patch.object(shell_sessions, 'execute', fake_execute(0.01, in_flight, peaks)):
+                await FleetManager.apply_actions(
+                    serials, action_form, max_concurrency=3, per_device_concurrency=2
+                )
+
+        assert peaks["total"] == 3
+        assert max(peaks[serial] for serial in serials) <= 2
+
+    @pytest.mark.asyncio
+    async def test_apply_actions_reports_device_errors(self):
+        """Test that one broken device does not affect the others"""
+
+        async def apply_actions(serial_number, action_form, **kwargs):
+            if serial_number == "broken":
+                raise RuntimeError("device offline")
+            return ActionResults({"com.example.app": True, "com.example.other": False})
+
+        with patch.object(PackageManager, 'apply_actions', side_effect=apply_actions):
+            reports = await FleetManager.apply_actions(["ok", "broken", "ok"], {})
+
+        assert list(reports) == ["ok", "broken"]
+        assert reports["ok"]["succeeded"] == ["com.example.app"]
+        assert reports["ok"]["failed"] == ["com.example.other"]
+        assert reports["broken"]["error"] == "device offline"
+
+    @pytest.mark.asyncio
+    async def test_restore_actions_runs_every_device(self):
+        """Test that a restore reports per device like apply_actions"""
+
+        async def restore_actions(serial_number, since=None, packages=None, **kwargs):
+            results = ActionResults({"com.example.app": True, "com.example.gone": True})
+            results.skipped = {"com.example.gone": "Already installed"}
+            return results
+
+        with patch.object(PackageManager, 'restore_actions', side_effect=restore_actions) as mock:
+            reports = await FleetManager.restore_actions(["s1", "s2"], since=10.0)
+
+        assert mock.call_args.kwargs["since"] == 10.0
+        assert reports["s2"]["succeeded"] == ["com.example.app"]
+        assert reports["s2"]["skipped"] == ["com.example.gone"]
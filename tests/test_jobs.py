@@ -0,0 +1,247 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+import pytest
+
+from src.cmd_manager import CommandResult
+from src.jobs import JobQueue, job_queue
+from src.pkg_manager import BATCH_MARKER, INVENTORY_MARKER, ActionResults, PackageManager
+from src.progress import progress_registry
+from src.shell_session import shell_sessions
+
+
+def fake_apply_actions(gate: asyncio.Event | None = None):
+    """apply_actions stand-in failing on com.bad only, holding the second package until gate is set"""
+
+    async def apply_actions(serial_number, action_form, progress=None, **kwargs):
+        results = ActionResults()
+        for position, (package, action) in enumerate(PackageManager.form_operations(action_form)):
+            if position == 1 and gate is not None:
+                await gate.wait()
+            progress("started", package=package)
+            results[package] = package != "com.bad"
+            progress(
+                "succeeded" if results[package] else "failed",
+                package=package,
+                duration=0.1,
+                output="Success" if results[package] else "Failure",
+            )
+        return results
+
+    return apply_actions
+
+
+async def statuses(database, job_id):
+    job = await database.get_job(job_id)
+    items = await database.get_job_items(job_id)
+    return job["status"], {item["package"]: item["status"] for item in items}
+
+
+class TestJobDatabase:
+    """Test cases for the job tables of DbManger"""
+
+    @pytest.mark.asyncio
+    async def test_jobs_and_items_round_trip(self, job_db):
+        job_id = await job_db.create_job("serial1", [("com.a", "disable"), ("com.b", "uninstall")])
+        await job_db.update_job_items(job_id, package="com.a", status="succeeded", duration=0.5)
+        await job_db.update_job(job_id, status="running")
+
+        job = await job_db.get_job(job_id)
+        items = await job_db.get_job_items(job_id)
+        assert job["serial_number"] == "serial1" and job["status"] == "running"
+        assert [(item["package"], item["action"], item["status"]) for item in items] == [
+            ("com.a", "disable", "succeeded"),
+            ("com.b", "uninstall", "pending"),
+        ]
+        assert items[0]["duration"] == 0.5
+        assert [job["id"] for job in await job_db.list_jobs(["running"])] == [job_id]
+        assert await job_db.list_jobs(["queued"]) == []
+        assert await job_db.get_job(job_id + 1) is None
+
+    @pytest.mark.asyncio
+    async def test_update_rejects_unknown_columns(self, job_db):
+        job_id = await job_db.create_job("serial1", [])
+        with pytest.raises(ValueError):
+            await job_db.update_job(job_id, serial_number="serial2")
+
+
+class TestJobQueue:
+    """Test cases for running, cancelling and resuming jobs"""
+
+    @pytest.mark.asyncio
+    async def test_workers_run_jobs_and_record_items(self, job_db):
+        queue = JobQueue(workers=2)
+        with patch.object(PackageManager, 'apply_actions', fake_apply_actions()):
+            await queue.start()
+            ok = await queue.submit("serial1", {"action_com.a": "disable", "action_com.b": ""})
+            bad = await queue.submit("serial2", {"action_com.bad": "uninstall"})
+            await queue._queue.join()
+            await queue.stop()
+
+        assert await statuses(job_db, ok) == ("succeeded", {"com.a": "succeeded"})
+        assert await statuses(job_db, bad) == ("failed", {"com.bad": "failed"})
+        job = await queue.get(bad)
+        assert job["items"][0]["output"] == "Failure"
+        assert job["started_at"] <= job["finished_at"]
+        assert progress_registry.get(str(ok)).done
+
+    @pytest.mark.asyncio
+    async def test_cancel_queued_job(self, job_db):
+        queue = JobQueue(workers=1)
+        job_id = await queue.submit("serial1", {"action_com.a": "disable"})
+
+        assert await queue.cancel(job_id)
+        assert not await queue.cancel(job_id)
+        assert await statuses(job_db, job_id) == ("cancelled", {"com.a": "cancelled"})
+        assert progress_registry.get(str(job_id)).events[-1]["error"] == "Cancelled"
+
+    @pytest.mark.asyncio
+    async def test_cancel_while_a_worker_takes_the_job(self, job_db):
+        """Test that a job cancelled between being dequeued and started never runs"""
+        queue = JobQueue(workers=1)
+        taken, gate = asyncio.Event(), asyncio.Event()
+        update_job_if = job_db.update_job_if
+
+        async def slow_update_job_if(job_id, status, **fields):
+            if fields.get("status") == "running":
+                taken.set()
+                await gate.wait()
+            return await update_job_if(job_id, status, **fields)
+
+        apply_actions = AsyncMock(side_effect=fake_apply_actions())
+        with (
+            patch.object(PackageManager, 'apply_actions', apply_actions),
+            patch.object(job_db, 'update_job_if', slow_update_job_if),
+        ):
+            await queue.start()
+            job_id = await queue.submit("serial1", {"action_com.a": "disable"})
+            await taken.wait()
+            assert await asyncio.wait_for(queue.cancel(job_id), 1)
+            gate.set()
+            # Cancelled before any worker took it, the worker then leaves it alone
+            queued = await queue.submit("serial1", {"action_com.b": "disable"})
+            await queue.stop()
+            assert await queue.cancel(queued)
+            await queue.start()
+            await asyncio.wait_for(queue._queue.join(), 1)
+            await queue.stop()
+
+        apply_actions.assert_not_called()
+        assert await statuses(job_db, job_id) == ("cancelled", {"com.a": "cancelled"})
+        assert await statuses(job_db, queued) == ("cancelled", {"com.b": "cancelled"})
+        assert progress_registry.get(str(job_id)).events[-1]["error"] == "Cancelled"
+
+    @pytest.mark.asyncio
+    async def test_cancel_running_job_keeps_finished_items(self, job_db):
+        queue = JobQueue(workers=1)
+        gate = asyncio.Event()
+        with patch.object(PackageManager, 'apply_actions', fake_apply_actions(gate)):
+            await queue.start()
+            job_id = await queue.submit(
+                "serial1", {"action_com.a": "disable", "action_com.b": "disable"}
+            )
+            while job_id not in queue._running:
+                await asyncio.sleep(0)
+            await asyncio.sleep(0.01)
+            assert await queue.cancel(job_id)
+            await queue.stop()
+
+        assert await statuses(job_db, job_id) == (
+            "cancelled",
+            {"com.a": "succeeded", "com.b": "cancelled"},
+        )
+
+    @pytest.mark.asyncio
+    async def test_start_resumes_unfinished_jobs(self, job_db):
+        job_id = await job_db.create_job("serial1", [("com.a", "disable"), ("com.b", "disable")])
+        await job_db.update_job(job_id, status="running")
+        await job_db.update_job_items(job_id, package="com.a", status="succeeded")
+        await job_db.update_job_items(job_id, package="com.b", status="started")
+        queue = JobQueue(workers=1)
+        with patch.object(PackageManager, 'apply_actions', fake_apply_actions()):
+            await queue.start()
+            await queue._queue.join()
+            await queue.stop()
+
+        assert await statuses(job_db, job_id) == (
+            "succeeded",
+            {"com.a": "succeeded", "com.b": "succeeded"},
+        )
+        assert progress_registry.get(str(job_id)).operations == [("com.b", "disable")]
+
+    @pytest.mark.asyncio
+    async def test_skipped_items_are_recorded(self, job_db):
+        state = f"package:com.a\npackage:com.b\n{INVENTORY_MARKER}\npackage:com.a\n"
+        outputs = iter([state, f"{BATCH_MARKER} 0\nSuccess\n"])
+
+        async def execute(serial, command, timeout=None, slot=0, on_line=None):
+            return CommandResult(args=[], returncode=0, stdout=next(outputs))
+
+        queue = JobQueue(workers=1)
+        with patch.object(PackageManager, 'skip_unchanged', True):
+            with patch.object(shell_sessions, 'execute', execute):
+                await queue.start()
+                job_id = await queue.submit(
+                    "serial1", {"action_com.a": "disable", "action_com.b": "disable"}
+                )
+                await queue._queue.join()
+                await queue.stop()
+
+        assert await statuses(job_db, job_id) == (
+            "succeeded",
+            {"com.a": "skipped", "com.b": "succeeded"},
+        )
+        assert progress_registry.get(str(job_id)).events[-1]["skipped"] == ["com.a"]
+
+
+class TestJobRoutes:
+    """Test cases for the job pages and the /api/v1/jobs endpoints"""
+
+    def test_apply_actions_queues_a_job(self, job_db, client: TestClient):
+        response = client.post(
+            "/apply-actions", data={"action_com.a": "disable"}, follow_redirects=False
+        )
+
+        assert response.status_code == 303
+        job_id = response.headers["location"].rsplit("/", 1)[1]
+        page = client.get(f"/actions/{job_id}")
+        assert "is waiting for a worker" in page.text
+        assert 'data-package="com.a"' in page.text
+        assert progress_registry.get(job_id).operations == [("com.a", "disable")]
+
+    def test_finished_job_page_reads_the_database(self, job_db, client: TestClient):
+        job_id = client.post("/api/v1/jobs", json={"actions": {"com.a": "disable"}}).json()["jobs"][
+            "test_device"
+        ]
+        cancelled = client.post(f"/actions/{job_id}/cancel", follow_redirects=False)
+        progress_registry.clear()
+
+        page = client.get(cancelled.headers["location"])
+        assert page.status_code == 200
+        assert "was cancelled" in page.text
+        assert "EventSource" not in page.text
+
+    def test_api_jobs(self, job_db, client: TestClient):
+        response = client.post(
+            "/api/v1/jobs",
+            json={"actions": {"com.a": "disable"}, "serial_numbers": ["serial1", "serial2"]},
+        )
+        jobs = response.json()["jobs"]
+
+        assert response.status_code == 202
+        assert list(jobs) == ["serial1", "serial2"]
+        job = client.get(f"/api/v1/jobs/{jobs['serial1']}").json()
+        assert job["status"] == "queued"
+        assert job["items"][0]["package"] == "com.a"
+        listed = client.get("/api/v1/jobs", params={"status": "queued"}).json()["jobs"]
+        assert [job["id"] for job in listed] == [jobs["serial2"], jobs["serial1"]]
+        cancel = client.post(f"/api/v1/jobs/{jobs['serial1']}/cancel")
+        assert cancel.json()["status"] == "cancelled"
+        assert client.post(f"/api/v1/jobs/{jobs['serial1']}/cancel").status_code == 409
+        assert client.get("/api/v1/jobs/999").status_code == 404
+
+    def test_api_jobs_rejects_unknown_actions(self, job_db, client: TestClient):
+        response = client.post("/api/v1/jobs", json={"actions": {"com.a": "explode"}})
+        assert response.status_code == 422
+        assert job_queue._queue.empty()
@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+import pytest
+
+from src.exceptions import ErrorCodes
+from src.knowledge_base import SAFETY_TIERS, KnowledgeBase, knowledge_base
+from src.models import KnowledgeEntry, PackageInfo
+from src.pkg_manager import PackageManager
+
+SOURCE = (
+    "# comment\n"
+    "package\tvendor\ttier\tdescription\trequired_by\n"
+    "com.a\tVendor A\trecommended\tApp A\t\n"
+    "com.b\tVendor B\tunsafe\tApp B\tcom.a,com.c\n"
+    "com.broken\tVendor\tharmless\tUnknown tier\t\n"
+)
+
+
+@pytest.fixture
+def knowledge(tmp_path):
+    source = tmp_path / "knowledge_base.tsv"
+    source.write_text(SOURCE)
+    knowledge = KnowledgeBase(str(source), str(tmp_path / "cache"))
+    yield knowledge
+    knowledge.close()
+
+
+class TestKnowledgeBase:
+    """Test cases for the knowledge base index"""
+
+    def test_lookups(self, knowledge):
+        assert knowledge.lookup("com.a") == KnowledgeEntry(
+            "com.a", "Vendor A", "recommended", "App A"
+        )
+        assert knowledge.lookup_many(["com.b", "com.unknown", "com.broken", "com.b"]) == {
+            "com.b": KnowledgeEntry("com.b", "Vendor B", "unsafe", "App B", ("com.a", "com.c"))
+        }
+
+    def test_index_is_built_once_and_reused(self, knowledge, tmp_path):
+        knowledge.lookup("com.a")
+        assert os.listdir(tmp_path / "cache") == [f"knowledge-{knowledge.version}.sqlite"]
+
+        reopened = KnowledgeBase(knowledge.source, knowledge.cache_dir)
+        with patch.object(KnowledgeBase, '_build') as mock_build:
+            assert reopened.lookup("com.a").vendor == "Vendor A"
+        mock_build.assert_not_called()
+        reopened.close()
+
+    def test_lookups_are_remembered(self, knowledge):
+        knowledge.lookup_many(["com.a", "com.unknown"])
+        knowledge._connection.close()
+
+        assert list(knowledge.lookup_many(["com.a", "com.unknown"])) == ["com.a"]
+
+    def test_falls_back_to_memory_without_a_cache_dir(self, knowledge, tmp_path):
+        blocker = tmp_path / "file"
+        blocker.write_text("")
+        knowledge.cache_dir = str(blocker / "cache")
+
+        assert knowledge.lookup("com.b").tier == "unsafe"
+
+    @pytest.mark.asyncio
+    async def test_open_builds_the_index_in_a_thread(self, knowledge):
+        threads = []
+        connect = knowledge._connect
+
+        def record_thread():
+            threads.append(threading.current_thread())
+            return connect()
+
+        with patch.object(knowledge, '_connect', side_effect=record_thread):
+            await knowledge.open()
+            await knowledge.open()
+
+        assert threads and threading.main_thread() not in threads
+        assert len(threads) == 1
+        assert knowledge.lookup("com.a").vendor == "Vendor A"
+
+    def test_concurrent_lookups(self, knowledge):
+        knowledge.max_cached_entries = 2
+        names = ["com.a", "com.b", "com.unknown"]
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(knowledge.lookup_many, [names] * 200))
+
+        assert all(sorted(result) == ["com.a", "com.b"] for result in results)
+
+    def test_bundled_entries_are_valid(self):
+        entries = list(knowledge_base.read_entries())
+        names = [entry.package for entry in entries]
+
+        assert len(entries) > 100
+        assert len(set(names)) == len(names)
+        assert {entry.tier for entry in entries} == set(SAFETY_TIERS)
+        with open(knowledge_base.source) as source:
+            lines = [line for line in source if not line.startswith(("#", "package\t"))]
+        assert len(lines) == len(entries)
+
+
+class TestKnowledgeRoutes:
+    """Test cases for the knowledge base on the packages page and in the API"""
+
+    PACKAGES = [PackageInfo("com.facebook.appmanager", 10001), PackageInfo("com.example", 10002)]
+
+    def test_packages_page_shows_safety(self, client: TestClient):
+        with patch.object(
+            PackageManager,
+            'get_installed_packages',
+            new_callable=AsyncMock,
+            return_value=(ErrorCodes.SUCCESS, self.PACKAGES),
+        ):
+            response = client.get("/packages")
+
+        assert response.status_code == 200
+        assert "Recommended</span>" in response.text
+        assert "Meta: Facebook App Manager" in response.text
+        assert "Unknown</span>" in response.text
+
+    def test_api_packages_carry_entries(self, client: TestClient):
+        with patch.object(
+            PackageManager,
+            'get_installed_packages',
+            new_callable=AsyncMock,
+            return_value=(ErrorCodes.SUCCESS, self.PACKAGES),
+        ):
+            packages = client.get("/api/v1/devices/serial1/packages").json()["packages"]
+
+        assert packages[0]["knowledge"] is None
+        assert packages[1]["knowledge"]["vendor"] == "Meta"
+        assert packages[1]["knowledge"]["tier"] == "recommended"
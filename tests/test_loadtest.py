@@ -0,0 +1,113 @@
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from src import main
+from src.loadtest import (
+    JOB_POLL_INTERVAL,
+    STEPS,
+    LoadStats,
+    discover,
+    drain_jobs,
+    percentile,
+    run_level,
+    wait_for_job,
+)
+
+
+def fake_app(request: httpx.Request) -> httpx.Response:
+    """Answer the flow like the application, failing the packages page of device s2"""
+    if request.url.path == "/apply-actions":
+        job_polls.append(0)
+        return httpx.Response(303, headers={"Location": f"/actions/{len(job_polls)}"})
+    if request.url.path.startswith("/api/v1/jobs/"):
+        # Every job runs for one poll before it succeeds
+        job_id = int(request.url.path.split("/")[-1])
+        job_polls[job_id - 1] += 1
+        status = "running" if job_polls[job_id - 1] == 1 else "succeeded"
+        return httpx.Response(200, json={"id": job_id, "status": status})
+    if request.url.path == "/api/v1/jobs":
+        return httpx.Response(200, json={"jobs": []})
+    if request.url.path == "/api/v1/devices":
+        return httpx.Response(
+            200, json={"devices": [{"serial_number": "s1"}, {"serial_number": "s2"}]}
+        )
+    if request.url.path.endswith("/packages") and request.url.path.startswith("/api"):
+        serial = request.url.path.split("/")[4]
+        packages = [{"name": f"com.{serial}.app"}] if serial == "s1" else []
+        return httpx.Response(200, json={"packages": packages})
+    if request.method == "POST":
+        return httpx.Response(303, headers={"Location": "/"})
+    return httpx.Response(500 if request.url.path == "/packages" else 200)
+
+
+job_polls = []
+
+
+class TestLoadTest:
+    """Test cases for the load generator"""
+
+    @pytest.mark.parametrize("share, expected", [(0.5, 2.0), (0.99, 4.0), (1.0, 4.0), (0.0, 1.0)])
+    def test_percentile(self, share, expected):
+        assert percentile([4.0, 1.0, 3.0, 2.0], share) == expected
+        assert percentile([], share) == 0.0
+
+    def test_summary(self):
+        stats = LoadStats()
+        stats.record("list_devices", 0.010, True)
+        stats.record("apply_actions", 0.030, False)
+
+        summary = stats.summary(users=2, elapsed=2.0)
+
+        assert (summary["requests"], summary["errors"], summary["throughput_rps"]) == (2, 1, 1.0)
+        assert summary["latency_ms"]["max"] == 30.0
+        assert summary["steps"]["apply_actions"]["errors"] == 1
+
+    @pytest.mark.asyncio
+    async def test_users_run_the_flow(self):
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(fake_app), base_url="http://test"
+        ) as client:
+            devices = await discover(client, actions=5)
+            summary = await run_level(client, devices, users=3, duration=0.2)
+
+        assert devices == {"s1": ["com.s1.app"]}
+        counts = {step: summary["steps"][step]["requests"] for step in STEPS}
+        assert len(set(counts.values())) == 1 and counts["list_devices"] >= 3
+        assert summary["errors"] == summary["steps"]["view_packages"]["requests"]
+        assert summary["event_loop_lag_ms"]["max"] >= 0.0
+        # Every job was followed until it was over
+        assert len(job_polls) == counts["apply_actions"] and set(job_polls) == {2}
+        assert summary["steps"]["apply_actions"]["p50"] >= JOB_POLL_INTERVAL * 1e3
+
+    @pytest.mark.asyncio
+    async def test_failed_jobs_are_errors_and_drained(self):
+        statuses = iter(["queued", "failed"])
+        listed = iter([[{"id": 1}], []])
+
+        def app(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/api/v1/jobs/1":
+                return httpx.Response(200, json={"id": 1, "status": next(statuses)})
+            return httpx.Response(200, json={"jobs": next(listed)})
+
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(app), base_url="http://test"
+        ) as client:
+            redirect = httpx.Response(303, headers={"Location": "/actions/1"})
+            assert not await wait_for_job(client, redirect)
+            assert not await wait_for_job(client, httpx.Response(200))
+            await drain_jobs(client)
+
+        assert next(listed, None) is None
+
+    def test_cli_subcommand(self):
+        with patch('sys.argv', ["bloatware-remover", "loadtest", "--users", "5"]):
+            with (
+                patch('src.loadtest.main') as mock_loadtest,
+                patch.object(main, 'check_adb') as check,
+            ):
+                main.main()
+
+        mock_loadtest.assert_called_once_with(["--users", "5"])
+        check.assert_not_called()
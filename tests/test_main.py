@@ -1,6 +1,14 @@
+from unittest.mock import patch
+
 from fastapi.testclient import TestClient
 
-from src.main import app
+from src.app import app
+from src.db import db_manager
+from src.exceptions import ErrorCodes
+from src.fleet import FleetManager
+from src.models import PackageInfo
+from src.pkg_manager import PackageManager
+from src.snapshots import PackageDelta, Snapshot
 
 
 class TestMainApplication:
@@ -51,11 +59,137 @@ class TestApplicationEndpoints:
         # Should redirect to root if no connection
         assert response.status_code in [200, 303]
 
-    def test_apply_actions_endpoint_exists(self, client: TestClient):
+    def test_packages_page_shows_metadata(self, client: TestClient):
+        """Test that the packages page renders the metadata of each package"""
+        packages = [
+            PackageInfo("com.android.phone", 1001, 33, enabled=False, system=True),
+            PackageInfo("com.example.app", 10123, 42, installer="com.android.vending"),
+        ]
+        with patch.object(
+            PackageManager, 'get_installed_packages', return_value=(ErrorCodes.SUCCESS, packages)
+        ):
+            response = client.get("/packages")
+
+        assert response.status_code == 200
+        assert 'name="action_com.example.app"' in response.text
+        assert "com.android.vending" in response.text
+        assert "Disabled" in response.text
+
+    def test_packages_page_filters_and_paginates(self, client: TestClient):
+        """Test that the packages page is filtered and paginated on the server"""
+        packages = [PackageInfo(f"com.example.app{i:02}", 10000 + i) for i in range(30)]
+        packages.append(PackageInfo("com.android.phone", 1001, system=True))
+        with patch.object(
+            PackageManager, 'get_installed_packages', return_value=(ErrorCodes.SUCCESS, packages)
+        ):
+            response = client.get("/packages?q=example&kind=user&per_page=10&page=2")
+
+        assert response.status_code == 200
+        assert 'name="action_com.example.app10"' in response.text
+        assert 'name="action_com.example.app09"' not in response.text
+        assert "com.android.phone" not in response.text
+        assert "30 packages found, page 2 of 3" in response.text
+
+    def test_apply_actions_endpoint_exists(self, job_db, client: TestClient):
         """Test that the apply actions endpoint exists and accepts POST requests"""
         response = client.post("/apply-actions", data={})
         assert response.status_code == 200
 
+    def test_apply_actions_fleet_without_devices_redirects(self, client: TestClient):
+        """Test that the fleet endpoint needs at least one device"""
+        response = client.post("/apply-actions-fleet", data={}, follow_redirects=False)
+        assert response.status_code == 303
+
+    def test_apply_actions_fleet_reports_every_device(self, client: TestClient):
+        """Test that the fleet endpoint renders a report per device"""
+        reports = {
+            serial: {
+                "serial_number": serial,
+                "succeeded": ["com.example.app"],
+                "failed": [],
+                "duration": 0.1,
+                "error": None,
+            }
+            for serial in ("serial1", "serial2")
+        }
+        with patch.object(FleetManager, 'apply_actions', return_value=reports) as mock_apply:
+            response = client.post(
+                "/apply-actions-fleet",
+                data={
+                    "serial_numbers": ["serial1", "serial2"],
+                    "action_com.example.app": "disable",
+                },
+            )
+
+        assert response.status_code == 200
+        assert "serial1" in response.text and "serial2" in response.text
+        mock_apply.assert_called_once_with(
+            ["serial1", "serial2"], {"action_com.example.app": "disable"}
+        )
+
+    def test_journal_page_offers_restore(self, client: TestClient):
+        """Test that the journal page lists the actions to undo"""
+        entry = {
+            "id": 1,
+            "package": "com.example.app",
+            "action": "uninstall",
+            "previous_state": "enabled",
+            "performed_at": 1.0,
+        }
+        with patch.object(db_manager, 'get_journal', return_value=[entry]):
+            response = client.get("/journal")
+
+        assert response.status_code == 200
+        assert 'value="com.example.app"' in response.text
+
+    def test_restore_reports_the_device(self, client: TestClient):
+        """Test that the restore form undoes the selected packages on the selected device"""
+        report = {
+            "serial_number": "test_device",
+            "succeeded": ["com.example.app"],
+            "failed": [],
+            "skipped": [],
+            "duration": 0.1,
+            "error": None,
+        }
+        with patch.object(
+            FleetManager, 'restore_actions', return_value={"test_device": report}
+        ) as mock_restore:
+            response = client.post("/restore", data={"packages": ["com.example.app"]})
+
+        assert "Restored 1 packages." in response.text
+        mock_restore.assert_called_once_with(["test_device"], packages=["com.example.app"])
+
+
+class TestPackageChangesEndpoint:
+    """Test cases for the package changes endpoint"""
+
+    def test_changes_without_since_returns_full_list(self, client: TestClient):
+        snapshot = Snapshot(7, "test_device", 0.0, {"com.a": PackageInfo("com.a", 10001, 1)})
+        with patch.object(
+            PackageManager, 'take_snapshot', return_value=(ErrorCodes.SUCCESS, snapshot)
+        ):
+            response = client.get("/packages/changes")
+
+        assert response.status_code == 200
+        assert response.json()["snapshot_id"] == 7
+        assert response.json()["packages"][0]["name"] == "com.a"
+
+    def test_changes_since_returns_delta(self, client: TestClient):
+        snapshot = Snapshot(8, "test_device", 0.0, {})
+        delta = PackageDelta(removed=[PackageInfo("com.a", 10001, 1)])
+        with patch.object(
+            PackageManager,
+            'changes_since',
+            return_value=(ErrorCodes.SUCCESS, snapshot, delta),
+        ) as mock_changes:
+            response = client.get("/packages/changes?since=7")
+
+        mock_changes.assert_called_once_with("test_device", 7)
+        assert response.json()["since"] == 7
+        assert response.json()["changes"]["removed"][0]["name"] == "com.a"
+        assert "packages" not in response.json()
+
 
 class TestApplicationConfiguration:
     """Test cases for application configuration"""
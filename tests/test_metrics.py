@@ -0,0 +1,114 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+import pytest
+
+from src.adb_client import AdbClient
+from src.cmd_manager import CommandResult
+from src.fake_adb_server import FakeAdbServer, FakeDevice
+from src.metrics import (
+    CommandTimer,
+    Histogram,
+    adb_command_duration,
+    adb_command_name,
+    adb_commands_in_flight,
+    adb_read_bytes,
+    host_service_name,
+    http_request_duration,
+    outcome,
+    shell_command_name,
+)
+
+
+class TestMetrics:
+    """Test cases for the metrics and their exposition"""
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(("/",), value)
+
+        assert histogram.render().splitlines() == [
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{route="/",le="0.1"} 1',
+            'latency_seconds_bucket{route="/",le="1"} 3',
+            'latency_seconds_bucket{route="/",le="+Inf"} 4',
+            'latency_seconds_sum{route="/"} 4.25',
+            'latency_seconds_count{route="/"} 4',
+        ]
+
+    @pytest.mark.parametrize(
+        "args, expected",
+        [
+            (["adb", "devices", "-l"], ("devices", None)),
+            (["adb", "-s", "s1", "shell", "pm", "list", "packages", "-f"], ("pm list", "s1")),
+            (
+                ["adb", "-s", "s1", "shell", "pm disable-user --user 0 com.a"],
+                ("pm disable-user", "s1"),
+            ),
+            (["adb", "pair", "10.0.0.2:37000", "123456"], ("pair", None)),
+            (["adb", "-s", "s1", "shell", "getprop"], ("shell", "s1")),
+        ],
+    )
+    def test_adb_command_name(self, args, expected):
+        assert adb_command_name(args) == expected
+
+    def test_command_names(self):
+        assert shell_command_name("{ pm uninstall --user 0 com.a; echo $?; }") == "pm uninstall"
+        assert host_service_name("host:devices-l") == "devices"
+        assert host_service_name("host:pair:123456:10.0.0.2:37000") == "pair"
+        assert host_service_name("host-serial:s1:features") == "features"
+
+    def test_outcome(self):
+        assert outcome(CommandResult(args=[], returncode=0)) == "success"
+        assert outcome(CommandResult(args=[], returncode=1)) == "failure"
+        assert outcome(CommandResult(args=[], returncode=None)) == "error"
+        assert outcome(CommandResult(args=[], returncode=None, timed_out=True)) == "timeout"
+
+    def test_command_timer(self):
+        with CommandTimer("pm list", "session", "s1") as timer:
+            assert adb_commands_in_flight.values[("s1",)] == 1
+            timer.outcome = "failure"
+        with pytest.raises(asyncio.CancelledError):
+            with CommandTimer("pm list", "session", "s1"):
+                raise asyncio.CancelledError()
+
+        assert adb_commands_in_flight.values[("s1",)] == 0
+        assert set(adb_command_duration.values) == {
+            ("pm list", "failure", "session"),
+            ("pm list", "cancelled", "session"),
+        }
+
+    def test_requests_are_recorded_by_route(self, client: TestClient):
+        client.get("/api/v1/devices/s1/journal")
+        client.get("/api/v1/devices/s2/journal")
+        client.get("/missing")
+
+        assert set(http_request_duration.values) == {
+            ("GET", "/api/v1/devices/{serial_number}/journal", "200"),
+            ("GET", "other", "404"),
+        }
+        assert sum(http_request_duration.values[("GET", "other", "404")][:-1]) == 1
+
+    @pytest.mark.asyncio
+    async def test_adb_server_commands_are_exposed(self, client: TestClient):
+        device = FakeDevice("emulator-5554", packages=["com.example.app1"])
+        async with FakeAdbServer([device]) as server:
+            adb = AdbClient(port=server.port)
+            await adb.devices()
+            await adb.shell("emulator-5554", "pm list packages")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert (
+            'adb_command_duration_seconds_count{command="devices",outcome="success",'
+            'transport="server"} 1'
+        ) in response.text
+        assert (
+            'adb_command_duration_seconds_count{command="pm list",outcome="success",'
+            'transport="server"} 1'
+        ) in response.text
+        assert adb_read_bytes.values[("server",)] > len("package:com.example.app1\n")
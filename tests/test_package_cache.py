@@ -0,0 +1,72 @@
+from unittest.mock import patch
+
+from src.package_cache import PackageCache
+
+
+class TestPackageCache:
+    """Test cases for PackageCache class"""
+
+    def test_get_returns_stored_inventory(self):
+        cache = PackageCache()
+        cache.set("serial1", ["com.example.app"])
+
+        assert cache.get("serial1") == ["com.example.app"]
+        assert cache.get("serial2") is None
+
+    def test_entries_expire(self):
+        cache = PackageCache(ttl=10)
+        with patch("src.package_cache.time.monotonic", return_value=100.0):
+            cache.set("serial1", ["com.example.app"])
+        with patch("src.package_cache.time.monotonic", return_value=109.0):
+            assert cache.get("serial1") == ["com.example.app"]
+        with patch("src.package_cache.time.monotonic", return_value=110.0):
+            assert cache.get("serial1") is None
+
+    def test_entries_expire_from_when_they_were_taken(self):
+        cache = PackageCache(ttl=10)
+        with patch("src.package_cache.time.time", return_value=1000.0):
+            with patch("src.package_cache.time.monotonic", return_value=100.0):
+                cache.set("serial1", ["recent"], taken_at=996.0)
+                cache.set("serial2", ["old"], taken_at=980.0)
+        with patch("src.package_cache.time.monotonic", return_value=105.0):
+            assert cache.get("serial1") == ["recent"]
+        with patch("src.package_cache.time.monotonic", return_value=106.0):
+            assert cache.get("serial1") is None
+        assert cache.get("serial2") is None
+
+    def test_least_recently_used_device_is_evicted(self):
+        cache = PackageCache(max_devices=2)
+        cache.set("serial1", ["a"])
+        cache.set("serial2", ["b"])
+        cache.get("serial1")
+        cache.set("serial3", ["c"])
+
+        assert cache.get("serial1") == ["a"]
+        assert cache.get("serial2") is None
+        assert cache.get("serial3") == ["c"]
+
+    def test_invalidate_one_device(self):
+        cache = PackageCache()
+        cache.set("serial1", ["a"])
+        cache.set("serial2", ["b"])
+        cache.invalidate("serial1")
+
+        assert cache.get("serial1") is None
+        assert cache.get("serial2") == ["b"]
+
+    def test_invalidate_all_devices(self):
+        cache = PackageCache()
+        cache.set("serial1", ["a"])
+        cache.set("serial2", ["b"])
+        cache.invalidate()
+
+        assert cache.get("serial1") is None
+        assert cache.get("serial2") is None
+
+    def test_loads_started_before_invalidation_are_dropped(self):
+        cache = PackageCache()
+        generation = cache.generation("serial1")
+        cache.invalidate("serial1")
+        cache.set("serial1", ["stale"], generation=generation)
+
+        assert cache.get("serial1") is None
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from src.models import PackageInfo
+from src.package_index import PackageIndex
+
+PACKAGES = [
+    PackageInfo("com.google.android.gm", 10001, 30, installer="com.android.vending"),
+    PackageInfo("com.android.settings", 1000, 33, system=True),
+    PackageInfo("com.facebook.katana", 10002, 12, enabled=False, installer="com.android.vending"),
+    PackageInfo("com.google.android.youtube", 10003, None, system=True),
+    PackageInfo("com.samsung.android.app.notes", 10004, 7, installer="com.sec.android.app"),
+]
+
+
+def names(page):
+    return [package.name for package in page.packages]
+
+
+class TestPackageIndex:
+    """Test cases for PackageIndex"""
+
+    def test_packages_are_sorted_by_name(self):
+        page = PackageIndex(PACKAGES).query()
+
+        assert names(page) == sorted(package.name for package in PACKAGES)
+        assert page.total == 5
+
+    def test_mixed_case_names(self):
+        index = PackageIndex(
+            PACKAGES
+            + [
+                PackageInfo("com.UCMobile.intl", 10005),
+                PackageInfo("com.Zeta.app", 10006),
+                PackageInfo("com.Xyz.q", 10007),
+            ]
+        )
+
+        assert names(index.query("com.ucmobile")) == ["com.UCMobile.intl"]
+        assert names(index.query("com.zeta")) == ["com.Zeta.app"]
+        assert names(index.query("com.xyz.")) == ["com.Xyz.q"]
+        assert names(index.query("com.g")) == [
+            "com.google.android.gm",
+            "com.google.android.youtube",
+        ]
+        assert names(index.query(limit=10))[-3:] == [
+            "com.UCMobile.intl",
+            "com.Xyz.q",
+            "com.Zeta.app",
+        ]
+
+    def test_search_matches_name_segment_prefixes(self):
+        index = PackageIndex(PACKAGES)
+
+        assert names(index.query("goo")) == ["com.google.android.gm", "com.google.android.youtube"]
+        assert names(index.query("goo YOU")) == ["com.google.android.youtube"]
+        assert names(index.query("com.google.android.g")) == ["com.google.android.gm"]
+        assert index.query("oogle").total == 0
+
+    def test_facets(self):
+        index = PackageIndex(PACKAGES)
+
+        assert names(index.query(system=True)) == [
+            "com.android.settings",
+            "com.google.android.youtube",
+        ]
+        assert names(index.query(enabled=False)) == ["com.facebook.katana"]
+        assert names(index.query("android", system=False, installer="com.android.vending")) == [
+            "com.google.android.gm"
+        ]
+        assert index.query(installer="").total == 2
+        assert index.installers == ["com.android.vending", "com.sec.android.app"]
+
+    def test_sort_by_field(self):
+        index = PackageIndex(PACKAGES)
+
+        assert [p.version_code for p in index.query(sort="version_code").packages] == [
+            7,
+            12,
+            30,
+            33,
+            None,
+        ]
+        assert names(index.query(sort="uid", descending=True, limit=2)) == [
+            "com.samsung.android.app.notes",
+            "com.google.android.youtube",
+        ]
+        with pytest.raises(ValueError):
+            index.query(sort="path")
+
+    def test_pagination_matches_a_plain_scan(self):
+        rng = random.Random(7)
+        packages = [
+            PackageInfo(f"com.vendor{rng.randrange(30)}.app{i}", uid=i, system=rng.random() < 0.4)
+            for i in range(2000)
+        ]
+        index = PackageIndex(packages)
+        expected = sorted((p for p in packages if not p.system), key=lambda p: p.name)
+
+        for offset in (0, 50, 1150, len(expected) - 3, len(expected) + 10):
+            for descending in (False, True):
+                ordered = expected[::-1] if descending else expected
+                page = index.query(system=False, offset=offset, limit=50, descending=descending)
+                assert page.packages == ordered[offset : offset + 50]
+                page = index.query(
+                    system=False, sort="uid", offset=offset, limit=50, descending=descending
+                )
+                by_uid = sorted(ordered, key=lambda p: p.uid, reverse=descending)
+                assert page.packages == by_uid[offset : offset + 50]
+        assert index.query(system=False, limit=50).pages == -(-len(expected) // 50)
+
+    def test_empty_index(self):
+        page = PackageIndex([]).query("anything", sort="uid")
+
+        assert page.packages == []
+        assert page.total == 0
+        assert page.pages == 1
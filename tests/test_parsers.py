@@ -0,0 +1,139 @@
+import pytest
+
+from src.models import PackageInfo
+from src.parsers import (
+    DeviceListParser,
+    DumpsysPackageParser,
+    PackageInventoryParser,
+    PackageListParser,
+    aiter_lines,
+    aparse,
+    iter_lines,
+    parse,
+)
+
+DUMPSYS_OUTPUT = """\
+Database versions:
+  Internal:
+    sdkVersion=33 databaseVersion=3
+
+Packages:
+  Package [com.example.app] (8c1a2f3):
+    userId=10123
+    pkg=Package{5f3e2c1 com.example.app}
+    codePath=/data/app/~~abc==/com.example.app-xyz==
+    versionCode=42 minSdk=26 targetSdk=33
+    versionName=4.2.0
+    flags=[ HAS_CODE ALLOW_CLEAR_USER_DATA ALLOW_BACKUP ]
+    installerPackageName=com.android.vending
+    User 0: ceDataInode=1234 installed=true hidden=false suspended=false enabled=0
+  Package [com.android.settings] (1b2c3d4):
+    userId=1000
+    codePath=/system/priv-app/Settings
+    versionCode=33 minSdk=33 targetSdk=33
+    flags=[ SYSTEM HAS_CODE PERSISTENT ]
+    User 0: ceDataInode=0 installed=true hidden=false suspended=false enabled=3
+
+Queries:
+  Package [com.not.a.package] (ffff):
+    userId=1
+"""
+
+
+async def agen(items):
+    for item in items:
+        yield item
+
+
+class TestLines:
+    """Test cases for splitting chunked output into lines"""
+
+    def test_lines_split_across_chunks(self):
+        chunks = ["pack", "age:a\npackage", ":b\n\npackage:c"]
+
+        assert list(iter_lines(chunks)) == ["package:a", "package:b", "", "package:c"]
+
+    def test_long_lines_are_cut(self):
+        chunks = ["x" * 10, "y" * 10, "\nz"]
+
+        assert list(iter_lines(chunks, max_line_length=8)) == ["x" * 8, "z"]
+
+    @pytest.mark.asyncio
+    async def test_async_lines(self):
+        lines = [line async for line in aiter_lines(agen(["a\nb", "c\n"]))]
+
+        assert lines == ["a", "bc"]
+
+
+class TestParsers:
+    """Test cases for the adb output parsers"""
+
+    def test_package_list_parser(self):
+        output = "package:com.a uid:10001\n\nnoise\npackage:com.b versionCode:7\n"
+
+        assert list(parse(PackageListParser(), iter_lines([output]))) == [
+            PackageInfo("com.a", uid=10001),
+            PackageInfo("com.b", version_code=7),
+        ]
+
+    def test_package_inventory_parser(self):
+        output = (
+            "package:com.android.phone\n__M__\n"
+            "package:com.android.phone\npackage:com.b\n__M__\n"
+            "package:/system/priv-app/Phone/Phone.apk=com.android.phone uid:1001\n"
+            "package:/data/app/com.a-1/base.apk=com.a uid:10001\n"
+            "package:/data/app/com.b-1/base.apk=com.b uid:10002\n"
+        )
+
+        records = list(parse(PackageInventoryParser("__M__"), iter_lines([output])))
+
+        assert [(p.name, p.system, p.enabled) for p in records] == [
+            ("com.android.phone", True, False),
+            ("com.a", False, True),
+            ("com.b", False, False),
+        ]
+        assert records[0].path == "/system/priv-app/Phone/Phone.apk"
+
+    def test_device_list_parser(self):
+        output = (
+            "* daemon started successfully\n"
+            "List of devices attached\n"
+            "emulator-5554\tdevice product:sdk model:Pixel_7 device:emu transport_id:1\n"
+            "serial789\tunauthorized\n\n"
+        )
+
+        devices = list(parse(DeviceListParser(), iter_lines([output])))
+
+        assert [(d["serial_number"], d["state"], d["model"]) for d in devices] == [
+            ("emulator-5554", "device", "Pixel_7"),
+            ("serial789", "unauthorized", "Unknown"),
+        ]
+
+    def test_dumpsys_package_parser(self):
+        # Chunk boundaries are placed at awkward spots on purpose
+        chunks = [DUMPSYS_OUTPUT[i : i + 37] for i in range(0, len(DUMPSYS_OUTPUT), 37)]
+
+        app, settings = parse(DumpsysPackageParser(), iter_lines(chunks))
+
+        assert app.name == "com.example.app"
+        assert (app.uid, app.version_code, app.version_name) == (10123, 42, "4.2.0")
+        assert app.code_path == "/data/app/~~abc==/com.example.app-xyz=="
+        assert app.installer == "com.android.vending"
+        assert (app.installed, app.enabled, app.system) == (True, True, False)
+        assert settings.name == "com.android.settings"
+        assert (settings.uid, settings.enabled, settings.system) == (1000, False, True)
+
+    @pytest.mark.asyncio
+    async def test_dumpsys_records_arrive_before_the_end(self):
+        """Test that a record is handed out as soon as the next one starts"""
+        parser = DumpsysPackageParser()
+        lines = DUMPSYS_OUTPUT.splitlines()
+        second_header = lines.index("  Package [com.android.settings] (1b2c3d4):")
+
+        seen = [parser.feed(line) for line in lines[: second_header + 1]]
+
+        assert [record.name for records in seen for record in records] == ["com.example.app"]
+        assert [p.name async for p in aparse(DumpsysPackageParser(), agen(lines))] == [
+            "com.example.app",
+            "com.android.settings",
+        ]
@@ -1,88 +1,198 @@
-from unittest.mock import patch
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+import pytest_asyncio
 
-from src.cmd_manager import CommandManager
-from src.exceptions import ErrorCodes
-from src.pkg_manager import PackageManager
+from src.cmd_manager import CommandManager, CommandResult
+from src.db import DbManger, db_manager
+from src.exceptions import ErrorCodes, StreamInterrupted
+from src.models import PackageInfo
+from src.package_cache import package_cache
+from src.pkg_manager import (
+    BATCH_MARKER,
+    INVENTORY_COMMAND,
+    INVENTORY_MARKER,
+    STATE_COMMAND,
+    PackageManager,
+)
+from src.shell_session import shell_sessions
+
+
+def batch_output(*outputs):
+    """Build the stdout of a batch script whose operations printed the given outputs"""
+    return "".join(f"{BATCH_MARKER} {i}\n{output}\n" for i, output in enumerate(outputs))
+
+
+def inventory_output(listing, system="", disabled=""):
+    """Build the stdout of the inventory script"""
+    return f"{system}{INVENTORY_MARKER}\n{disabled}{INVENTORY_MARKER}\n{listing}"
+
+
+def stream_of(*chunks):
+    """Build a CommandManager.stream replacement that yields the given chunks"""
+
+    async def stream(*args, **kwargs):
+        for chunk in chunks:
+            yield chunk
+
+    return MagicMock(side_effect=stream)
 
 
 class TestPackageManager:
     """Test cases for PackageManager class"""
 
     @pytest.mark.asyncio
-    @patch.object(CommandManager, 'execute_command')
-    async def test_get_installed_packages_success(self, mock_execute):
+    async def test_get_installed_packages_success(self):
         """Test successful package retrieval"""
-        mock_output = "package:com.example.app1\npackage:com.example.app2\npackage:com.system.app"
-        mock_execute.return_value = mock_output
+        output = inventory_output(
+            "package:/data/app/~~a1==/com.example.app1-b2==/base.apk=com.example.app1"
+            " versionCode:42  installer=com.android.vending uid:10123\n"
+            "package:/system/app/Settings/Settings.apk=com.android.settings"
+            " versionCode:33  installer=null uid:1000\n",
+            system="package:com.android.settings\n",
+            disabled="package:com.android.settings\n",
+        )
+        # Chunk boundaries in the middle of a line and of the marker
+        mock_stream = stream_of(output[:30], output[30:70], output[70:])
 
-        return_code, packages = await PackageManager.get_installed_packages()
+        with patch.object(CommandManager, 'stream', mock_stream):
+            return_code, packages = await PackageManager.get_installed_packages()
 
-        expected_packages = ["com.example.app1", "com.example.app2", "com.system.app"]
-        assert packages == expected_packages
+        assert packages == [
+            PackageInfo(
+                "com.example.app1",
+                uid=10123,
+                version_code=42,
+                path="/data/app/~~a1==/com.example.app1-b2==/base.apk",
+                installer="com.android.vending",
+            ),
+            PackageInfo(
+                "com.android.settings",
+                uid=1000,
+                version_code=33,
+                enabled=False,
+                path="/system/app/Settings/Settings.apk",
+                system=True,
+            ),
+        ]
         assert return_code == ErrorCodes.SUCCESS
-        mock_execute.assert_called_once_with("adb -s test_device shell pm list packages")
+        mock_stream.assert_called_once_with(
+            ["adb", "-s", "test_device", "shell", INVENTORY_COMMAND], timeout=None
+        )
 
     @pytest.mark.asyncio
-    @patch.object(CommandManager, 'execute_command')
-    async def test_get_installed_packages_empty(self, mock_execute):
-        """Test package retrieval with no packages"""
-        mock_execute.return_value = ""
+    async def test_get_installed_packages_cached(self):
+        """Test that repeated listings are served from the cache until refreshed"""
+        mock_stream = stream_of(inventory_output("package:com.a\n"))
+
+        with patch.object(CommandManager, 'stream', mock_stream):
+            await PackageManager.get_installed_packages()
+            return_code, packages = await PackageManager.get_installed_packages()
+            assert mock_stream.call_count == 1
+            assert [package.name for package in packages] == ["com.a"]
 
+            await PackageManager.get_installed_packages(refresh=True)
+            assert mock_stream.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_invalidates_cache(self, mock_run):
+        """Test that applying actions drops the cached inventory of the device"""
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout=batch_output("Success"))
+        package_cache.set("test_device", ["com.example.app"])
+
+        await PackageManager.perform_action_on_packages({"action_com.example.app": "uninstall"})
+
+        assert package_cache.get("test_device") is None
+
+    @pytest.mark.asyncio
+    @patch.object(CommandManager, 'stream', stream_of())
+    async def test_get_installed_packages_empty(self):
+        """Test package retrieval with no packages"""
         return_code, packages = await PackageManager.get_installed_packages()
 
         assert packages == []
         assert return_code == ErrorCodes.NO_PACKAGES_FOUND
 
     @pytest.mark.asyncio
-    @patch.object(CommandManager, 'execute_command')
-    async def test_get_installed_packages_with_whitespace(self, mock_execute):
-        """Test package retrieval with whitespace in output"""
-        mock_output = "package:com.example.app1\n\npackage:com.example.app2\n  \n"
-        mock_execute.return_value = mock_output
+    async def test_get_installed_packages_truncated(self):
+        """Test that a listing cut short is an error, neither cached nor snapshotted"""
+
+        async def stream(*args, **kwargs):
+            yield inventory_output("package:com.example.app1\n")
+            raise StreamInterrupted("stalled for 30s")
+
+        with patch.object(CommandManager, 'stream', MagicMock(side_effect=stream)):
+            return_code, packages = await PackageManager.get_installed_packages()
+            snapshot_code, snapshot = await PackageManager.take_snapshot("test_device")
 
+        assert return_code == snapshot_code == ErrorCodes.FAILED_OPERATION
+        assert packages == [] and snapshot is None
+        assert package_cache.get("test_device") is None
+        db_manager.save_snapshot.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch.object(
+        CommandManager,
+        'stream',
+        stream_of(inventory_output("package:com.example.app1\n\npackage:com.example.app2\n  \n")),
+    )
+    async def test_get_installed_packages_with_whitespace(self):
+        """Test package retrieval with whitespace in output"""
         return_code, packages = await PackageManager.get_installed_packages()
 
         expected_packages = ["com.example.app1", "com.example.app2"]
-        assert packages == expected_packages
+        assert [package.name for package in packages] == expected_packages
         assert return_code == ErrorCodes.SUCCESS
 
     @pytest.mark.asyncio
-    @patch.object(CommandManager, 'execute_command')
-    async def test_perform_action_on_packages_disable_success(self, mock_execute):
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_disable_success(self, mock_run):
         """Test successful package disable operation"""
-        mock_execute.return_value = "Success"
+        mock_run.return_value = CommandResult(
+            args=[], returncode=0, stdout=batch_output("Package com.example.app new state: Success")
+        )
 
         action_form = {"action_com.example.app": "disable"}
         return_code, failed_packages = await PackageManager.perform_action_on_packages(action_form)
 
         assert failed_packages == []
         assert return_code == ErrorCodes.SUCCESS
-        mock_execute.assert_called_once_with(
-            "adb -s test_device shell pm disable-user --user 0 com.example.app"
+        mock_run.assert_called_once_with(
+            "test_device",
+            f"echo {BATCH_MARKER} 0; pm disable-user --user 0 com.example.app\n",
+            timeout=PackageManager.action_timeout,
+            slot=0,
+            on_line=None,
         )
 
     @pytest.mark.asyncio
-    @patch.object(CommandManager, 'execute_command')
-    async def test_perform_action_on_packages_uninstall_success(self, mock_execute):
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_uninstall_success(self, mock_run):
         """Test successful package uninstall operation"""
-        mock_execute.return_value = "Success"
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout=batch_output("Success"))
 
         action_form = {"action_com.example.app": "uninstall"}
         return_code, failed_packages = await PackageManager.perform_action_on_packages(action_form)
 
         assert failed_packages == []
         assert return_code == ErrorCodes.SUCCESS
-        mock_execute.assert_called_once_with(
-            "adb -s test_device shell pm uninstall --user 0 com.example.app"
+        mock_run.assert_called_once_with(
+            "test_device",
+            f"echo {BATCH_MARKER} 0; pm uninstall --user 0 com.example.app\n",
+            timeout=PackageManager.action_timeout,
+            slot=0,
+            on_line=None,
         )
 
     @pytest.mark.asyncio
-    @patch.object(CommandManager, 'execute_command')
-    async def test_perform_action_on_packages_failure(self, mock_execute):
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_failure(self, mock_run):
         """Test failed package operation"""
-        mock_execute.return_value = "Failure: Package not found"
+        mock_run.return_value = CommandResult(
+            args=[], returncode=1, stdout=batch_output("Failure [not installed for 0]")
+        )
 
         action_form = {"action_com.example.app": "disable"}
         return_code, failed_packages = await PackageManager.perform_action_on_packages(action_form)
@@ -91,21 +201,23 @@ class TestPackageManager:
         assert return_code == ErrorCodes.FAILED_OPERATION
 
     @pytest.mark.asyncio
-    @patch.object(CommandManager, 'execute_command')
-    async def test_perform_action_on_packages_no_action(self, mock_execute):
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_no_action(self, mock_run):
         """Test package operation with no action selected"""
         action_form = {"action_com.example.app": ""}
         return_code, failed_packages = await PackageManager.perform_action_on_packages(action_form)
 
         assert failed_packages == []
         assert return_code == ErrorCodes.SUCCESS
-        mock_execute.assert_not_called()
+        mock_run.assert_not_called()
 
     @pytest.mark.asyncio
-    @patch.object(CommandManager, 'execute_command')
-    async def test_perform_action_on_packages_multiple_actions(self, mock_execute):
-        """Test multiple package operations"""
-        mock_execute.side_effect = ["Success", "Failure", "Success"]
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_multiple_actions(self, mock_run):
+        """Test multiple package operations in one batch"""
+        mock_run.return_value = CommandResult(
+            args=[], returncode=0, stdout=batch_output("Success", "Failure", "Success")
+        )
 
         action_form = {
             "action_com.example.app1": "disable",
@@ -116,15 +228,285 @@ class TestPackageManager:
 
         assert failed_packages == ["com.example.app2"]
         assert return_code == ErrorCodes.FAILED_OPERATION
-        assert mock_execute.call_count == 3
+        assert mock_run.call_count == 1
+
+    @pytest.mark.asyncio
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_batch_size(self, mock_run):
+        """Test that operations are split into batches of the requested size"""
+        mock_run.side_effect = [
+            CommandResult(args=[], returncode=0, stdout=batch_output("Success", "Failure")),
+            CommandResult(args=[], returncode=0, stdout=batch_output("Success")),
+        ]
+
+        action_form = {
+            "action_com.example.app1": "disable",
+            "action_com.example.app2": "uninstall",
+            "action_com.example.app3": "disable",
+        }
+        return_code, failed_packages = await PackageManager.perform_action_on_packages(
+            action_form, batch_size=2
+        )
+
+        assert failed_packages == ["com.example.app2"]
+        assert return_code == ErrorCodes.FAILED_OPERATION
+        assert mock_run.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_incomplete_batch(self, mock_run):
+        """Test that operations which never reported back are failed"""
+        mock_run.return_value = CommandResult(
+            args=[], returncode=None, stdout=batch_output("Success")
+        )
+
+        action_form = {
+            "action_com.example.app1": "disable",
+            "action_com.example.app2": "disable",
+        }
+        return_code, failed_packages = await PackageManager.perform_action_on_packages(action_form)
+
+        assert failed_packages == ["com.example.app2"]
+        assert return_code == ErrorCodes.FAILED_OPERATION
 
     @pytest.mark.asyncio
-    @patch.object(CommandManager, 'execute_command')
-    async def test_perform_action_on_packages_invalid_action(self, mock_execute):
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_invalid_action(self, mock_run):
         """Test package operation with invalid action"""
         action_form = {"action_com.example.app": "invalid_action"}
         return_code, failed_packages = await PackageManager.perform_action_on_packages(action_form)
 
         assert failed_packages == ["com.example.app"]
         assert return_code == ErrorCodes.FAILED_OPERATION
-        mock_execute.assert_called_once_with(":")
+        mock_run.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_perform_action_on_packages_quotes_package_names(self, mock_run):
+        """Test that package names cannot inject shell commands on the device"""
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout=batch_output("Success"))
+
+        action_form = {"action_com.example.app;reboot": "disable"}
+        await PackageManager.perform_action_on_packages(action_form)
+
+        assert "'com.example.app;reboot'" in mock_run.call_args.args[1]
+
+
+class TestBatching:
+    """Test cases for the batch helpers of PackageManager"""
+
+    def test_build_batches_respects_command_length(self):
+        operations = list(enumerate(("com.example.app%d" % i, "uninstall") for i in range(10)))
+        with patch.object(PackageManager, 'max_command_length', 200):
+            batches = PackageManager._build_batches(operations, batch_size=50)
+
+        assert len(batches) > 1
+        assert [entry for batch in batches for entry in batch] == operations
+        assert all(len(PackageManager._batch_script(batch)) <= 200 for batch in batches)
+
+    def test_parse_batch_output(self):
+        stdout = f"{BATCH_MARKER} 0\nSuccess\n{BATCH_MARKER} 1\nFailure [DELETE_FAILED]\nmore\n"
+
+        outputs = PackageManager._parse_batch_output(stdout, 3)
+
+        assert outputs == ["Success\n", "Failure [DELETE_FAILED]\nmore\n", None]
+
+
+def state_output(installed, disabled=()):
+    """Build the stdout of the package state command"""
+    listing = "".join(f"package:{name}\n" for name in installed)
+    return listing + f"{INVENTORY_MARKER}\n" + "".join(f"package:{name}\n" for name in disabled)
+
+
+class TestActionPlanning:
+    """Test cases for skipping operations that change nothing"""
+
+    FORM = {
+        "action_com.disabled": "disable",
+        "action_com.gone": "uninstall",
+        "action_com.enabled": "disable",
+        "action_com.installed": "uninstall",
+    }
+    STATE = state_output(["com.disabled", "com.enabled", "com.installed"], ["com.disabled"])
+
+    @pytest.mark.asyncio
+    @patch.object(PackageManager, 'skip_unchanged', True)
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_only_changes_are_sent(self, mock_run):
+        mock_run.side_effect = [
+            CommandResult(args=[], returncode=0, stdout=self.STATE),
+            CommandResult(args=[], returncode=0, stdout=batch_output("Success", "Success")),
+        ]
+        events = []
+
+        results = await PackageManager.apply_actions(
+            "serial1", self.FORM, progress=lambda type, **fields: events.append((type, fields))
+        )
+
+        assert mock_run.call_args_list[0].args == ("serial1", STATE_COMMAND)
+        script = mock_run.call_args_list[1].args[1]
+        assert "com.enabled" in script and "com.installed" in script
+        assert "com.disabled" not in script and "com.gone" not in script
+        assert all(results.values())
+        assert results.skipped == {
+            "com.disabled": "Already disabled",
+            "com.gone": "Not installed for user 0",
+        }
+        assert [fields["package"] for type, fields in events if type == "skipped"] == [
+            "com.disabled",
+            "com.gone",
+        ]
+
+    @pytest.mark.asyncio
+    @patch.object(PackageManager, 'skip_unchanged', True)
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_reapplied_plan_sends_nothing(self, mock_run):
+        state = state_output(["com.disabled", "com.enabled"], ["com.disabled", "com.enabled"])
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout=state)
+
+        return_code, failed = await PackageManager.perform_action_on_packages(self.FORM)
+
+        assert (return_code, failed) == (ErrorCodes.SUCCESS, [])
+        assert mock_run.call_count == 1
+
+    @pytest.mark.asyncio
+    @patch.object(PackageManager, 'skip_unchanged', True)
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_unreadable_state_applies_everything(self, mock_run):
+        mock_run.side_effect = [
+            CommandResult(args=[], returncode=None, timed_out=True),
+            CommandResult(args=[], returncode=0, stdout=batch_output(*["Success"] * 4)),
+        ]
+
+        results = await PackageManager.apply_actions("serial1", self.FORM)
+
+        assert results.skipped == {}
+        assert mock_run.call_args_list[1].args[1].count(BATCH_MARKER) == 4
+
+
+@pytest_asyncio.fixture
+async def journal_db():
+    """A real in-memory database behind the action journal"""
+    database = DbManger()
+    await database.connect()
+    await database.create_tables()
+    with patch('src.pkg_manager.db_manager', database):
+        yield database
+    await database.close()
+
+
+class TestRestore:
+    """Test cases for journaling actions and undoing them"""
+
+    FORM = {
+        "action_com.disabled": "disable",
+        "action_com.removed": "uninstall",
+        "action_com.failed": "disable",
+    }
+
+    @pytest.mark.asyncio
+    @patch.object(PackageManager, 'skip_unchanged', True)
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_actions_are_undone_in_order(self, mock_run, journal_db):
+        before = state_output(["com.disabled", "com.removed", "com.failed"], ["com.removed"])
+        mock_run.side_effect = [
+            CommandResult(args=[], returncode=0, stdout=before),
+            CommandResult(
+                args=[],
+                returncode=0,
+                stdout=batch_output(
+                    "Package com.disabled new state: disabled-user", "Success", "Error"
+                ),
+            ),
+        ]
+        await PackageManager.apply_actions("serial1", self.FORM)
+
+        journal = await journal_db.get_journal("serial1")
+        assert [(e["package"], e["action"], e["previous_state"]) for e in journal] == [
+            ("com.disabled", "disable", "enabled"),
+            ("com.removed", "uninstall", "disabled"),
+        ]
+
+        after = state_output(["com.disabled", "com.failed"], ["com.disabled"])
+        reinstalled = state_output(["com.disabled", "com.removed", "com.failed"], ["com.disabled"])
+        mock_run.side_effect = [
+            CommandResult(args=[], returncode=0, stdout=after),
+            CommandResult(
+                args=[],
+                returncode=0,
+                stdout=batch_output("Package com.removed installed for user: 0"),
+            ),
+            CommandResult(args=[], returncode=0, stdout=reinstalled),
+            CommandResult(
+                args=[],
+                returncode=0,
+                stdout=batch_output(
+                    "Package com.disabled new state: enabled",
+                    "Package com.removed new state: disabled-user",
+                ),
+            ),
+        ]
+        results = await PackageManager.restore_actions("serial1")
+
+        scripts = [call.args[1] for call in mock_run.call_args_list[-4:]]
+        assert "install-existing --user 0 com.removed" in scripts[1]
+        assert "pm enable --user 0 com.disabled" in scripts[3]
+        # com.removed was disabled when it was uninstalled
+        assert "pm disable-user --user 0 com.removed" in scripts[3]
+        assert results == {"com.removed": True, "com.disabled": True}
+        assert await journal_db.get_journal("serial1") == []
+
+    @pytest.mark.asyncio
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_restore_keeps_disabled_packages_disabled(self, mock_run, journal_db):
+        """Test that packages disabled before their first action are never enabled"""
+        await journal_db.record_actions(
+            "serial1",
+            [
+                ("com.a", "uninstall", True, "Success", "disabled"),
+                ("com.b", "disable", True, "", "disabled"),
+                ("com.c", "disable", True, "", "enabled"),
+                ("com.c", "uninstall", True, "Success", "disabled"),
+            ],
+        )
+        mock_run.side_effect = [
+            CommandResult(args=[], returncode=0, stdout=batch_output("Success", "Success")),
+            CommandResult(
+                args=[],
+                returncode=0,
+                stdout=batch_output(
+                    "Package com.a new state: disabled-user", "Package com.c new state: enabled"
+                ),
+            ),
+        ]
+
+        results = await PackageManager.restore_actions("serial1")
+
+        install, states = [call.args[1] for call in mock_run.call_args_list]
+        assert "install-existing --user 0 com.a" in install
+        assert "install-existing --user 0 com.c" in install
+        assert "pm disable-user --user 0 com.a" in states
+        assert "pm enable --user 0 com.c" in states
+        assert "com.b" not in install + states
+        assert results == {"com.a": True, "com.b": True, "com.c": True}
+        assert results.skipped == {"com.b": "Already disabled before"}
+        assert await journal_db.get_journal("serial1") == []
+
+    @pytest.mark.asyncio
+    @patch.object(shell_sessions, 'execute', new_callable=AsyncMock)
+    async def test_restore_filters_and_keeps_failures(self, mock_run, journal_db):
+        await journal_db.record_actions(
+            "serial1",
+            [
+                ("com.a", "disable", True, "", "enabled"),
+                ("com.b", "disable", True, "", "enabled"),
+                ("com.c", "uninstall", False, "Failure", "enabled"),
+            ],
+        )
+        mock_run.return_value = CommandResult(args=[], returncode=0, stdout=batch_output("Error"))
+
+        results = await PackageManager.restore_actions("serial1", packages=["com.a", "com.c"])
+
+        assert results == {"com.a": False}
+        assert [e["package"] for e in await journal_db.get_journal("serial1")] == ["com.a", "com.b"]
+        assert await journal_db.get_journal("serial1", since=time.time() + 60) == []
@@ -0,0 +1,45 @@
+import os
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src.profiler import SamplingProfiler, sampling_profiler
+
+
+class TestProfiler:
+    """Test cases for the sampling profiler"""
+
+    def test_profiles_the_next_requests(self, tmp_path):
+        profiler = SamplingProfiler(directory=str(tmp_path), interval=0.001)
+        path = profiler.arm(2)
+
+        for _ in range(2):
+            assert profiler.request_started()
+            sum(i * i for i in range(200_000))
+            profiler.request_finished()
+
+        assert not profiler.request_started()
+        assert profiler.status() == {
+            "remaining": 0,
+            "active": 0,
+            "path": None,
+            "last_path": path,
+        }
+        lines = open(path).read().splitlines()
+        assert lines
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) > 0
+        assert any("test_profiles_the_next_requests" in line for line in lines)
+
+    def test_arm_over_http(self, client: TestClient, tmp_path):
+        with patch.object(sampling_profiler, 'directory', str(tmp_path)):
+            response = client.post("/debug/profile?requests=2")
+            client.get("/journal")
+            client.get("/journal")
+
+        path = response.json()["path"]
+        assert response.status_code == 202
+        assert os.path.dirname(path) == str(tmp_path)
+        assert client.get("/debug/profile").json()["last_path"] == path
+        assert os.path.exists(path)
+        assert client.post("/debug/profile?requests=0").status_code == 422
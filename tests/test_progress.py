@@ -0,0 +1,149 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+import pytest
+
+from src.cmd_manager import CommandResult
+from src.pkg_manager import BATCH_MARKER, PackageManager
+from src.progress import ActionRun, ProgressRegistry, progress_registry
+from src.shell_session import shell_sessions
+
+
+class TestActionRun:
+    """Test cases for ActionRun event publishing and following"""
+
+    @pytest.mark.asyncio
+    async def test_follow_replays_and_waits_for_events(self):
+        run = ActionRun("1", "serial1", [("com.a", "disable")])
+        run.publish("started", package="com.a")
+
+        async def finish_later():
+            await asyncio.sleep(0.01)
+            run.publish("succeeded", package="com.a")
+            run.finish(succeeded=1, failed=[])
+
+        task = asyncio.ensure_future(finish_later())
+        events = [event async for event in run.follow()]
+        resumed = [event async for event in run.follow(after=2)]
+        await task
+
+        assert [event["type"] for event in events] == ["started", "succeeded", "done"]
+        assert [event["id"] for event in events] == [1, 2, 3]
+        assert resumed == events[2:]
+
+    @pytest.mark.asyncio
+    async def test_follow_heartbeat(self):
+        run = ActionRun("1", "serial1", [])
+        follower = run.follow(heartbeat=0.01)
+
+        assert await anext(follower) is None
+        run.finish()
+        assert (await anext(follower))["type"] == "done"
+
+    @pytest.mark.asyncio
+    async def test_batches_group_events_published_meanwhile(self):
+        run = ActionRun("1", "serial1", [])
+        run.publish("started", package="com.a")
+        run.publish("succeeded", package="com.a")
+        batches = run.batches()
+
+        assert [event["id"] for event in await anext(batches)] == [1, 2]
+        run.publish("started", package="com.b")
+        run.finish()
+        assert [event["type"] for event in await anext(batches)] == ["started", "done"]
+        assert [batch async for batch in batches] == []
+
+    def test_registry_drops_old_finished_runs(self):
+        registry = ProgressRegistry(max_runs=2)
+        runs = [registry.create("serial1", []) for _ in range(3)]
+        runs[0].finish()
+        registry.create("serial1", [])
+
+        assert registry.get(runs[0].id) is None
+        assert registry.get(runs[1].id) is runs[1]
+
+
+class TestActionProgress:
+    """Test cases for the progress published by PackageManager.apply_actions"""
+
+    @pytest.mark.asyncio
+    async def test_events_follow_the_batch_output(self):
+        events = []
+
+        async def execute(serial, command, timeout=None, slot=0, on_line=None):
+            # The third operation never reports, as if the shell timed out on it
+            lines = [f"{BATCH_MARKER} 0\n", "Success\n", f"{BATCH_MARKER} 1\n", "Failure\n"]
+            for line in lines:
+                on_line(line)
+            return CommandResult(args=[], returncode=0, stdout="".join(lines))
+
+        action_form = {
+            "action_com.a": "uninstall",
+            "action_com.b": "uninstall",
+            "action_com.c": "disable",
+            "action_com.d": "explode",
+        }
+        with patch.object(shell_sessions, 'execute', execute):
+            results = await PackageManager.apply_actions(
+                "serial1",
+                action_form,
+                progress=lambda type, **fields: events.append((type, fields)),
+            )
+
+        assert results == {"com.a": True, "com.b": False, "com.c": False, "com.d": False}
+        assert [(type, fields["package"]) for type, fields in events] == [
+            ("failed", "com.d"),
+            ("started", "com.a"),
+            ("succeeded", "com.a"),
+            ("started", "com.b"),
+            ("failed", "com.b"),
+            ("failed", "com.c"),
+        ]
+        assert events[2][1]["output"] == "Success"
+        assert all(fields["serial_number"] == "serial1" for _, fields in events)
+
+    @pytest.mark.asyncio
+    async def test_run_actions_always_finishes(self):
+        run = ActionRun("1", "serial1", [("com.a", "disable")])
+        with patch.object(PackageManager, 'apply_actions', side_effect=RuntimeError("offline")):
+            await PackageManager.run_actions(run, {"action_com.a": "disable"})
+
+        assert run.done
+        assert run.events[-1]["error"] == "offline"
+
+
+class TestActionRoutes:
+    """Test cases for the apply-actions progress routes"""
+
+    @patch.object(PackageManager, 'run_actions', new_callable=AsyncMock)
+    def test_apply_actions_redirects_to_progress(self, mock_run, job_db, client: TestClient):
+        response = client.post(
+            "/apply-actions", data={"action_com.a": "disable"}, follow_redirects=False
+        )
+
+        assert response.status_code == 303
+        run = progress_registry.get(response.headers["location"].rsplit("/", 1)[1])
+        assert run.serial_number == "test_device"
+        assert run.operations == [("com.a", "disable")]
+
+    def test_progress_events(self, client: TestClient):
+        run = progress_registry.create("serial1", [("com.a", "disable")], run_id="7")
+        run.publish("started", package="com.a")
+        run.publish("succeeded", package="com.a", duration=0.1)
+        run.finish(succeeded=1, failed=[])
+
+        stream = client.get("/actions/7/events", headers={"Last-Event-ID": "1"})
+
+        assert stream.headers["content-type"].startswith("text/event-stream")
+        messages = [message for message in stream.text.split("\n\n") if message]
+        assert [message.split("\n")[:2] for message in messages] == [
+            ["id: 2", "event: succeeded"],
+            ["id: 3", "event: done"],
+        ]
+        assert json.loads(messages[1].split("data: ", 1)[1])["succeeded"] == 1
+
+    def test_unknown_run(self, job_db, client: TestClient):
+        assert client.get("/actions/999").status_code == 404
+        assert client.get("/actions/999/events").status_code == 404
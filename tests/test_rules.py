@@ -0,0 +1,151 @@
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+import pytest
+
+from src.exceptions import ErrorCodes
+from src.models import PackageInfo, Rule
+from src.pkg_manager import PackageManager
+from src.rules import RuleSet, _regex_prefix, rule_set
+
+BUNDLED = (
+    "pattern\taction\tdescription\n"
+    "com.vendor.*\tdisable\tEverything of the vendor\n"
+    "com.vendor.game.*\tuninstall\tGames\n"
+    "com.vendor.game.core\tkeep\tNeeded by the launcher\n"
+    "*.ads.*\tuninstall\n"
+    "re:com\\.vendor\\.(ads|tracker)\\d*\tdisable\n"
+    "com.broken\texplode\n"
+    "re:com\\.(?P<name>x)\tdisable\n"
+)
+
+
+@pytest.fixture
+def rules(tmp_path):
+    bundled = tmp_path / "rules.tsv"
+    bundled.write_text(BUNDLED)
+    user = tmp_path / "user.tsv"
+    user.write_text("com.vendor.g*\tkeep\ncom.vendor.*\tuninstall\n")
+    return RuleSet([str(bundled), str(user), str(tmp_path / "missing.tsv")])
+
+
+class TestRuleSet:
+    """Test cases for compiling and matching package rules"""
+
+    @pytest.mark.parametrize(
+        "package, pattern",
+        [
+            ("com.vendor.game.core", "com.vendor.game.core"),
+            ("com.vendor.game.racing", "com.vendor.game.*"),
+            ("com.vendor.gallery", "com.vendor.g*"),
+            ("com.vendor.camera", "com.vendor.*"),
+            ("com.vendor.tracker2", "com.vendor.*"),
+            ("org.other.ads.sdk", "*.ads.*"),
+            ("com.vendorx", None),
+            ("com.broken", None),
+        ],
+    )
+    def test_most_specific_rule_wins(self, rules, package, pattern):
+        rule = rules.match(package)
+        assert (rule.pattern if rule else None) == pattern
+
+    def test_later_rules_win_ties(self, rules):
+        assert rules.match("com.vendor.camera").action == "uninstall"
+
+    def test_regex_rules_rank_below_globs(self, tmp_path):
+        source = tmp_path / "rules.tsv"
+        source.write_text("re:com\\.a\\..*\tuninstall\ncom.*\tdisable\nre:com\\..*\tkeep\n")
+        rules = RuleSet([str(source)])
+
+        assert [rule.pattern for rule in rules.rules] == ["com.*", "re:com\\..*", "re:com\\.a\\..*"]
+        assert rules.match("com.a.b").action == "disable"
+
+    def test_rules_that_cannot_be_combined_are_skipped(self, tmp_path, caplog):
+        source = tmp_path / "rules.tsv"
+        source.write_text(
+            "re:(?i)com\\.evil\\..*\tuninstall\n"
+            "re:com\\.(a)\\1x\tuninstall\n"
+            "re:com\\.(?i:CASE)\\..*\tdisable\n"
+            "com.*\tkeep\n"
+        )
+        rules = RuleSet([str(source)])
+
+        assert [rule.pattern for rule in rules.rules] == ["com.*", "re:com\\.(?i:CASE)\\..*"]
+        assert rules.match("com.foo.bar").action == "keep"
+        assert "Skipping line 1" in caplog.text and "Skipping line 2" in caplog.text
+
+    def test_matcher_falls_back_to_one_rule_at_a_time(self, rules):
+        # Rules that slipped through still only break themselves
+        names = ["com.vendor.tracker", "com.vendor.camera", "com.vendor.game.racing"]
+        expected = [rules.match(name) for name in names]
+        rules._patterns.append(Rule("re:(?i)com\\.vendor\\.x", "uninstall"))
+        rules._trie["com.vendor."].append(len(rules._patterns) - 1)
+        rules._matchers.clear()
+
+        assert [rules.match(name) for name in names] == expected
+        assert len(rules._matcher("com.vendor.")) == len(rules._trie["com.vendor."]) - 1
+
+    def test_classify_and_suggestions(self, rules):
+        names = ["com.vendor.game.core", "com.vendor.camera", "org.example"]
+
+        assert rules.classify(names) == {
+            "com.vendor.game.core": Rule("com.vendor.game.core", "keep", "Needed by the launcher"),
+            "com.vendor.camera": Rule("com.vendor.*", "uninstall"),
+        }
+        assert rules.suggestions(names) == {"com.vendor.camera": "uninstall"}
+
+    def test_version_follows_the_rules(self, rules, tmp_path):
+        other = RuleSet([str(tmp_path / "rules.tsv")])
+        assert rules.version == RuleSet(rules.sources).version
+        assert rules.version != other.version
+
+    @pytest.mark.parametrize(
+        "regex, prefix",
+        [
+            (r"com\.(att|sprint)\..*", "com."),
+            (r"com\.a|org\.b", ""),
+            (r"com\.foo\.ba?r", "com.foo.b"),
+            (r"com\.x[|]y", "com.x"),
+        ],
+    )
+    def test_regex_prefix(self, regex, prefix):
+        assert _regex_prefix(regex) == prefix
+
+    def test_bundled_rules_are_valid(self):
+        with open(rule_set.sources[0]) as source:
+            lines = [line for line in source if not line.startswith(("#", "pattern\t"))]
+
+        assert len(rule_set.rules) == len(lines)
+        assert rule_set.match("com.facebook.katana").action == "disable"
+        assert rule_set.match("com.google.android.gms").action == "keep"
+
+
+class TestRuleRoutes:
+    """Test cases for the suggested actions on the packages page and in the API"""
+
+    PACKAGES = [PackageInfo("com.facebook.katana", 10001), PackageInfo("com.whatsapp", 10002)]
+
+    def test_packages_page_preselects_suggestions(self, client: TestClient):
+        with patch.object(
+            PackageManager,
+            'get_installed_packages',
+            new_callable=AsyncMock,
+            return_value=(ErrorCodes.SUCCESS, self.PACKAGES),
+        ):
+            response = client.get("/packages")
+
+        assert response.text.count('value="disable" selected') == 1
+        assert "Rule <code>com.facebook.*</code>" in response.text
+        assert "Rule <code>com.whatsapp</code>: keep" in response.text
+
+    def test_api_packages_carry_rules(self, client: TestClient):
+        with patch.object(
+            PackageManager,
+            'get_installed_packages',
+            new_callable=AsyncMock,
+            return_value=(ErrorCodes.SUCCESS, self.PACKAGES),
+        ):
+            packages = client.get("/api/v1/devices/serial1/packages").json()["packages"]
+
+        assert packages[0]["rule"]["action"] == "disable"
+        assert packages[1]["rule"]["action"] == "keep"
@@ -0,0 +1,122 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.shell_session import ShellSession, ShellSessionManager
+
+
+@pytest.fixture
+def session():
+    # A local shell stands in for ``adb shell`` on the device
+    return ShellSession("test_device", args=["sh"])
+
+
+class TestShellSession:
+    """Test cases for ShellSession class"""
+
+    @pytest.mark.asyncio
+    async def test_execute_demultiplexes_commands(self, session):
+        """Test that consecutive commands get their own output and exit code"""
+        first = await session.execute("echo Success")
+        second = await session.execute("echo 'Failure [not installed]'; false")
+        third = await session.execute("printf no-newline")
+        await session.close()
+
+        assert (first.stdout, first.returncode) == ("Success\n", 0)
+        assert (second.stdout, second.returncode) == ("Failure [not installed]\n", 1)
+        assert (third.stdout, third.returncode) == ("no-newline", 0)
+
+    @pytest.mark.asyncio
+    async def test_execute_reuses_process(self, session):
+        """Test that many commands share one shell process"""
+        with patch(
+            'asyncio.create_subprocess_exec', wraps=asyncio.create_subprocess_exec
+        ) as mock_exec:
+            for _ in range(5):
+                await session.execute("true")
+        await session.close()
+
+        mock_exec.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_execute_captures_stderr(self, session):
+        """Test that stderr of a command is folded into its output"""
+        result = await session.execute("echo oops >&2")
+        await session.close()
+
+        assert result.stdout == "oops\n"
+
+    @pytest.mark.asyncio
+    async def test_execute_restarts_dead_session(self, session):
+        """Test that the session is restarted after the shell exits"""
+        await session.execute("true")
+        first_process = session.process
+        first_process.kill()
+        await first_process.wait()
+
+        result = await session.execute("echo again")
+        await session.close()
+
+        assert result.stdout == "again\n"
+        assert session.process is None
+        assert first_process.returncode is not None
+
+    @pytest.mark.asyncio
+    async def test_execute_retries_when_shell_exits_mid_command(self, session):
+        """Test that a command which kills the shell fails after one retry"""
+        result = await session.execute("exit 3")
+
+        assert result.returncode is None
+        assert not session.is_alive
+
+    @pytest.mark.asyncio
+    async def test_execute_timeout_tears_down_session(self, session):
+        """Test that a timed out command kills the session"""
+        result = await session.execute("while :; do :; done", timeout=0.2)
+
+        assert result.timed_out
+        assert not session.is_alive
+
+    @pytest.mark.asyncio
+    @patch.object(ShellSession, 'stream_limit', 1024)
+    async def test_execute_line_over_limit_fails(self, session):
+        """Test that a line longer than the stream limit fails the command and the session"""
+        result = await session.execute("head -c 4096 /dev/zero | tr '\\0' x; echo")
+
+        assert result.returncode is None
+        assert not result.ok
+        assert not session.is_alive
+        assert (await session.execute("echo again")).stdout == "again\n"
+        await session.close()
+
+    @pytest.mark.asyncio
+    async def test_execute_missing_executable(self):
+        """Test that a missing adb binary results in a failed result"""
+        session = ShellSession("test_device", args=["definitely-not-adb"])
+
+        result = await session.execute("true")
+
+        assert result.returncode is None
+        assert not result.ok
+
+
+class TestShellSessionManager:
+    """Test cases for ShellSessionManager class"""
+
+    def test_get_returns_one_session_per_serial(self):
+        manager = ShellSessionManager()
+
+        assert manager.get("a") is manager.get("a")
+        assert manager.get("a") is not manager.get("b")
+        assert manager.get("a") is not manager.get("a", slot=1)
+
+    @pytest.mark.asyncio
+    async def test_close_all(self):
+        manager = ShellSessionManager()
+        session = manager.get("a")
+        with patch.object(session, 'close', new_callable=AsyncMock) as mock_close:
+            await manager.close_all()
+
+        mock_close.assert_called_once()
+        assert manager.sessions == {}
@@ -0,0 +1,196 @@
+import time
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+
+from src.adb_client import Adb, AdbClient
+from src.exceptions import ErrorCodes
+from src.fake_adb_server import FakeAdbServer, FakeDevice
+from src.models import PackageInfo
+from src.package_cache import package_cache
+from src.pkg_manager import PackageManager
+from src.snapshots import Snapshot, SnapshotStore, diff_packages, snapshot_store
+
+
+def packages(*infos):
+    return {info.name: info for info in infos}
+
+
+@pytest_asyncio.fixture
+async def fake_device():
+    device = FakeDevice("emulator-5554", packages=["com.example.app1", "com.example.app2"])
+    async with FakeAdbServer([device]) as server:
+        with patch.object(Adb, 'backend', "native"):
+            with patch.object(Adb, 'client', AdbClient(port=server.port)):
+                yield device
+
+
+class TestPackageInfo:
+    """Test cases for parsing pm list output"""
+
+    def test_from_pm_line_with_details(self):
+        info = PackageInfo.from_pm_line("package:com.example versionCode:42 uid:10123")
+
+        assert info == PackageInfo("com.example", uid=10123, version_code=42)
+
+    def test_from_pm_line_with_path_and_installer(self):
+        info = PackageInfo.from_pm_line(
+            "package:/data/app/~~x0==/com.example-y1==/base.apk=com.example"
+            "  installer=com.android.vending uid:10123"
+        )
+
+        assert info.name == "com.example"
+        assert info.path == "/data/app/~~x0==/com.example-y1==/base.apk"
+        assert info.installer == "com.android.vending"
+        assert PackageInfo.from_pm_line("package:com.example  installer=null").installer is None
+
+    def test_from_pm_line_plain(self):
+        assert PackageInfo.from_pm_line("package:com.example\n") == PackageInfo("com.example")
+
+    def test_from_pm_line_shared_uid(self):
+        assert PackageInfo.from_pm_line("package:com.example uid:1000,10123").uid == 1000
+
+    def test_from_pm_line_ignores_other_lines(self):
+        assert PackageInfo.from_pm_line("") is None
+        assert PackageInfo.from_pm_line("Error: unknown option") is None
+
+
+class TestDiffPackages:
+    """Test cases for diff_packages"""
+
+    def test_diff_reports_every_kind_of_change(self):
+        old = packages(
+            PackageInfo("com.kept", 10001, 1),
+            PackageInfo("com.removed", 10002, 1),
+            PackageInfo("com.updated", 10003, 1),
+            PackageInfo("com.disabled", 10004, 1),
+            PackageInfo("com.enabled", 10005, 1, enabled=False),
+        )
+        new = packages(
+            PackageInfo("com.kept", 10001, 1),
+            PackageInfo("com.updated", 10003, 2),
+            PackageInfo("com.disabled", 10004, 1, enabled=False),
+            PackageInfo("com.enabled", 10005, 1),
+            PackageInfo("com.added", 10006, 1),
+        )
+
+        delta = diff_packages(old, new)
+
+        assert [p.name for p in delta.added] == ["com.added"]
+        assert [p.name for p in delta.removed] == ["com.removed"]
+        assert [p.name for p in delta.updated] == ["com.updated"]
+        assert [p.name for p in delta.disabled] == ["com.disabled"]
+        assert [p.name for p in delta.enabled] == ["com.enabled"]
+
+    def test_diff_of_identical_maps_is_empty(self):
+        same = packages(PackageInfo("com.kept", 10001, 1))
+
+        assert not diff_packages(same, dict(same))
+
+
+class TestSnapshotStore:
+    """Test cases for SnapshotStore class"""
+
+    def test_history_is_bounded(self):
+        store = SnapshotStore(max_history=2)
+        first = store.add("serial1", {})
+        second = store.add("serial1", {})
+        third = store.add("serial1", {})
+
+        assert store.get("serial1", first.id) is None
+        assert store.get("serial1", second.id) is second
+        assert store.latest("serial1") is third
+
+    def test_snapshots_are_per_device(self):
+        store = SnapshotStore()
+        snapshot = store.add("serial1", {})
+
+        assert store.get("serial2", snapshot.id) is None
+        assert store.latest("serial2") is None
+
+
+class TestPackageManagerSnapshots:
+    """Test cases for snapshots taken through PackageManager"""
+
+    @pytest.mark.asyncio
+    async def test_take_snapshot(self, fake_device):
+        fake_device.packages["com.example.app2"]["enabled"] = False
+
+        error_code, snapshot = await PackageManager.take_snapshot("emulator-5554")
+
+        assert error_code == ErrorCodes.SUCCESS
+        assert snapshot.packages == packages(
+            PackageInfo(
+                "com.example.app1",
+                uid=10000,
+                version_code=1,
+                path="/data/app/~~com.example.app1==/com.example.app1-1==/base.apk",
+                installer="com.android.vending",
+            ),
+            PackageInfo(
+                "com.example.app2",
+                uid=10001,
+                version_code=1,
+                enabled=False,
+                path="/data/app/~~com.example.app2==/com.example.app2-1==/base.apk",
+                installer="com.android.vending",
+            ),
+        )
+
+    @pytest.mark.asyncio
+    async def test_changes_since(self, fake_device):
+        _, first = await PackageManager.take_snapshot("emulator-5554")
+        fake_device.packages["com.example.app1"]["version_code"] = 2
+        fake_device.packages["com.example.app2"]["installed"] = False
+
+        error_code, snapshot, delta = await PackageManager.changes_since("emulator-5554", first.id)
+
+        assert error_code == ErrorCodes.SUCCESS
+        assert snapshot.id > first.id
+        assert [p.name for p in delta.updated] == ["com.example.app1"]
+        assert [p.name for p in delta.removed] == ["com.example.app2"]
+
+    @pytest.mark.asyncio
+    async def test_changes_since_unknown_snapshot(self, fake_device):
+        error_code, snapshot, delta = await PackageManager.changes_since("emulator-5554", 999)
+
+        assert error_code == ErrorCodes.UNKNOWN_SNAPSHOT
+        assert len(snapshot.packages) == 2
+        assert delta is None
+
+    @pytest.mark.asyncio
+    async def test_snapshots_are_stored_and_restored(self, fake_device, job_db):
+        with patch('src.pkg_manager.db_manager', job_db):
+            _, first = await PackageManager.take_snapshot("emulator-5554")
+            snapshot_store.clear()
+            package_cache.clear()
+            fake_device.packages["com.example.app1"]["enabled"] = False
+
+            # A snapshot from before a restart still serves as the base of a delta
+            error_code, _, delta = await PackageManager.changes_since("emulator-5554", first.id)
+            snapshot_store.clear()
+            package_cache.clear()
+            restored = await PackageManager.restore_snapshots()
+
+        assert error_code == ErrorCodes.SUCCESS
+        assert [p.name for p in delta.disabled] == ["com.example.app1"]
+        assert restored == 1
+        assert not package_cache.get("emulator-5554")[0].enabled
+        assert snapshot_store.latest("emulator-5554").id == first.id + 1
+
+    @pytest.mark.asyncio
+    async def test_old_snapshots_are_not_served_from_the_cache(self, fake_device):
+        stored = [
+            Snapshot(1, "emulator-5554", time.time() - package_cache.ttl - 1, packages()),
+            Snapshot(2, "emulator-5555", time.time(), packages(PackageInfo("com.fresh"))),
+        ]
+        with patch('src.pkg_manager.db_manager.get_latest_snapshots', return_value=stored):
+            restored = await PackageManager.restore_snapshots()
+        _, inventory = await PackageManager.get_installed_packages(serial_number="emulator-5554")
+
+        assert restored == 2
+        assert snapshot_store.latest("emulator-5554").id == 1
+        assert package_cache.get("emulator-5555") == [PackageInfo("com.fresh")]
+        # Read from the device, the snapshot was older than the cache ttl
+        assert [p.name for p in inventory] == ["com.example.app1", "com.example.app2"]
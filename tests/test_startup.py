@@ -0,0 +1,79 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src import app as app_module
+from src import main
+from src.startup import StartupTimer, startup_timer
+
+
+@pytest.fixture(autouse=True)
+def empty_startup_timer():
+    phases = list(startup_timer.phases)
+    startup_timer.phases.clear()
+    yield
+    startup_timer.phases[:] = phases
+
+
+class TestStartup:
+    """Test cases for the startup path and its timing report"""
+
+    def test_report_orders_phases(self):
+        timer = StartupTimer()
+        timer.add("import application", timer.origin + 0.010, timer.origin + 0.400)
+        timer.add("check adb (concurrent)", timer.origin + 0.005, timer.origin + 0.050)
+        timer.add("listening", timer.origin + 0.500, timer.origin + 0.500)
+
+        lines = timer.report().splitlines()
+
+        assert lines[0].split()[:4] == ["phase", "start", "end", "took"]
+        assert lines[1].split()[-3:] == ["5.0", "50.0", "45.0"]
+        assert lines[2].startswith("import application")
+        assert lines[3].startswith("listening")
+
+    def test_check_adb_runs_while_the_app_is_imported(self):
+        threads = []
+
+        def check_adb():
+            threads.append(threading.current_thread())
+            return True
+
+        with patch('sys.argv', ["bloatware-remover", "--startup-profile"]):
+            with (
+                patch.object(main, 'check_adb', side_effect=check_adb),
+                patch.object(main, 'start_server') as start_server,
+            ):
+                main.main()
+
+        assert threads[0] is not threading.main_thread()
+        start_server.assert_called_once_with(app_module.app, True)
+        assert {name for name, _, _ in startup_timer.phases} == {
+            "import application",
+            "check adb (concurrent)",
+        }
+
+    def test_exits_without_adb(self):
+        with patch('sys.argv', ["bloatware-remover"]):
+            with (
+                patch.object(main, 'check_adb', return_value=False),
+                patch.object(main, 'start_server') as start_server,
+            ):
+                with pytest.raises(SystemExit):
+                    main.main()
+
+        start_server.assert_not_called()
+
+    def test_report_after_first_response(self, capsys):
+        server = MagicMock(started=True, should_exit=False)
+
+        with patch('urllib.request.urlopen') as urlopen:
+            main.report_startup(server, port=8123)
+
+        urlopen.assert_called_once_with("http://127.0.0.1:8123/", timeout=60)
+        report = capsys.readouterr().err
+        assert report.startswith("Startup profile")
+        assert "listening" in report and "first response (GET /)" in report
+
+    def test_app_is_still_reachable_from_main(self):
+        assert main.app is app_module.app
@@ -0,0 +1,99 @@
+import os
+import shutil
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from jinja2 import Environment, FileSystemLoader
+import pytest
+
+from src.exceptions import ErrorCodes
+from src.models import PackageInfo
+from src.pkg_manager import PackageManager
+from src.templating import (
+    TemplateBytecodeCache,
+    TracedTemplate,
+    _batches,
+    script_dir,
+    stream_template,
+    templates,
+)
+from src.tracing import Span
+
+
+def environment(directory, cache) -> Environment:
+    env = Environment(loader=FileSystemLoader(directory), bytecode_cache=cache)
+    env.template_class = TracedTemplate
+    return env
+
+
+class TestTemplating:
+    """Test cases for streamed pages and the compiled template cache"""
+
+    def test_batches(self):
+        assert list(_batches(["ab", "c", "de", "f"], 3)) == ["abc", "def"]
+        assert list(_batches(["abcd", "e"], 3)) == ["abcd", "e"]
+        assert list(_batches([], 3)) == []
+
+    @pytest.mark.asyncio
+    async def test_stream_matches_render(self):
+        template = templates.get_template("status.html")
+        context = {"request": None, "message": "x" * 40_000, "success": True}
+
+        with patch('src.templating.STREAM_CHUNK_SIZE', 1024):
+            response = stream_template("status.html", context, status_code=404)
+        chunks = [chunk async for chunk in response.body_iterator]
+
+        assert response.status_code == 404
+        assert response.media_type == "text/html; charset=utf-8"
+        assert len(chunks) > 1
+        assert "".join(chunks) == template.render(context)
+
+    def test_packages_page_is_streamed(self, client: TestClient):
+        packages = [PackageInfo(f"com.example.app{i:03}", 10000 + i) for i in range(300)]
+        with patch.object(
+            PackageManager, 'get_installed_packages', return_value=(ErrorCodes.SUCCESS, packages)
+        ):
+            response = client.get("/packages?per_page=300")
+
+        assert response.status_code == 200
+        assert "content-length" not in response.headers
+        assert response.text.count('name="action_com.example.app') == 300
+        assert response.text.rstrip().endswith("</html>")
+
+    def test_streamed_render_is_traced(self):
+        template = templates.get_template("status.html")
+
+        with Span("GET /packages", "request") as root:
+            "".join(template.generate({"request": None, "message": "", "success": True}))
+
+        assert [(child.name, child.kind) for child in root.children] == [
+            ("status.html", "template")
+        ]
+        assert root.children[0].attributes == {"streamed": True}
+
+    def test_compiled_templates_survive_a_new_directory(self, tmp_path):
+        cache = TemplateBytecodeCache(str(tmp_path / "cache"))
+        first, second = tmp_path / "first", tmp_path / "second"
+        for directory in (first, second):
+            shutil.copytree(os.path.join(script_dir, "templates"), directory)
+
+        html = environment(str(first), cache).get_template("status.html").render(success=True)
+        compiled = os.listdir(cache.directory)
+        warm = environment(str(second), cache)
+        with patch.object(warm, 'compile', side_effect=AssertionError("compiled again")):
+            assert warm.get_template("status.html").render(success=True) == html
+
+        assert "__jinja2_" in compiled[0]
+        (second / "status.html").write_text("changed")
+        assert environment(str(second), cache).get_template("status.html").render() == "changed"
+
+    def test_unwritable_cache_is_skipped(self, tmp_path, caplog):
+        (tmp_path / "file").write_text("")
+        cache = TemplateBytecodeCache(str(tmp_path / "file" / "cache"))
+
+        template = environment(os.path.join(script_dir, "templates"), cache).get_template(
+            "status.html"
+        )
+
+        assert "Success" in template.render(success=True, message="Success")
+        assert "Failed to cache the template" in caplog.text
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+import pytest
+
+from src.app import app
+from src.db import DbManger
+from src.metrics import CommandTimer
+from src.tracing import Span, TraceStore, TracingMiddleware, server_timing, span, trace_store
+
+
+@pytest.fixture(autouse=True)
+def empty_trace_store():
+    trace_store.clear()
+    yield
+    trace_store.clear()
+
+
+class TestTracing:
+    """Test cases for request traces"""
+
+    def test_spans_are_free_without_a_trace(self):
+        with span("query", "db") as inactive:
+            with CommandTimer("pm list", "session", "s1"):
+                pass
+
+        assert inactive is None
+
+    @pytest.mark.asyncio
+    async def test_spans_follow_the_tasks_of_a_request(self):
+        async def device(serial):
+            with span(f"device {serial}", "fleet"):
+                with CommandTimer("pm uninstall", "session", serial) as timer:
+                    timer.outcome = "failure"
+
+        with Span("POST /apply-actions", "request") as root:
+            with span("get_selected_device", "db"):
+                with span("nested", "db"):
+                    time.sleep(0.01)
+            await asyncio.gather(device("s1"), device("s2"))
+
+        tree = root.to_dict()
+        assert [child["name"] for child in tree["children"]] == [
+            "get_selected_device",
+            "device s1",
+            "device s2",
+        ]
+        adb = tree["children"][1]["children"][0]
+        assert adb["kind"] == "adb"
+        assert adb["attributes"] == {"transport": "session", "serial": "s1", "outcome": "failure"}
+        durations = root.durations()
+        assert durations["db"] >= 0.01 and durations["db"] < root.duration
+        assert server_timing(root).startswith("total;dur=")
+        assert "adb;dur=" in server_timing(root)
+
+    @pytest.mark.asyncio
+    async def test_db_methods_are_traced(self):
+        manager = DbManger()
+        manager.connection_path = ":memory:"
+        await manager.connect()
+        try:
+            await manager.create_tables()
+            with Span("GET /", "request") as root:
+                await manager.set_selected_device("s1")
+                assert await manager.get_selected_device() == "s1"
+        finally:
+            await manager.close()
+
+        assert [(child.name, child.kind) for child in root.children] == [
+            ("set_selected_device", "db"),
+            ("get_selected_device", "db"),
+        ]
+        assert DbManger.get_selected_device.__name__ == "get_selected_device"
+
+    def test_traced_request(self, client: TestClient):
+        response = client.get("/journal", headers={"X-Trace": "1"})
+
+        assert response.status_code == 200
+        assert "template" in response.headers["server-timing"]
+        trace = client.get(f"/debug/traces/{response.headers['x-trace-id']}").json()
+        assert (trace["method"], trace["route"], trace["status"]) == ("GET", "/journal", 200)
+        assert trace["spans"]["children"][0]["name"] == "journal.html"
+        assert client.get("/debug/traces").json()["traces"][0]["id"] == trace["id"]
+
+    def test_untraced_request(self, client: TestClient):
+        response = client.get("/journal")
+
+        assert "server-timing" not in response.headers
+        assert client.get("/debug/traces").json() == {"traces": []}
+        assert client.get("/debug/traces/1").status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_trace_store_keeps_the_last_traces(self):
+        store = TraceStore(size=2)
+        middleware = TracingMiddleware(app, store=store, trace_all=True)
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        for path in ("/a", "/b", "/c"):
+            scope = {
+                "type": "http",
+                "method": "GET",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": b"",
+                "headers": [],
+                "scheme": "http",
+                "server": ("test", 80),
+                "app": app,
+            }
+            await middleware(scope, receive, send)
+
+        assert [trace["path"] for trace in store.list()] == ["/c", "/b"]
+        assert store.get(3)["status"] == 404
+        assert (b"x-trace-id", b"3") in sent[-2]["headers"]
@@ -0,0 +1,46 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from src.exceptions import ClientDisconnected
+from src.utils import cancel_on_disconnect
+
+
+def make_request(disconnected):
+    request = MagicMock()
+    request.is_disconnected = AsyncMock(return_value=disconnected)
+    return request
+
+
+class TestCancelOnDisconnect:
+    """Test cases for cancel_on_disconnect helper"""
+
+    @pytest.mark.asyncio
+    async def test_returns_result_when_client_stays(self):
+        """Test that the awaitable result is passed through"""
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        result = await cancel_on_disconnect(make_request(False), work(), poll_interval=0.01)
+
+        assert result == "done"
+
+    @pytest.mark.asyncio
+    async def test_cancels_work_when_client_leaves(self):
+        """Test that the awaitable is cancelled once the client disconnects"""
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(ClientDisconnected):
+            await cancel_on_disconnect(make_request(True), work(), poll_interval=0.01)
+
+        assert cancelled.is_set()